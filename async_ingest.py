@@ -0,0 +1,194 @@
+import asyncio
+import itertools
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Iterable, Optional, Union
+
+from http_client import CircuitOpenError, FetchError, ResilientClient
+from ingest_writer import BufferedWriter
+
+
+class RateLimiter:
+    """Token bucket shared by all fetch workers (``rate`` tokens/second)."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HttpSource:
+    def __init__(
+        self, name: str, url: str, field: str = "joke", timeout: float = 10.0
+    ) -> None:
+        self.name = name
+        self.url = url
+        self.field = field
+        self.timeout = timeout
+
+    def parse(self, payload: Any) -> str:
+        if not isinstance(payload, dict):
+            raise FetchError(f"{self.name} sent {type(payload).__name__}, expected an object", self.name)
+        return str(payload.get(self.field, "")).strip()
+
+
+class AsyncFetcher:
+    """Runs blocking ``requests`` calls on a dedicated thread pool.
+
+    A single keep-alive ``ResilientClient`` is shared by all workers, with
+    its connection pool sized to the concurrency so sockets are reused
+    instead of reconnecting per request. Each source gets its own circuit
+    breaker; retries are off by default because the workers fetch again
+    anyway.
+    """
+
+    def __init__(
+        self, concurrency: int = 10, verify: Union[bool, str] = True, retries: int = 0
+    ) -> None:
+        self.concurrency = concurrency
+        self.client = ResilientClient(
+            "fetch", verify=verify, retries=retries, pool_size=concurrency
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="fetch"
+        )
+        self.stats = {"fetched": 0, "errors": 0, "rejected": 0}
+
+    async def fetch(self, source: HttpSource) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        try:
+            text = await loop.run_in_executor(self._executor, self._get, source)
+        except CircuitOpenError:
+            self.stats["rejected"] += 1
+            return None
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error fetching from {source.name}: {e}")
+            return None
+        self.stats["fetched"] += 1
+        return text
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    def _get(self, source: HttpSource) -> str:
+        data = self.client.get_json(source.url, timeout=source.timeout, source=source.name)
+        return source.parse(data)
+
+
+async def _fetch_worker(
+    sources: "itertools.cycle[HttpSource]",
+    fetcher: AsyncFetcher,
+    limiter: RateLimiter,
+    queue: "asyncio.Queue[tuple[str, date]]",
+    stop: asyncio.Event,
+) -> None:
+    while not stop.is_set():
+        await limiter.acquire()
+        if stop.is_set():
+            return
+        text = await fetcher.fetch(next(sources))
+        if text:
+            # Blocks when the queue is full, so a slow database throttles
+            # fetching instead of growing memory.
+            await queue.put((text, date.today()))
+
+
+def _take_batch(
+    queue: "asyncio.Queue[tuple[str, date]]", first: tuple[str, date], limit: int
+) -> list[tuple[str, date]]:
+    """``first`` plus whatever is already queued, up to ``limit`` items."""
+    batch = [first]
+    while not queue.empty() and len(batch) < limit:
+        batch.append(queue.get_nowait())
+    return batch
+
+
+async def _write_worker(
+    writer: BufferedWriter,
+    queue: "asyncio.Queue[tuple[str, date]]",
+    stop: asyncio.Event,
+    max_items: Optional[int],
+) -> None:
+    loop = asyncio.get_running_loop()
+    poll = min(writer.flush_interval, 1.0)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer") as executor:
+        written = 0
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=poll)
+            except asyncio.TimeoutError:
+                if stop.is_set():
+                    return
+                if writer.is_due():
+                    await loop.run_in_executor(executor, writer.flush)
+                continue
+            batch = _take_batch(queue, item, writer.batch_size)
+            for name, date_value in batch:
+                await loop.run_in_executor(executor, writer.add, name, date_value)
+            # At a steady rate the get above never times out, so the flush
+            # interval is checked here as well.
+            if writer.is_due():
+                await loop.run_in_executor(executor, writer.flush)
+            written += len(batch)
+            if max_items is not None and written >= max_items:
+                stop.set()
+            if stop.is_set() and queue.empty():
+                return
+
+
+async def run_async_ingest(
+    sources: Iterable[HttpSource],
+    writer: BufferedWriter,
+    concurrency: int = 10,
+    rate: float = 10.0,
+    queue_size: int = 1000,
+    verify: Union[bool, str] = True,
+    max_items: Optional[int] = None,
+    stop: Optional[asyncio.Event] = None,
+) -> None:
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except (NotImplementedError, RuntimeError, ValueError):
+        pass  # not the main thread, or no signal support on this platform
+    queue: asyncio.Queue[tuple[str, date]] = asyncio.Queue(maxsize=queue_size)
+    fetcher = AsyncFetcher(concurrency=concurrency, verify=verify)
+    limiter = RateLimiter(rate)
+    source_cycle = itertools.cycle(list(sources))
+    fetchers = [
+        asyncio.create_task(_fetch_worker(source_cycle, fetcher, limiter, queue, stop))
+        for _ in range(concurrency)
+    ]
+    try:
+        await _write_worker(writer, queue, stop, max_items)
+    finally:
+        stop.set()
+        for task in fetchers:
+            task.cancel()
+        await asyncio.gather(*fetchers, return_exceptions=True)
+        await loop.run_in_executor(None, fetcher.close)
+        while not queue.empty():
+            writer.add(*queue.get_nowait())
+        writer.close()
@@ -1,65 +1,261 @@
-import psycopg2
+import asyncio
+import functools
 from datetime import date
-import requests
+import signal
+import sys
+import threading
 import time
-from create_envs import import_envs_and_create_db_config
+from typing import Optional
+from async_ingest import HttpSource, run_async_ingest
+from coordination import ShardCoordinator, ShardedSource
+from create_envs import Settings, get_settings
+from db_pool import get_pool
+from dedupe import Deduplicator, is_valid_record
+from http_client import FetchError, ResilientClient
+from ingest_writer import BufferedWriter
+from metrics import ROWS_INSERTED, start_http_server
+from migrations import upgrade
+from partitions import PartitionMaintainer
+from pipeline import Pipeline, build_source
+from profiling import get_profiler, install_profiler
+from repository import INSERT_ROW, get_repository
+from spool import DiskSpool, SpoolReplayer
 
-# Database connection parameters
-DB_CONFIG = import_envs_and_create_db_config()
+JOKE_API_URL = "https://geek-jokes.sameerkumar.website/api?format=json"
 
-def ensure_table_exists():
+def ensure_table_exists() -> None:
+    """Apply pending migrations and partition upkeep (see migrations.py).
+
+    Deployments with an init container running ``migrations.py`` set
+    MIGRATE_ON_START=0 so the backend does not repeat the work.
+    """
+    pool = get_pool()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = pool.getconn()
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return
+    settings = get_settings()
     try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS data (
-                        id SERIAL PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        date DATE NOT NULL
-                    )
-                """)
+        upgrade(conn, settings.partition, lock_timeout=settings.migration.lock_timeout)
     except Exception as e:
-        print(f"Error creating table: {e}")
+        print(f"Error migrating schema: {e}")
     finally:
-        conn.close()
-ensure_table_exists()
+        pool.putconn(conn)
 
-def create_row(name: str, date_value: date):
+def create_row(name: str, date_value: date) -> None:
+    if not is_valid_record(name):
+        print("Skipping invalid row:", name)
+        return
+    pool = get_pool()
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = pool.getconn()
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return
     try:
         with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO data (name, date) VALUES (%s, %s)",
-                    (name, date_value)
-                )
+            if get_repository().execute(conn, INSERT_ROW, (name, date_value)):
+                ROWS_INSERTED.inc(method="single")
                 print("Row created:", name, date_value)
+            else:
+                print("Duplicate row skipped:", name)
     except Exception as e:
         print(f"Error creating row: {e}")
     finally:
-        conn.close()
+        pool.putconn(conn)
 
-def fetch_joke():
-    try:
-        resp = requests.get("https://geek-jokes.sameerkumar.website/api?format=json", timeout=10, verify=False)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("joke", "")
-    except Exception as e:
-        return f"Error fetching joke: {e}"
+@functools.lru_cache(maxsize=None)
+def get_joke_client() -> ResilientClient:
+    return ResilientClient("joke_api", **get_settings().http_client._asdict())
 
-if __name__ == "__main__":
-    while True:
+def fetch_joke() -> str:
+    """Return one joke ("" if the API sent none); raises FetchError on failure."""
+    data = get_joke_client().get_json(JOKE_API_URL)
+    if not isinstance(data, dict):
+        raise FetchError(f"joke_api sent {type(data).__name__}, expected an object", "joke_api")
+    return str(data.get("joke") or "").strip()
+
+def ingest_once(writer: BufferedWriter) -> None:
+    try:
         joke = fetch_joke()
+    except FetchError as e:
+        print(f"Error fetching joke: {e}")
+    else:
         if joke:
-            create_row(joke, date.today())
-        time.sleep(30)
\ No newline at end of file
+            writer.add(joke, date.today())
+
+def run_ingest_loop(writer: BufferedWriter, fetch_interval: float) -> None:
+    profiler = get_profiler()
+    while True:
+        ingest_once(writer)
+        profiler.tick()
+        time.sleep(fetch_interval)
+
+def run_sharded_ingest_loop(
+    writer: BufferedWriter,
+    fetch_interval: float,
+    coordinator: ShardCoordinator,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Fetch once per ``fetch_interval`` for each shard this worker leases.
+
+    Fetches run one at a time, so a single replica is bound by API latency
+    and the total rate grows with the number of replicas sharing the shards.
+    """
+    next_due: dict[int, float] = {}
+    profiler = get_profiler()
+    while stop is None or not stop.is_set():
+        profiler.tick()
+        now = time.monotonic()
+        owned = coordinator.owned()
+        due = [shard for shard in owned if next_due.get(shard, 0.0) <= now]
+        for shard in due:
+            if coordinator.owns(shard):
+                next_due[shard] = time.monotonic() + fetch_interval
+                ingest_once(writer)
+        if not due:
+            # Wake at least once a second to start on newly claimed shards.
+            wake = min((next_due[shard] for shard in owned), default=now + 1.0)
+            time.sleep(min(max(wake - now, 0.0), 1.0))
+
+def build_pipeline(
+    writer: BufferedWriter,
+    async_config: dict,
+    pipeline_config: dict,
+    coordinator: Optional[ShardCoordinator] = None,
+) -> Pipeline:
+    source_options = {
+        "timeout": async_config["source_timeout"],
+        "concurrency": async_config["concurrency"],
+        "rate": async_config["rate"],
+        "verify": async_config["verify"],
+    }
+    specs = pipeline_config["sources"] or [f"http:{JOKE_API_URL}"]
+    sources = []
+    for index, spec in enumerate(specs):
+        if coordinator is None:
+            sources.append(build_source(spec, **source_options))
+        elif spec.startswith("http:"):
+            # Polling scales out: each shard polls at INGEST_RATE on its own.
+            sources.extend(
+                ShardedSource(build_source(spec, **source_options), shard, coordinator)
+                for shard in range(coordinator.shards)
+            )
+        else:
+            # A file is read once, by whichever worker holds its shard.
+            sources.append(ShardedSource(
+                build_source(spec, **source_options), index % coordinator.shards, coordinator
+            ))
+    return Pipeline(
+        sources,
+        writer.write,
+        batch_size=writer.batch_size,
+        flush_interval=writer.flush_interval,
+        queue_size=async_config["queue_size"],
+        deduplicator=writer.deduplicator,
+    )
+
+def build_coordinator(settings: Settings) -> Optional[ShardCoordinator]:
+    """Start leasing shards (one by default); None when INGEST_SHARDS=0 runs unsharded."""
+    if not settings.coordination.shards:
+        return None
+    coordinator = ShardCoordinator(
+        get_pool(),
+        settings.coordination.shards,
+        lease_ttl=settings.coordination.lease_ttl,
+        worker_id=settings.coordination.worker_id,
+    )
+    coordinator.start()
+    return coordinator
+
+def build_writer(settings: Settings) -> BufferedWriter:
+    """Create the batching writer, spooling to disk when INGEST_SPOOL_DIR is set."""
+    spool = None
+    if settings.spool.path:
+        spool = DiskSpool(settings.spool.path, max_bytes=settings.spool.max_bytes)
+    writer = BufferedWriter(
+        get_pool(),
+        batch_size=settings.ingest.batch_size,
+        flush_interval=settings.ingest.flush_interval,
+        method=settings.ingest.method,
+        deduplicator=Deduplicator(settings.ingest.dedupe_size),
+        spool=spool,
+        retry_after=settings.spool.retry_interval,
+    )
+    if spool:
+        # Also drains whatever a previous run left on disk.
+        SpoolReplayer(
+            spool,
+            writer.replay,
+            batch_size=settings.spool.replay_batch,
+            interval=settings.spool.retry_interval,
+        ).start()
+    return writer
+
+def run_mode(
+    settings: Settings, writer: BufferedWriter, coordinator: Optional[ShardCoordinator]
+) -> None:
+    """Ingest in the INGEST_MODE mode until interrupted (or the pipeline ends)."""
+    async_config = settings.async_ingest
+    if async_config.mode == "pipeline":
+        pipeline = build_pipeline(
+            writer, async_config._asdict(), settings.pipeline._asdict(), coordinator
+        )
+        asyncio.run(pipeline.run(report_interval=settings.pipeline.report_interval))
+        print(f"pipeline finished: {pipeline.format_metrics()}")
+    elif async_config.mode == "async":
+        # Not sharded: every replica polls, and the dedupe trigger drops repeats.
+        source = HttpSource(
+            "geek-jokes", JOKE_API_URL, timeout=async_config.source_timeout
+        )
+        asyncio.run(run_async_ingest(
+            [source],
+            writer,
+            concurrency=async_config.concurrency,
+            rate=async_config.rate,
+            queue_size=async_config.queue_size,
+            verify=async_config.verify,
+        ))
+    else:
+        writer.start()
+        try:
+            if coordinator:
+                run_sharded_ingest_loop(writer, settings.ingest.fetch_interval, coordinator)
+            else:
+                run_ingest_loop(writer, settings.ingest.fetch_interval)
+        finally:
+            writer.close()
+
+if __name__ == "__main__":
+    # Turn SIGTERM (Kubernetes pod shutdown) into SystemExit so the buffered
+    # rows are flushed by the finally block in run_mode.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    install_profiler()
+    settings = get_settings()
+    if settings.metrics.port:
+        start_http_server(settings.metrics.port, settings.metrics.host)
+    try:
+        get_pool().warm()
+    except Exception as e:
+        print(f"Error warming connection pool: {e}")
+    if settings.migration.on_start:
+        ensure_table_exists()
+    coordinator = build_coordinator(settings)
+    PartitionMaintainer(
+        get_pool(),
+        months_ahead=settings.partition.months_ahead,
+        retention_days=settings.partition.retention_days,
+        retention_action=settings.partition.retention_action,
+        interval=settings.partition.maintenance_interval,
+        is_leader=coordinator.is_leader if coordinator else lambda: True,
+    ).start()
+    writer = build_writer(settings)
+    try:
+        run_mode(settings, writer, coordinator)
+    finally:
+        if coordinator:
+            # Hand the shards back so peers need not wait for the leases to expire.
+            coordinator.stop()
+            coordinator.join(timeout=5)
+    print(f"writer stats: {writer.stats()}")
@@ -0,0 +1,129 @@
+"""
+Streaming export: rows/sec and the frontend's peak RSS while exporting ``data``.
+
+Starts a throwaway Postgres, creates the real schema and seeds ``data`` to each
+size in ``--sizes``, then downloads ``/api/export`` in every format from a
+gunicorn frontend. A flat peak RSS across sizes is the point: the named cursor
+keeps at most ``EXPORT_ITERSIZE`` rows in the worker at a time.
+
+    python benchmarks/bench_export.py --sizes 1000000 10000000
+"""
+import argparse
+import http.client
+import os
+import threading
+
+from common import timer
+from postgres import free_port, throwaway_postgres
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/task/{child}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def rss_kb(pid: int, field: str = 'VmRSS') -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Polls the resident set size of a process tree and keeps the maximum."""
+
+    def __init__(self, pid: int, interval: float = 0.05) -> None:
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            for pid in process_tree(self.pid)[1:]:
+                self.peak_kb = max(self.peak_kb, rss_kb(pid))
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def download(port: int, fmt: str) -> tuple[int, int]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    conn.request('GET', f'/api/export?format={fmt}')
+    response = conn.getresponse()
+    if response.status != 200:
+        raise RuntimeError(f'export failed: {response.status} {response.read()!r}')
+    size = lines = 0
+    while True:
+        chunk = response.read(1 << 16)
+        if not chunk:
+            break
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    conn.close()
+    return size, lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--formats', nargs='+', default=['csv', 'ndjson'])
+    parser.add_argument('--postgres', choices=['local', 'docker', 'external'], default='local',
+                        help='where to run Postgres (external uses the DB_* variables)')
+    parser.add_argument('--pg-bin', help='directory containing initdb and pg_ctl')
+    parser.add_argument('--itersize', type=int, default=5000)
+    args = parser.parse_args()
+
+    with throwaway_postgres(args.postgres, args.pg_bin) as server:
+        os.environ.update(server.env)
+        os.environ['RECORDS_CACHE_LISTEN'] = '0'
+        import backend_app
+        from bench_server_load import start_server
+        from db_pool import get_pool
+        from suite import seed_to
+
+        backend_app.ensure_table_exists()
+        for size in sorted(args.sizes):
+            print(f'seeding {size:,} rows...')
+            with timer() as t:
+                seed_to(get_pool(), size)
+            print(f'  seeded in {t["elapsed"]:.1f}s')
+            port = free_port()
+            proc = start_server(
+                port, 'production', 1, 2, extra_env={'EXPORT_ITERSIZE': str(args.itersize)}
+            )
+            try:
+                idle_kb = max(rss_kb(pid) for pid in process_tree(proc.pid)[1:])
+                for fmt in args.formats:
+                    sampler = RssSampler(proc.pid)
+                    sampler.start()
+                    with timer() as t:
+                        size_bytes, lines = download(port, fmt)
+                    sampler.stop()
+                    rows = lines - (1 if fmt == 'csv' else 0)
+                    assert rows == size, f'exported {rows:,} of {size:,} rows'
+                    print(
+                        f'  {fmt:<7} {rows / t["elapsed"]:>12,.0f} rows/s '
+                        f'{size_bytes / t["elapsed"] / 1e6:>8,.1f} MB/s '
+                        f'peak RSS {sampler.peak_kb / 1024:,.1f} MiB '
+                        f'(idle {idle_kb / 1024:,.1f} MiB)'
+                    )
+            finally:
+                proc.terminate()
+                proc.wait(30)
+
+
+if __name__ == '__main__':
+    main()
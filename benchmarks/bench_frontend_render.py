@@ -0,0 +1,95 @@
+"""
+Requests/sec for the frontend index page, before and after render caching.
+
+Drives the Bottle WSGI app in-process against a fixed 20-row dataset, so the
+numbers isolate template and response handling from the database:
+
+    python benchmarks/bench_frontend_render.py --seconds 3
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Optional
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bottle import Bottle, SimpleTemplate  # noqa: E402
+
+import frontend_app  # noqa: E402
+
+RECORDS = [
+    (f"Synthetic joke number {i} with a bit of padding text", date(2024, 1, 1) + timedelta(days=i))
+    for i in range(20)
+]
+
+
+with open(os.path.join(frontend_app.TEMPLATES_DIR, 'index.tpl')) as f:
+    INDEX_SOURCE = f.read()
+
+baseline_app = Bottle()
+
+
+@baseline_app.route('/')
+def uncached_index() -> str:
+    # The original handler: parse and compile the template on every request.
+    page: str = SimpleTemplate(INDEX_SOURCE).render(
+        records=RECORDS, assets=frontend_app.get_static_assets(), feed_url=None
+    )
+    return page
+
+
+def call_wsgi(app: Callable[..., Any], headers: Optional[dict[str, str]] = None) -> tuple[str, bytes]:
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/',
+        'SERVER_NAME': 'bench',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    environ.update(headers or {})
+    status: list[str] = []
+    body = b''.join(app(environ, lambda s, h, exc_info=None: status.append(s)))
+    return status[0], body
+
+
+def measure(name: str, fn: Callable[[], object], seconds: float) -> None:
+    fn()  # warm up
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        count += 1
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {count / elapsed:>12,.0f} req/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    with patch.object(frontend_app, 'get_last_20_records', return_value=RECORDS):
+        frontend_app.RECORDS_CACHE.ttl = 3600
+        status, _ = call_wsgi(frontend_app.app)
+        assert status.startswith('200'), status
+        etag = next(iter(frontend_app.RENDERED_PAGES.values())).etag
+
+        measure("before: compile + render", lambda: call_wsgi(baseline_app), args.seconds)
+        measure("after: cached page", lambda: call_wsgi(frontend_app.app), args.seconds)
+        measure(
+            "after: 304 revalidation",
+            lambda: call_wsgi(frontend_app.app, {'HTTP_IF_NONE_MATCH': etag}),
+            args.seconds,
+        )
+
+
+if __name__ == '__main__':
+    main()
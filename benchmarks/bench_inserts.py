@@ -0,0 +1,115 @@
+"""
+Insert throughput: one commit per row vs batched VALUES vs COPY.
+
+Writes synthetic rows into a scratch ``bench_data`` table (dropped afterwards)
+on the Postgres configured through DB_* variables:
+
+    python benchmarks/bench_inserts.py --rows 20000 --batch-size 500
+"""
+import argparse
+from datetime import date, timedelta
+from typing import Any
+
+from common import connect, make_pool, timer
+
+from dedupe import dedupe_backfill_statements, dedupe_trigger_statements
+from ingest_writer import BufferedWriter
+from records_stats import (
+    daily_counts_backfill_statements,
+    daily_counts_slot_statements,
+    daily_counts_trigger_statements,
+)
+
+TABLE = 'bench_data'
+
+
+def reset_table() -> None:
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS {TABLE}, {TABLE}_hashes, {TABLE}_daily_counts')
+            cur.execute(
+                f'CREATE TABLE {TABLE} ('
+                'id SERIAL PRIMARY KEY, name TEXT NOT NULL, date DATE NOT NULL)'
+            )
+            # Same triggers as the real table, so skipping repeats and
+            # counting rows per day cost the same.
+            for statement in [
+                *dedupe_backfill_statements(TABLE),
+                *daily_counts_backfill_statements(TABLE),
+                *dedupe_trigger_statements(TABLE),
+                *daily_counts_trigger_statements(TABLE),
+                *daily_counts_slot_statements(TABLE),
+            ]:
+                cur.execute(statement)
+    finally:
+        conn.close()
+
+
+def drop_table() -> None:
+    conn = connect()
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS {TABLE}, {TABLE}_hashes, {TABLE}_daily_counts')
+            cur.execute(f'DROP FUNCTION IF EXISTS {TABLE}_skip_duplicate(), {TABLE}_count_daily()')
+    finally:
+        conn.close()
+
+
+def synthetic_rows(count: int) -> list[tuple[str, date]]:
+    start = date(2024, 1, 1)
+    return [(f'Synthetic joke {i}', start + timedelta(days=i % 365)) for i in range(count)]
+
+
+def single_inserts(pool: Any, rows: list[tuple[str, date]]) -> None:
+    # Mirrors backend_app.create_row: one transaction per row.
+    for row in rows:
+        conn = pool.getconn()
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(f'INSERT INTO {TABLE} (name, date) VALUES (%s, %s)', row)
+        finally:
+            pool.putconn(conn)
+
+
+def buffered_inserts(
+    pool: Any, rows: list[tuple[str, date]], method: str, batch_size: int
+) -> None:
+    writer = BufferedWriter(pool, batch_size=batch_size, method=method, table=TABLE)
+    for name, date_value in rows:
+        writer.add(name, date_value)
+    writer.close()
+    assert writer.stats()['rows_written'] == len(rows), writer.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--single-rows', type=int, default=2000,
+                        help='rows for the (slow) one-commit-per-row case')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    pool = make_pool()
+    cases = [
+        ('single INSERT per commit', args.single_rows,
+         lambda rows: single_inserts(pool, rows)),
+        (f'execute_values x{args.batch_size}', args.rows,
+         lambda rows: buffered_inserts(pool, rows, 'values', args.batch_size)),
+        (f'COPY x{args.batch_size}', args.rows,
+         lambda rows: buffered_inserts(pool, rows, 'copy', args.batch_size)),
+    ]
+    try:
+        for name, count, run in cases:
+            reset_table()
+            rows = synthetic_rows(count)
+            with timer() as t:
+                run(rows)
+            print(f'{name:<28} {count:>8} rows {count / t["elapsed"]:>12,.0f} rows/s')
+    finally:
+        pool.close()
+        drop_table()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Page latency for the records API: keyset pagination vs LIMIT/OFFSET.
+
+Seeds a scratch ``bench_records`` table (dropped afterwards) with the same
+shape and (date, id) index as ``data``, then times the first page and a page
+near the end of the table with both strategies, on the Postgres configured
+through DB_* variables:
+
+    python benchmarks/bench_records_api.py --rows 1000000 --iterations 200
+"""
+import argparse
+from datetime import date
+from typing import Any, Callable, Optional
+
+from common import connect, percentile, timer
+
+from psycopg2 import sql
+
+from records_query import Cursor, RecordsPage, fetch_records_page
+
+TABLE = 'bench_records'
+
+
+def seed_table(conn: Any, rows: int) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        cur.execute(
+            f'CREATE TABLE {TABLE} ('
+            'id SERIAL PRIMARY KEY, name TEXT NOT NULL, date DATE NOT NULL)'
+        )
+        # Roughly 1000 rows per day, ascending with id like real ingestion.
+        cur.execute(
+            f"INSERT INTO {TABLE} (name, date) "
+            "SELECT 'Synthetic joke ' || i, DATE '2000-01-01' + (i / 1000) "
+            "FROM generate_series(1, %s) AS i",
+            (rows,),
+        )
+        cur.execute(f'CREATE INDEX ON {TABLE} (date, id)')
+        cur.execute(f'ANALYZE {TABLE}')
+
+
+def drop_table(conn: Any) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def cursor_at(cur: Any, offset: int) -> Cursor:
+    # The position a client would hold after paging ``offset`` rows in.
+    cur.execute(
+        f'SELECT date, id FROM {TABLE} ORDER BY date DESC, id DESC OFFSET %s LIMIT 1',
+        (offset,),
+    )
+    row_date, row_id = cur.fetchone()
+    return Cursor(row_date, row_id)
+
+
+def offset_page(cur: Any, limit: int, offset: int) -> list[tuple]:
+    cur.execute(
+        sql.SQL(
+            'SELECT id, name, date FROM {} ORDER BY date DESC, id DESC LIMIT %s OFFSET %s'
+        ).format(sql.Identifier(TABLE)),
+        (limit, offset),
+    )
+    rows: list[tuple] = cur.fetchall()
+    return rows
+
+
+def keyset_page(cur: Any, limit: int, after: Optional[Cursor]) -> RecordsPage:
+    return fetch_records_page(cur, limit, after=after, table=TABLE)
+
+
+def measure(name: str, fn: Callable[[], object], iterations: int) -> None:
+    fn()  # warm up
+    samples: list[float] = []
+    for _ in range(iterations):
+        with timer() as t:
+            fn()
+        samples.append(t['elapsed'] * 1000)
+    print(
+        f'{name:<32} p50 {percentile(samples, 0.5):>8.2f} ms'
+        f'   p99 {percentile(samples, 0.99):>8.2f} ms'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        seed_table(conn, args.rows)
+        deep = args.rows - args.page_size * 2
+        with conn.cursor() as cur:
+            deep_cursor = cursor_at(cur, deep)
+            filtered_from = date(2000, 1, 1)
+            cases = [
+                ('keyset, first page', lambda: keyset_page(cur, args.page_size, None)),
+                (f'keyset, {deep:,} rows in',
+                 lambda: keyset_page(cur, args.page_size, deep_cursor)),
+                ('keyset, date range',
+                 lambda: fetch_records_page(cur, args.page_size, date_from=filtered_from,
+                                            date_to=filtered_from, table=TABLE)),
+                ('OFFSET, first page', lambda: offset_page(cur, args.page_size, 0)),
+                (f'OFFSET, {deep:,} rows in',
+                 lambda: offset_page(cur, args.page_size, deep)),
+            ]
+            for name, fn in cases:
+                measure(name, fn, args.iterations)
+        conn.rollback()
+    finally:
+        drop_table(conn)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
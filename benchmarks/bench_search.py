@@ -0,0 +1,120 @@
+"""
+Search latency: ILIKE scan vs tsvector + GIN index, plus the query cache.
+
+Seeds a scratch ``bench_search`` table (dropped afterwards) with synthetic
+jokes built from a small vocabulary, with the same ``name_tsv``
+column and GIN index as ``data``, on the Postgres configured through DB_*
+variables:
+
+    python benchmarks/bench_search.py --rows 3000000 --iterations 100
+"""
+import argparse
+from typing import Any, Callable
+
+from common import connect, percentile, timer
+
+from records_cache import QueryCache
+from records_search import SEARCH_CONFIG, SearchPage, search_records
+
+TABLE = 'bench_search'
+
+# Word frequencies are skewed: "chuck" is in about a quarter of the rows,
+# "zeppelin" in a few percent.
+VOCABULARY = [
+    'chuck', 'norris', 'programmer', 'database', 'coffee', 'bug', 'compiler',
+    'keyboard', 'server', 'cloud', 'kernel', 'python', 'regex', 'deadline',
+    'monday', 'unicorn', 'quantum', 'penguin', 'haiku', 'zeppelin',
+]
+
+
+def seed_table(conn: Any, rows: int) -> None:
+    words = '{' + ','.join(VOCABULARY) + '}'
+    with conn, conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        cur.execute(
+            f'CREATE TABLE {TABLE} ('
+            'id SERIAL PRIMARY KEY, name TEXT NOT NULL, date DATE NOT NULL, name_tsv tsvector)'
+        )
+        cur.execute('SELECT setseed(0.42)')
+        # Squaring the random index skews picks towards the front of the list.
+        # name_tsv is computed here rather than by the trigger on data,
+        # which would only slow seeding down.
+        cur.execute(
+            f'INSERT INTO {TABLE} (name, date, name_tsv) '
+            f"SELECT name, date, to_tsvector('{SEARCH_CONFIG}', name) FROM ("
+            "SELECT 'Joke ' || i || ': the ' "
+            "|| (%(words)s::text[])[1 + floor(power(random(), 2) * %(n)s)::int] || ' and the ' "
+            "|| (%(words)s::text[])[1 + floor(power(random(), 2) * %(n)s)::int] || ' walk into a bar'"
+            # A rare word, so some searches have to find a needle in the table.
+            "|| CASE WHEN i %% 100000 = 0 THEN ' with a xylophone' ELSE '' END AS name, "
+            "DATE '2000-01-01' + (i / 1000) AS date "
+            'FROM generate_series(1, %(rows)s) AS i) AS seed',
+            {'words': words, 'n': len(VOCABULARY), 'rows': rows},
+        )
+        cur.execute(f'CREATE INDEX ON {TABLE} USING GIN (name_tsv)')
+        cur.execute(f'CREATE INDEX ON {TABLE} (date, id)')
+        cur.execute(f'ANALYZE {TABLE}')
+
+
+def drop_table(conn: Any) -> None:
+    with conn, conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def ilike_search(cur: Any, text: str, limit: int) -> list[tuple]:
+    # The pre-index approach: a sequential scan with a substring match.
+    cur.execute(
+        f'SELECT id, name, date FROM {TABLE} WHERE name ILIKE %s ORDER BY id DESC LIMIT %s',
+        (f'%{text}%', limit),
+    )
+    rows: list[tuple] = cur.fetchall()
+    return rows
+
+
+def measure(name: str, fn: Callable[[], object], iterations: int) -> None:
+    fn()  # warm up
+    samples: list[float] = []
+    for _ in range(iterations):
+        with timer() as t:
+            fn()
+        samples.append(t['elapsed'] * 1000)
+    print(
+        f'{name:<36} p50 {percentile(samples, 0.5):>9.2f} ms'
+        f'   p99 {percentile(samples, 0.99):>9.2f} ms'
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=3000000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=100)
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        seed_table(conn, args.rows)
+        cache = QueryCache(maxsize=256, ttl=3600)
+        with conn.cursor() as cur:
+            def fts(text: str) -> SearchPage:
+                return search_records(cur, text, args.limit, table=TABLE)
+
+            # Common words let ILIKE stop early; rare or missing ones force
+            # it to scan the whole table.
+            for word in ('chuck', 'zeppelin', 'xylophone', 'platypus'):
+                measure(f'ILIKE "{word}"', lambda: ilike_search(cur, word, args.limit),
+                        max(args.iterations // 10, 1))
+                measure(f'full-text "{word}"', lambda: fts(word), args.iterations)
+            measure('full-text "quantum -penguin"', lambda: fts('quantum -penguin'),
+                    args.iterations)
+            measure('full-text "zeppelin", cached',
+                    lambda: cache.get_or_load('zeppelin', lambda: fts('zeppelin')),
+                    args.iterations)
+        conn.rollback()
+    finally:
+        drop_table(conn)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Load test: requests/sec for the frontend under Bottle's dev server vs gunicorn.
+
+Starts ``frontend_app.py`` as a subprocess once per configuration and hammers
+``/`` from several client processes over keep-alive connections. The records
+cache TTL is raised so the numbers measure the server, not Postgres (which
+may be down; the page then renders an empty list):
+
+    python benchmarks/bench_server_load.py --workers 1 2 4 --clients 32 --seconds 5
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(
+    port: int, mode: str, workers: int, threads: int, extra_env: Optional[dict[str, str]] = None
+) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        SERVER_HOST='127.0.0.1',
+        SERVER_PORT=str(port),
+        SERVER_WORKERS=str(workers),
+        SERVER_THREADS=str(threads),
+        RECORDS_CACHE_TTL='3600',
+        RECORDS_CACHE_LISTEN='0',
+        DB_POOL_MIN='0',
+    )
+    env.update(extra_env or {})
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'frontend_app.py')],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{mode} server did not start on port {port}')
+
+
+def client(port: int, seconds: float) -> tuple[int, int]:
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    count = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                count += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.close()
+    return count, errors
+
+
+def run_load(port: int, clients: int, seconds: float) -> tuple[float, int]:
+    with multiprocessing.Pool(clients) as pool:
+        started = time.perf_counter()
+        results = pool.starmap(client, [(port, seconds)] * clients)
+        elapsed = time.perf_counter() - started
+    count = sum(c for c, _ in results)
+    errors = sum(e for _, e in results)
+    return count / elapsed, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=18080)
+    args = parser.parse_args()
+
+    cases = [('dev server (single thread)', 'dev', 1)]
+    cases += [(f'gunicorn {w} worker(s) x {args.threads} threads', 'production', w)
+              for w in args.workers]
+    for name, mode, workers in cases:
+        proc = start_server(args.port, mode, workers, args.threads)
+        try:
+            rate, errors = run_load(args.port, args.clients, args.seconds)
+        finally:
+            proc.terminate()
+            proc.wait(30)
+        print(f'{name:<36} {rate:>10,.0f} req/s   errors {errors}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks talk to the Postgres described by the usual DB_* variables (or a
+.env file), exactly like the apps do. Point them at a scratch database.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2  # noqa: E402
+
+from create_envs import import_envs_and_create_db_config  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+
+
+def connect() -> Any:
+    return psycopg2.connect(**import_envs_and_create_db_config())
+
+
+def make_pool(maxconn: int = 4) -> ConnectionPool:
+    return ConnectionPool(import_envs_and_create_db_config(), minconn=1, maxconn=maxconn)
+
+
+@contextmanager
+def timer() -> Iterator[dict[str, float]]:
+    result: dict[str, float] = {}
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['elapsed'] = time.perf_counter() - started
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
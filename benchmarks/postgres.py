@@ -0,0 +1,126 @@
+"""
+Throwaway Postgres servers for the benchmark suite.
+
+``local`` runs initdb/pg_ctl from PATH (or ``--pg-bin``) in a temp directory,
+``docker`` starts a disposable ``postgres`` container, and ``external`` uses
+whatever the DB_* variables already point at.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from typing import Any, Optional, Union
+
+import psycopg2
+
+DOCKER_IMAGE = 'postgres:16'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port: int = sock.getsockname()[1]
+    return port
+
+
+def wait_until_ready(env: dict[str, str], timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            psycopg2.connect(
+                host=env['DB_HOST'], port=env['DB_PORT'], dbname=env['DB_NAME'],
+                user=env['DB_USER'], password=env['DB_PASSWORD'], connect_timeout=2,
+            ).close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+class LocalPostgres:
+    def __init__(self, pg_bin: Optional[str] = None) -> None:
+        pg_bin = pg_bin or os.path.dirname(shutil.which('initdb') or '')
+        if not pg_bin or not os.path.exists(os.path.join(pg_bin, 'initdb')):
+            raise RuntimeError('initdb not found; pass --pg-bin or use --postgres docker')
+        if hasattr(os, 'geteuid') and os.geteuid() == 0:
+            raise RuntimeError('Postgres refuses to run as root; use --postgres docker')
+        self.pg_bin = pg_bin
+        self.port = free_port()
+        self.env = {
+            'DB_HOST': '127.0.0.1', 'DB_PORT': str(self.port), 'DB_NAME': 'postgres',
+            'DB_USER': 'postgres', 'DB_PASSWORD': 'bench',
+        }
+
+    def __enter__(self) -> 'LocalPostgres':
+        self.datadir = tempfile.mkdtemp(prefix='bench-pg-')
+        subprocess.run(
+            [os.path.join(self.pg_bin, 'initdb'), '-D', self.datadir, '-U', 'postgres',
+             '-A', 'trust', '--no-sync'],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            [os.path.join(self.pg_bin, 'pg_ctl'), '-D', self.datadir, '-w',
+             '-l', os.path.join(self.datadir, 'server.log'),
+             '-o', f'-p {self.port} -k {self.datadir} -c listen_addresses=127.0.0.1',
+             'start'],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        wait_until_ready(self.env)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        subprocess.run(
+            [os.path.join(self.pg_bin, 'pg_ctl'), '-D', self.datadir, '-m', 'immediate', 'stop'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        shutil.rmtree(self.datadir, ignore_errors=True)
+
+
+class DockerPostgres:
+    def __init__(self, image: str = DOCKER_IMAGE) -> None:
+        if shutil.which('docker') is None:
+            raise RuntimeError('docker not found; use --postgres local or external')
+        self.image = image
+        self.port = free_port()
+        self.env = {
+            'DB_HOST': '127.0.0.1', 'DB_PORT': str(self.port), 'DB_NAME': 'postgres',
+            'DB_USER': 'postgres', 'DB_PASSWORD': 'bench',
+        }
+
+    def __enter__(self) -> 'DockerPostgres':
+        self.container = subprocess.run(
+            ['docker', 'run', '--rm', '-d', '-e', 'POSTGRES_PASSWORD=bench',
+             '-p', f'127.0.0.1:{self.port}:5432', self.image],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+        wait_until_ready(self.env)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        subprocess.run(['docker', 'stop', self.container], stdout=subprocess.DEVNULL)
+
+
+class ExternalPostgres:
+    def __init__(self) -> None:
+        self.env: dict[str, str] = {}
+
+    def __enter__(self) -> 'ExternalPostgres':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+def throwaway_postgres(
+    kind: str, pg_bin: Optional[str] = None
+) -> Union[LocalPostgres, DockerPostgres, ExternalPostgres]:
+    if kind == 'local':
+        return LocalPostgres(pg_bin)
+    if kind == 'docker':
+        return DockerPostgres()
+    if kind == 'external':
+        return ExternalPostgres()
+    raise ValueError(f'Unknown postgres kind {kind!r}')
@@ -0,0 +1,204 @@
+"""
+Benchmark suite: insert throughput, query latency and page requests/sec.
+
+Starts a throwaway Postgres, creates the real schema, then for each table size
+(rows are added incrementally, smallest size first) measures:
+
+* ``create_row`` inserts per second (one commit per row, as in poll mode)
+* ``get_last_20_records`` p50/p99 latency
+* end-to-end ``/`` requests/sec from concurrent clients against gunicorn, with
+  the records cache disabled so every request queries Postgres
+
+Results are written as JSON. Given ``--baseline``, any metric more than
+``--threshold`` worse than the baseline fails the run with exit code 1:
+
+    python benchmarks/suite.py --sizes 10000 1000000 10000000 --output results.json
+    python benchmarks/suite.py --baseline results.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timezone
+from types import ModuleType
+from typing import Any, Optional
+
+from common import percentile, timer
+from postgres import free_port, throwaway_postgres
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_to(pool: Any, size: int) -> None:
+    # Server-side generate_series: 10M rows never travel over the wire. Rows
+    # are dated today so they land in a partition that exists.
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT count(*) FROM data')
+        (current,) = cur.fetchone()
+        if current < size:
+            cur.execute(
+                "INSERT INTO data (name, date) "
+                "SELECT 'Seeded joke number ' || i, current_date "
+                "FROM generate_series(%s, %s) AS i",
+                (current + 1, size),
+            )
+            cur.execute('ANALYZE data')
+        conn.commit()
+
+
+def bench_create_row(backend_app: ModuleType, size: int, rows: int) -> float:
+    today = date.today()
+    with contextlib.redirect_stdout(io.StringIO()), timer() as t:
+        for i in range(rows):
+            backend_app.create_row(f'Benchmark joke {size}-{i}', today)
+    return rows / t['elapsed']
+
+
+def bench_last_20(frontend_app: ModuleType, iterations: int) -> tuple[float, float]:
+    frontend_app.get_last_20_records()  # warm up
+    samples: list[float] = []
+    for _ in range(iterations):
+        with timer() as t:
+            frontend_app.get_last_20_records()
+        samples.append(t['elapsed'] * 1000)
+    return percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+def bench_index(args: argparse.Namespace) -> float:
+    from bench_server_load import run_load, start_server
+
+    port = free_port()
+    proc = start_server(
+        port, 'production', args.workers, args.threads,
+        extra_env={'RECORDS_CACHE_TTL': '0'},
+    )
+    try:
+        rate, errors = run_load(port, args.clients, args.seconds)
+    finally:
+        proc.terminate()
+        proc.wait(30)
+    if errors:
+        print(f'  warning: {errors} failed requests')
+    return rate
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Return a description of every metric that regressed beyond ``threshold``."""
+    regressions = []
+    for size, metrics in current['results'].items():
+        for name, value in metrics.items():
+            before = baseline.get('results', {}).get(size, {}).get(name)
+            if not before:
+                continue
+            # Throughputs (``*_per_s``) should not drop, latencies should not grow.
+            if name.endswith('_per_s'):
+                change = (before - value) / before
+            else:
+                change = (value - before) / before
+            if change > threshold:
+                regressions.append(
+                    f'{name} at {int(size):,} rows: {before:,.2f} -> {value:,.2f} '
+                    f'({change:.0%} worse)'
+                )
+    return regressions
+
+
+def run_suite(args: argparse.Namespace) -> dict[str, Any]:
+    import backend_app
+    import frontend_app
+    from db_pool import get_pool
+
+    backend_app.ensure_table_exists()
+    pool = get_pool()
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SHOW server_version')
+        (server_version,) = cur.fetchone()
+    report: dict[str, Any] = {
+        'meta': {
+            'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'params': {
+                key: getattr(args, key)
+                for key in ('insert_rows', 'iterations', 'clients', 'seconds',
+                            'workers', 'threads')
+            },
+        },
+        'results': {},
+    }
+    for size in sorted(args.sizes):
+        print(f'seeding {size:,} rows...')
+        with timer() as t:
+            seed_to(pool, size)
+        print(f'  seeded in {t["elapsed"]:.1f}s')
+        results: dict[str, float] = {}
+        results['create_row_rows_per_s'] = bench_create_row(backend_app, size, args.insert_rows)
+        p50, p99 = bench_last_20(frontend_app, args.iterations)
+        results['last_20_p50_ms'] = p50
+        results['last_20_p99_ms'] = p99
+        results['index_requests_per_s'] = bench_index(args)
+        for name, value in results.items():
+            print(f'  {name:<24} {value:>12,.2f}')
+        report['results'][str(size)] = results
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 1000000, 10000000])
+    parser.add_argument('--postgres', choices=['local', 'docker', 'external'], default='local',
+                        help='where to run Postgres (external uses the DB_* variables)')
+    parser.add_argument('--pg-bin', help='directory containing initdb and pg_ctl')
+    parser.add_argument('--insert-rows', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--output', default=os.path.join(
+        ROOT, 'benchmarks', 'results', time.strftime('%Y%m%d-%H%M%S') + '.json'))
+    parser.add_argument('--baseline', help='previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed relative regression, e.g. 0.10 for 10%%')
+    args = parser.parse_args()
+
+    with throwaway_postgres(args.postgres, args.pg_bin) as server:
+        # Set before the apps first read their settings through create_envs.
+        os.environ.update(server.env)
+        os.environ['RECORDS_CACHE_LISTEN'] = '0'
+        report = run_suite(args)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions beyond {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Build the self-hosted static files served under /static/.
+
+    python build_assets.py                       # download the pinned files
+    python build_assets.py --source-dir vendor/  # build from local copies
+
+Each file in ``VENDOR_ASSETS`` is checked against its pinned SHA-384
+integrity hash, written under a fingerprinted name with gzip (and, when the
+``brotli`` package is installed, brotli) copies at maximum compression, and
+recorded in ``manifest.json``. Runs at image build time (see the
+Dockerfile), so the running app needs no network access for its assets.
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.request
+from typing import Optional, Sequence
+
+from compression import ENCODINGS, compress
+from static_assets import (
+    MANIFEST_FILE,
+    PRECOMPRESSED,
+    STATIC_DIR,
+    VENDOR_ASSETS,
+    fingerprinted_name,
+    integrity_of,
+)
+
+
+def fetch(name: str, source_dir: Optional[str], timeout: float) -> bytes:
+    if source_dir:
+        with open(os.path.join(source_dir, name), "rb") as f:
+            return f.read()
+    with urllib.request.urlopen(VENDOR_ASSETS[name].url, timeout=timeout) as resp:
+        body: bytes = resp.read()
+    return body
+
+
+def build(out_dir: str, source_dir: Optional[str] = None, timeout: float = 30.0) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name, asset in VENDOR_ASSETS.items():
+        body = fetch(name, source_dir, timeout)
+        integrity = integrity_of(body)
+        if integrity != asset.integrity:
+            raise ValueError(f"{name}: expected {asset.integrity}, got {integrity}")
+        path = fingerprinted_name(name, body)
+        with open(os.path.join(out_dir, path), "wb") as f:
+            f.write(body)
+        sizes = {"identity": len(body)}
+        for encoding in ENCODINGS:
+            compressed = compress(body, encoding)
+            if len(compressed) < len(body):
+                with open(os.path.join(out_dir, path + PRECOMPRESSED[encoding]), "wb") as f:
+                    f.write(compressed)
+                sizes[encoding] = len(compressed)
+        manifest[name] = {"path": path, "integrity": integrity}
+        print(f"{path}: " + ", ".join(f"{e} {n} bytes" for e, n in sizes.items()))
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    # Files from an earlier build are no longer linked from anywhere.
+    keep = {MANIFEST_FILE}
+    for entry in manifest.values():
+        keep.add(entry["path"])
+        keep.update(entry["path"] + suffix for suffix in PRECOMPRESSED.values())
+    for stale in set(os.listdir(out_dir)) - keep:
+        os.remove(os.path.join(out_dir, stale))
+    return manifest
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets.")
+    parser.add_argument("--out", default=STATIC_DIR, help="output directory (default: static/)")
+    parser.add_argument("--source-dir", help="read the vendored files from here instead of the CDN")
+    parser.add_argument("--timeout", type=float, default=30.0, help="download timeout in seconds")
+    args = parser.parse_args(argv)
+    if "br" not in ENCODINGS:
+        print("brotli is not installed, writing gzip copies only")
+    try:
+        build(args.out, args.source_dir, args.timeout)
+    except Exception as e:
+        print(f"Asset build failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Content-Encoding negotiation and compression of dynamic responses.
+
+Brotli is used when the ``brotli`` package is installed; without it
+responses are gzip-compressed only. Precompressed static files do not need
+it at runtime (see static_assets.py).
+"""
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Sequence
+
+import bottle
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+# Compressed bodies of responses that carry an ETag, so a page served many
+# times per version is compressed once.
+COMPRESSED_CACHE_SIZE = 64
+
+
+def negotiate_encoding(accept_encoding: str, offered: Sequence[str] = ENCODINGS) -> Optional[str]:
+    """The ``offered`` coding the client ranks highest, or None for identity.
+
+    Ties go to the earlier entry in ``offered``; ``*`` matches any coding the
+    header does not name, and ``q=0`` refuses one.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        compressed: bytes = brotli.compress(body, quality=11 if level is None else level)
+        return compressed
+    if encoding == "gzip":
+        # mtime=0 keeps the output identical across builds and processes.
+        return gzip.compress(body, compresslevel=9 if level is None else level, mtime=0)
+    raise ValueError(f"Unknown encoding {encoding!r}")
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def add_vary(headers: Any, field: str) -> None:
+    vary = headers.get("Vary")
+    if not vary:
+        headers["Vary"] = field
+    elif field.lower() not in [v.strip().lower() for v in vary.split(",")]:
+        headers["Vary"] = f"{vary}, {field}"
+
+
+class CompressionPlugin:
+    """Bottle plugin that compresses byte, text and JSON route results.
+
+    Streaming results (generators, files) are passed through untouched, as
+    are bodies shorter than ``min_size`` and responses that already set a
+    Content-Encoding. A strong ETag is weakened on the compressed variant,
+    since its bytes differ from the identity body.
+    """
+
+    name = "compression"
+    api = 2
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._stats = {"compressed": 0, "cache_hits": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def apply(self, callback: Callable[..., Any], route: bottle.Route) -> Callable[..., Any]:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            result = callback(*args, **kwargs)
+            if isinstance(result, dict):
+                # Serialize here rather than in the JSON plugin so the
+                # encoded body can still be compressed.
+                result = bottle.json_dumps(result)
+                bottle.response.content_type = "application/json"
+            if isinstance(result, str):
+                result = result.encode(bottle.response.charset)
+            if isinstance(result, bytes):
+                return self.compress_response(result)
+            return result
+
+        return wrapper
+
+    def compress_response(self, body: bytes) -> bytes:
+        response = bottle.response
+        if response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+            return body
+        if not is_compressible(response.content_type or response.default_content_type):
+            return body
+        add_vary(response.headers, "Accept-Encoding")
+        if len(body) < self.min_size:
+            return body
+        encoding = negotiate_encoding(bottle.request.get_header("Accept-Encoding", ""))
+        if encoding is None:
+            return body
+        etag = response.get_header("ETag")
+        compressed = self._compress(body, encoding, etag)
+        if len(compressed) >= len(body):
+            return body
+        response.set_header("Content-Encoding", encoding)
+        if etag and not etag.startswith("W/"):
+            response.set_header("ETag", "W/" + etag)
+        return compressed
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._stats, cached=len(self._cache))
+
+    def _compress(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        key = (etag, encoding) if etag else None
+        if key is not None:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self._stats["cache_hits"] += 1
+                    return cached
+        level = self.brotli_quality if encoding == "br" else self.gzip_level
+        compressed = compress(body, encoding, level)
+        with self._lock:
+            self._stats["compressed"] += 1
+            self._stats["bytes_in"] += len(body)
+            self._stats["bytes_out"] += len(compressed)
+            if key is not None:
+                self._cache[key] = compressed
+                while len(self._cache) > COMPRESSED_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return compressed
@@ -0,0 +1,251 @@
+"""Lease-based work sharding between backend replicas.
+
+Ingestion is split into ``INGEST_SHARDS`` shards. Each shard is a row in
+``ingest_leases`` that at most one worker holds at a time; a holder renews
+its leases every third of the TTL and a crashed worker's leases simply
+expire, after which the survivors claim them. Live workers register in
+``ingest_workers`` so each can compute its fair share and hand back shards
+when a new replica joins.
+
+A worker treats a lease as lost as soon as its own copy of the deadline
+passes, measured from before the renewing statement, so it stops working a
+shard no later than the database would let another worker claim it. A fetch
+already in flight may still land after a handover; the dedupe trigger makes
+that overlap harmless.
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional, Sequence
+
+from metrics import INGEST_SHARDS_OWNED
+from pipeline import Emit, Source
+
+LEASE_SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS ingest_leases (
+        shard INTEGER PRIMARY KEY,
+        owner TEXT,
+        expires_at TIMESTAMPTZ NOT NULL DEFAULT '-infinity'
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingest_workers (
+        worker TEXT PRIMARY KEY,
+        heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+SEED_SHARDS_SQL = """
+    INSERT INTO ingest_leases (shard) SELECT generate_series(0, %s - 1)
+    ON CONFLICT (shard) DO NOTHING
+"""
+HEARTBEAT_SQL = """
+    INSERT INTO ingest_workers (worker) VALUES (%s)
+    ON CONFLICT (worker) DO UPDATE SET heartbeat_at = now()
+"""
+EXPIRE_WORKERS_SQL = (
+    "DELETE FROM ingest_workers WHERE heartbeat_at < now() - make_interval(secs => %s)"
+)
+LIVE_WORKERS_SQL = "SELECT worker FROM ingest_workers ORDER BY worker"
+RENEW_SQL = """
+    UPDATE ingest_leases SET expires_at = now() + make_interval(secs => %(ttl)s)
+    WHERE owner = %(worker)s AND shard < %(shards)s
+    RETURNING shard
+"""
+# SKIP LOCKED lets two workers claim at the same moment without queueing on
+# each other's rows; the outer condition is rechecked after the row lock.
+CLAIM_SQL = """
+    UPDATE ingest_leases
+    SET owner = %(worker)s, expires_at = now() + make_interval(secs => %(ttl)s)
+    WHERE shard IN (
+        SELECT shard FROM ingest_leases
+        WHERE shard < %(shards)s AND (owner IS NULL OR expires_at < now())
+        ORDER BY shard
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ) AND (owner IS NULL OR expires_at < now())
+    RETURNING shard
+"""
+RELEASE_SQL = """
+    UPDATE ingest_leases SET owner = NULL, expires_at = '-infinity'
+    WHERE owner = %s AND shard = ANY(%s)
+"""
+LEAVE_SQL = "DELETE FROM ingest_workers WHERE worker = %s"
+RELEASE_ALL_SQL = (
+    "UPDATE ingest_leases SET owner = NULL, expires_at = '-infinity' WHERE owner = %s"
+)
+
+
+def default_worker_id() -> str:
+    # The pod name in Kubernetes; pid and a random suffix keep local
+    # processes and restarted containers apart.
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def shard_quota(shards: int, workers: Sequence[str], worker_id: str) -> int:
+    """Shards ``worker_id`` should hold when ``workers`` split ``shards`` evenly.
+
+    The remainder goes to the lowest-sorting workers, so the quotas of all
+    live workers add up to exactly ``shards``.
+    """
+    workers = sorted(set(workers) | {worker_id})
+    base, extra = divmod(shards, len(workers))
+    return base + (1 if workers.index(worker_id) < extra else 0)
+
+
+class ShardCoordinator(threading.Thread):
+    """Background thread that keeps this worker's share of shard leases.
+
+    ``owns(shard)`` is what the ingest loops check before each unit of work;
+    the holder of shard 0 is the leader and also runs singleton chores such
+    as partition maintenance.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        shards: int,
+        lease_ttl: float = 15.0,
+        worker_id: str = "",
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(name="shard-coordinator", daemon=True)
+        self.pool = pool
+        self.shards = shards
+        self.lease_ttl = lease_ttl
+        self.renew_interval = lease_ttl / 3
+        self.worker_id = worker_id or default_worker_id()
+        self.clock = clock
+        self._deadlines: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._seeded = False
+        self._stop_event = threading.Event()
+
+    def owns(self, shard: int) -> bool:
+        with self._lock:
+            return self._deadlines.get(shard, 0.0) > self.clock()
+
+    def owned(self) -> list[int]:
+        now = self.clock()
+        with self._lock:
+            return sorted(shard for shard, deadline in self._deadlines.items() if deadline > now)
+
+    def is_leader(self) -> bool:
+        return self.owns(0)
+
+    def sync(self) -> list[int]:
+        """Heartbeat, renew held leases, then release or claim toward the fair share."""
+        started = self.clock()
+        params = {"worker": self.worker_id, "ttl": self.lease_ttl, "shards": self.shards}
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    if not self._seeded:
+                        cur.execute(SEED_SHARDS_SQL, (self.shards,))
+                    cur.execute(HEARTBEAT_SQL, (self.worker_id,))
+                    cur.execute(EXPIRE_WORKERS_SQL, (self.lease_ttl,))
+                    cur.execute(LIVE_WORKERS_SQL)
+                    workers = [row[0] for row in cur.fetchall()]
+                    cur.execute(RENEW_SQL, params)
+                    held = sorted(row[0] for row in cur.fetchall())
+                    quota = shard_quota(self.shards, workers, self.worker_id)
+                    if len(held) > quota:
+                        # Keep the lowest shards so leadership (shard 0) stays put.
+                        released = held[quota:]
+                        cur.execute(RELEASE_SQL, (self.worker_id, released))
+                        held = held[:quota]
+                    elif len(held) < quota:
+                        cur.execute(CLAIM_SQL, dict(params, limit=quota - len(held)))
+                        held = sorted(held + [row[0] for row in cur.fetchall()])
+        finally:
+            self.pool.putconn(conn)
+        self._seeded = True
+        deadline = started + self.lease_ttl
+        with self._lock:
+            gained = set(held) - {s for s, d in self._deadlines.items() if d > started}
+            self._deadlines = {shard: deadline for shard in held}
+        if gained:
+            print(f"Worker {self.worker_id} now holds shards {held}")
+        INGEST_SHARDS_OWNED.set(len(held))
+        return held
+
+    def leave(self) -> None:
+        """Hand every lease back so peers take over without waiting for expiry."""
+        with self._lock:
+            self._deadlines = {}
+        INGEST_SHARDS_OWNED.set(0)
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(RELEASE_ALL_SQL, (self.worker_id,))
+                    cur.execute(LEAVE_SQL, (self.worker_id,))
+        finally:
+            self.pool.putconn(conn)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                # Keep the local deadlines: work stops by itself once they pass.
+                print(f"Error renewing shard leases: {e}")
+            if self._stop_event.wait(self.renew_interval):
+                break
+        try:
+            self.leave()
+        except Exception as e:
+            print(f"Error releasing shard leases: {e}")
+
+
+async def _wait(stop: asyncio.Event, timeout: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+class ShardedSource:
+    """Runs a pipeline source only while this worker holds the lease on ``shard``."""
+
+    def __init__(
+        self,
+        source: Source,
+        shard: int,
+        coordinator: ShardCoordinator,
+        poll_interval: Optional[float] = None,
+    ) -> None:
+        self.source = source
+        self.shard = shard
+        self.coordinator = coordinator
+        self.poll_interval = poll_interval or min(1.0, coordinator.renew_interval)
+        self.name = source.name
+
+    async def run(self, emit: Emit, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            if not self.coordinator.owns(self.shard):
+                await _wait(stop, self.poll_interval)
+                continue
+            lost = asyncio.Event()
+
+            async def watch() -> None:
+                while not stop.is_set() and self.coordinator.owns(self.shard):
+                    await _wait(stop, self.poll_interval)
+                lost.set()
+
+            watcher = asyncio.create_task(watch())
+            try:
+                await self.source.run(emit, lost)
+            finally:
+                watcher.cancel()
+            if not lost.is_set():
+                return  # a finite source reached its end
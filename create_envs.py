@@ -1,16 +1,558 @@
-from dotenv import dotenv_values, load_dotenv 
+import functools
 import os
+from typing import Any, Callable, NamedTuple, Optional, TypeVar, Union
 
-def import_envs_and_create_db_config():
+from dotenv import load_dotenv
+
+# Nothing here runs at import time. get_settings() reads .env and the
+# environment on first use, validates every section and keeps the result.
+# import_envs_and_create_db_config() and ..._replica_config() re-read the
+# environment on each call and return plain dicts for ``**`` unpacking, for
+# scripts that only need a connection.
+
+N = TypeVar("N", int, float)
+
+
+class ConfigError(ValueError):
+    """An environment variable is set to a value the app cannot use."""
+
+
+@functools.lru_cache(maxsize=None)
+def load_env_file() -> None:
+    # Read .env once per process; variables already set win over the file.
     load_dotenv()
-    DB_CONFIG = {
-        "host": os.getenv("DB_HOST"),
-        "port": os.getenv("DB_PORT"),
-        "user": os.getenv("DB_USER"),
-        "password": os.getenv("DB_PASSWORD"),
-        "dbname": os.getenv("DB_NAME"),
-    }
+
+
+def _text(name: str, default: str) -> str:
+    # Empty counts as unset, so "DB_HOST=" in a manifest means the default.
+    return os.getenv(name, "").strip() or default
+
+
+def _number(name: str, default: N, kind: Callable[[str], N], minimum: Optional[float]) -> N:
+    raw = _text(name, str(default))
+    try:
+        value = kind(raw)
+    except ValueError:
+        expected = "an integer" if kind is int else "a number"
+        raise ConfigError(f"{name} must be {expected}, got {raw!r}") from None
+    if minimum is not None and value < minimum:
+        raise ConfigError(f"{name} must be at least {minimum}, got {value}")
+    return value
+
+
+def _int(name: str, default: int, minimum: Optional[int] = None) -> int:
+    return _number(name, default, int, minimum)
+
+
+def _float(name: str, default: float, minimum: Optional[float] = None) -> float:
+    return _number(name, default, float, minimum)
+
+
+def _flag(name: str, default: bool) -> bool:
+    raw = _text(name, "1" if default else "0").lower()
+    if raw not in ("0", "1", "true", "false", "yes", "no"):
+        raise ConfigError(f"{name} must be 1 or 0, got {raw!r}")
+    return raw in ("1", "true", "yes")
+
+
+def _required(name: str, dev_default: str) -> str:
+    # No production default: credentials nobody set would only fail later,
+    # at connect time, with a less obvious error.
+    value = _text(name, "")
+    if value:
+        return value
+    if _text("SERVER_MODE", "production") == "dev":
+        return dev_default
+    raise ConfigError(f"{name} must be set (SERVER_MODE=dev uses {dev_default!r})")
+
+
+def _port(name: str, default: int, minimum: int = 1) -> int:
+    port = _int(name, default, minimum)
+    if port > 65535:
+        raise ConfigError(f"{name} must be a TCP port, got {port}")
+    return port
+
+
+class DatabaseSettings(NamedTuple):
+    host: str
+    port: int
+    database: str
+    user: str
+    password: str
+
+
+class PoolSettings(NamedTuple):
+    minconn: int
+    maxconn: int
+    timeout: float
+    check_idle: float
+    max_idle: float
+
+
+class ReplicaSettings(NamedTuple):
+    replicas: list[dict[str, Any]]
+    max_lag: float
+    latest_max_lag: Optional[float]
+    check_interval: float
+    retry_after: float
+
+
+class CacheSettings(NamedTuple):
+    ttl: float
+    listen: bool
+
+
+class ServerSettings(NamedTuple):
+    mode: str
+    host: str
+    port: int
+    workers: int
+    threads: int
+    keepalive: int
+    backlog: int
+    timeout: int
+    graceful_timeout: int
+    access_log: bool
+    debug: bool
+
+
+class MetricsSettings(NamedTuple):
+    host: str
+    port: int
+    dir: str
+
+
+class ApiSettings(NamedTuple):
+    page_size: int
+    max_page_size: int
+
+
+class SearchSettings(NamedTuple):
+    cache_size: int
+    cache_ttl: float
+    max_page: int
+    max_candidates: int
+    max_query_length: int
+
+
+class StatsSettings(NamedTuple):
+    default_days: int
+    max_days: int
+
+
+class PartitionSettings(NamedTuple):
+    months_ahead: int
+    retention_days: int
+    retention_action: str
+    maintenance_interval: float
+
+
+class ExportSettings(NamedTuple):
+    itersize: int
+    max_concurrent: int
+
+
+class IngestSettings(NamedTuple):
+    fetch_interval: float
+    batch_size: int
+    flush_interval: float
+    method: str
+    dedupe_size: int
+
+
+class AsyncIngestSettings(NamedTuple):
+    mode: str
+    concurrency: int
+    rate: float
+    queue_size: int
+    source_timeout: float
+    verify: Union[bool, str]
+
+
+class HttpClientSettings(NamedTuple):
+    timeout: float
+    verify: Union[bool, str]
+    retries: int
+    backoff: float
+    backoff_max: float
+    failure_threshold: int
+    reset_timeout: float
+
+
+class PipelineSettings(NamedTuple):
+    sources: list[str]
+    report_interval: float
+
+
+class MigrationSettings(NamedTuple):
+    on_start: bool
+    lock_timeout: float
+
+
+class FeedSettings(NamedTuple):
+    max_clients: int
+    buffer_size: int
+    heartbeat: float
+    poll_interval: float
+    port: int
+    url: str
+    allow_origin: str
+
+
+class CoordinationSettings(NamedTuple):
+    shards: int
+    lease_ttl: float
+    worker_id: str
+
+
+class SpoolSettings(NamedTuple):
+    path: str
+    max_bytes: int
+    replay_batch: int
+    retry_interval: float
+
+
+class QuerySettings(NamedTuple):
+    prepare: bool
+    slow_query_ms: float
+    explain_slow: bool
+
+
+class ProfilingSettings(NamedTuple):
+    on_start: bool
+    seconds: float
+    units: int
+    interval_ms: float
+    directory: str
+    token: str
+
+
+class CompressionSettings(NamedTuple):
+    min_size: int
+    gzip_level: int
+    brotli_quality: int
+
+
+def load_database_settings() -> DatabaseSettings:
+    return DatabaseSettings(
+        host=_text("DB_HOST", "localhost"),
+        port=_port("DB_PORT", 5432),
+        database=_required("DB_NAME", "mydatabase"),
+        user=_required("DB_USER", "myuser"),
+        password=_required("DB_PASSWORD", "mypassword"),
+    )
+
+
+def load_pool_settings() -> PoolSettings:
+    settings = PoolSettings(
+        minconn=_int("DB_POOL_MIN", 1, minimum=0),
+        maxconn=_int("DB_POOL_MAX", 10, minimum=1),
+        timeout=_float("DB_POOL_TIMEOUT", 30, minimum=0),
+        check_idle=_float("DB_POOL_CHECK_IDLE", 30, minimum=0),
+        max_idle=_float("DB_POOL_MAX_IDLE", 300, minimum=0),
+    )
+    if settings.minconn > settings.maxconn:
+        raise ConfigError(
+            f"DB_POOL_MIN ({settings.minconn}) must not exceed DB_POOL_MAX ({settings.maxconn})"
+        )
+    return settings
+
+
+def load_replica_settings() -> ReplicaSettings:
+    primary = load_database_settings()._asdict()
+    connect_timeout = _int("DB_REPLICA_CONNECT_TIMEOUT", 2, minimum=1)
+    replicas = []
+    for spec in _text("DB_REPLICAS", "").split(","):
+        host, _, port = spec.strip().partition(":")
+        if host:
+            if port and not port.isdigit():
+                raise ConfigError(f"DB_REPLICAS entry {spec.strip()!r} has an invalid port")
+            # Replicas share the primary's database and credentials.
+            replicas.append(
+                dict(primary, host=host, port=int(port) if port else primary["port"],
+                     connect_timeout=connect_timeout)
+            )
+    return ReplicaSettings(
+        replicas=replicas,
+        max_lag=_float("DB_REPLICA_MAX_LAG", 30, minimum=0),
+        latest_max_lag=(
+            _float("DB_REPLICA_LATEST_MAX_LAG", 0, minimum=0)
+            if _text("DB_REPLICA_LATEST_MAX_LAG", "") else None
+        ),
+        check_interval=_float("DB_REPLICA_CHECK_INTERVAL", 5, minimum=0),
+        retry_after=_float("DB_REPLICA_RETRY_AFTER", 30, minimum=0),
+    )
+
+
+def load_cache_settings() -> CacheSettings:
+    return CacheSettings(
+        ttl=_float("RECORDS_CACHE_TTL", 10, minimum=0),
+        listen=_flag("RECORDS_CACHE_LISTEN", True),
+    )
+
+
+def load_server_settings() -> ServerSettings:
+    return ServerSettings(
+        mode=_text("SERVER_MODE", "production"),
+        host=_text("SERVER_HOST", "0.0.0.0"),
+        port=_port("SERVER_PORT", 8080),
+        workers=_int("SERVER_WORKERS", 2, minimum=1),
+        threads=_int("SERVER_THREADS", 4, minimum=1),
+        keepalive=_int("SERVER_KEEPALIVE", 5, minimum=0),
+        backlog=_int("SERVER_BACKLOG", 2048, minimum=1),
+        timeout=_int("SERVER_TIMEOUT", 30, minimum=0),
+        graceful_timeout=_int("SERVER_GRACEFUL_TIMEOUT", 25, minimum=0),
+        access_log=_flag("SERVER_ACCESS_LOG", False),
+        debug=_flag("SERVER_DEBUG", False),
+    )
+
+
+def load_metrics_settings() -> MetricsSettings:
+    return MetricsSettings(
+        host=_text("METRICS_HOST", "0.0.0.0"),
+        # 0 turns the backend's metrics listener off.
+        port=_port("METRICS_PORT", 9100, minimum=0),
+        # Where frontend workers share their metrics; empty means a fresh
+        # temporary directory per server start.
+        dir=_text("METRICS_DIR", ""),
+    )
+
+
+def load_api_settings() -> ApiSettings:
+    settings = ApiSettings(
+        page_size=_int("API_PAGE_SIZE", 20, minimum=1),
+        max_page_size=_int("API_MAX_PAGE_SIZE", 100, minimum=1),
+    )
+    if settings.page_size > settings.max_page_size:
+        raise ConfigError("API_PAGE_SIZE must not exceed API_MAX_PAGE_SIZE")
+    return settings
+
+
+def load_search_settings() -> SearchSettings:
+    return SearchSettings(
+        cache_size=_int("SEARCH_CACHE_SIZE", 256, minimum=0),
+        cache_ttl=_float("SEARCH_CACHE_TTL", 60, minimum=0),
+        max_page=_int("SEARCH_MAX_PAGE", 50, minimum=1),
+        max_candidates=_int("SEARCH_MAX_CANDIDATES", 1000, minimum=1),
+        max_query_length=_int("SEARCH_MAX_QUERY_LENGTH", 200, minimum=1),
+    )
+
+
+def load_stats_settings() -> StatsSettings:
+    settings = StatsSettings(
+        default_days=_int("STATS_DEFAULT_DAYS", 30, minimum=1),
+        max_days=_int("STATS_MAX_DAYS", 366, minimum=1),
+    )
+    if settings.default_days > settings.max_days:
+        raise ConfigError("STATS_DEFAULT_DAYS must not exceed STATS_MAX_DAYS")
+    return settings
+
+
+def load_partition_settings() -> PartitionSettings:
+    return PartitionSettings(
+        months_ahead=_int("DATA_PARTITION_MONTHS_AHEAD", 3, minimum=0),
+        retention_days=_int("DATA_RETENTION_DAYS", 0, minimum=0),
+        retention_action=_text("DATA_RETENTION_ACTION", "detach"),
+        maintenance_interval=_float("DATA_PARTITION_CHECK_INTERVAL", 3600, minimum=1),
+    )
+
+
+def load_export_settings() -> ExportSettings:
+    return ExportSettings(
+        itersize=_int("EXPORT_ITERSIZE", 5000, minimum=1),
+        max_concurrent=_int("EXPORT_MAX_CONCURRENT", 2, minimum=1),
+    )
+
+
+def load_ingest_settings() -> IngestSettings:
+    return IngestSettings(
+        fetch_interval=_float("FETCH_INTERVAL", 30, minimum=0),
+        batch_size=_int("INGEST_BATCH_SIZE", 100, minimum=1),
+        flush_interval=_float("INGEST_FLUSH_INTERVAL", 5, minimum=0),
+        method=_text("INGEST_WRITE_METHOD", "values"),
+        dedupe_size=_int("INGEST_DEDUPE_SIZE", 10000, minimum=0),
+    )
+
+
+def _tls_verify() -> Union[bool, str]:
+    # A CA bundle path verifies against a private CA; "0" disables
+    # verification, which is only meant for local stubs.
+    return _text("JOKE_API_CA_BUNDLE", "") or _flag("JOKE_API_VERIFY_TLS", True)
+
+
+def load_async_ingest_settings() -> AsyncIngestSettings:
+    return AsyncIngestSettings(
+        mode=_text("INGEST_MODE", "poll"),
+        concurrency=_int("INGEST_CONCURRENCY", 10, minimum=1),
+        rate=_float("INGEST_RATE", 10, minimum=0.001),
+        queue_size=_int("INGEST_QUEUE_SIZE", 1000, minimum=1),
+        source_timeout=_float("JOKE_API_TIMEOUT", 10, minimum=0.001),
+        verify=_tls_verify(),
+    )
+
+
+def load_http_client_settings() -> HttpClientSettings:
+    return HttpClientSettings(
+        timeout=_float("JOKE_API_TIMEOUT", 10, minimum=0.001),
+        verify=_tls_verify(),
+        retries=_int("JOKE_API_RETRIES", 3, minimum=0),
+        backoff=_float("JOKE_API_BACKOFF", 0.5, minimum=0),
+        backoff_max=_float("JOKE_API_BACKOFF_MAX", 10, minimum=0),
+        failure_threshold=_int("JOKE_API_CIRCUIT_THRESHOLD", 5, minimum=1),
+        reset_timeout=_float("JOKE_API_CIRCUIT_RESET", 30, minimum=0),
+    )
+
+
+def load_pipeline_settings() -> PipelineSettings:
+    return PipelineSettings(
+        sources=[spec.strip() for spec in _text("INGEST_SOURCES", "").split(",") if spec.strip()],
+        report_interval=_float("INGEST_REPORT_INTERVAL", 60, minimum=0),
+    )
+
+
+def load_migration_settings() -> MigrationSettings:
+    return MigrationSettings(
+        on_start=_flag("MIGRATE_ON_START", True),
+        lock_timeout=_float("MIGRATE_LOCK_TIMEOUT", 600, minimum=0),
+    )
+
+
+def load_feed_settings() -> FeedSettings:
+    return FeedSettings(
+        # 0 means half of SERVER_THREADS in the frontend, where each stream
+        # holds a server thread, and 1000 in feed_server.py.
+        max_clients=_int("FEED_MAX_CLIENTS", 0, minimum=0),
+        buffer_size=_int("FEED_BUFFER_SIZE", 32, minimum=1),
+        heartbeat=_float("FEED_HEARTBEAT", 15, minimum=0.1),
+        poll_interval=_float("FEED_POLL_INTERVAL", 5, minimum=0.1),
+        port=_port("FEED_PORT", 8081),
+        # Empty: the index page does not subscribe to a feed.
+        url=_text("FEED_URL", ""),
+        allow_origin=_text("FEED_ALLOW_ORIGIN", ""),
+    )
+
+
+def load_coordination_settings() -> CoordinationSettings:
+    return CoordinationSettings(
+        shards=_int("INGEST_SHARDS", 1, minimum=0),
+        lease_ttl=_float("INGEST_LEASE_TTL", 15, minimum=1),
+        worker_id=_text("WORKER_ID", ""),
+    )
+
+
+def load_spool_settings() -> SpoolSettings:
+    return SpoolSettings(
+        # Empty disables the spool; rows then wait in memory only.
+        path=_text("INGEST_SPOOL_DIR", ""),
+        max_bytes=_int("INGEST_SPOOL_MAX_BYTES", 256 * 1024 * 1024, minimum=1),
+        replay_batch=_int("INGEST_SPOOL_REPLAY_BATCH", 5000, minimum=1),
+        retry_interval=_float("INGEST_SPOOL_RETRY", 5, minimum=0.1),
+    )
+
+
+def load_query_settings() -> QuerySettings:
+    return QuerySettings(
+        prepare=_flag("DB_PREPARE", True),
+        # 0 turns slow-query logging off.
+        slow_query_ms=_float("DB_SLOW_QUERY_MS", 500, minimum=0),
+        explain_slow=_flag("DB_EXPLAIN_SLOW", True),
+    )
+
+
+def load_profiling_settings() -> ProfilingSettings:
+    return ProfilingSettings(
+        on_start=_flag("PROFILE_ON_START", False),
+        seconds=_float("PROFILE_SECONDS", 30, minimum=0.1),
+        # Requests (frontend) or ingest iterations (backend); 0 means time only.
+        units=_int("PROFILE_UNITS", 0, minimum=0),
+        interval_ms=_float("PROFILE_INTERVAL_MS", 10, minimum=1),
+        directory=_text("PROFILE_DIR", "/tmp/profiles"),
+        # Empty disables the /internal/profile endpoint.
+        token=_text("PROFILE_TOKEN", ""),
+    )
+
+
+def load_compression_settings() -> CompressionSettings:
+    gzip_level = _int("COMPRESS_GZIP_LEVEL", 6, minimum=1)
+    if gzip_level > 9:
+        raise ConfigError(f"COMPRESS_GZIP_LEVEL must be at most 9, got {gzip_level}")
+    brotli_quality = _int("COMPRESS_BROTLI_QUALITY", 4, minimum=0)
+    if brotli_quality > 11:
+        raise ConfigError(f"COMPRESS_BROTLI_QUALITY must be at most 11, got {brotli_quality}")
+    return CompressionSettings(
+        min_size=_int("COMPRESS_MIN_SIZE", 1024, minimum=0),
+        gzip_level=gzip_level,
+        brotli_quality=brotli_quality,
+    )
+
+
+class Settings(NamedTuple):
+    db: DatabaseSettings
+    pool: PoolSettings
+    replica: ReplicaSettings
+    cache: CacheSettings
+    server: ServerSettings
+    metrics: MetricsSettings
+    api: ApiSettings
+    search: SearchSettings
+    stats: StatsSettings
+    partition: PartitionSettings
+    export: ExportSettings
+    ingest: IngestSettings
+    async_ingest: AsyncIngestSettings
+    http_client: HttpClientSettings
+    pipeline: PipelineSettings
+    migration: MigrationSettings
+    feed: FeedSettings
+    coordination: CoordinationSettings
+    spool: SpoolSettings
+    compression: CompressionSettings
+    query: QuerySettings
+    profiling: ProfilingSettings
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Load and validate every section on first use, then reuse the result.
+
+    A bad value raises ConfigError naming the variable, so a misconfigured
+    container fails at startup rather than on the first request that needs it.
+    Call ``get_settings.cache_clear()`` to pick up a changed environment.
+    """
+    load_env_file()
+    return Settings(
+        db=load_database_settings(),
+        pool=load_pool_settings(),
+        replica=load_replica_settings(),
+        cache=load_cache_settings(),
+        server=load_server_settings(),
+        metrics=load_metrics_settings(),
+        api=load_api_settings(),
+        search=load_search_settings(),
+        stats=load_stats_settings(),
+        partition=load_partition_settings(),
+        export=load_export_settings(),
+        ingest=load_ingest_settings(),
+        async_ingest=load_async_ingest_settings(),
+        http_client=load_http_client_settings(),
+        pipeline=load_pipeline_settings(),
+        migration=load_migration_settings(),
+        feed=load_feed_settings(),
+        coordination=load_coordination_settings(),
+        spool=load_spool_settings(),
+        compression=load_compression_settings(),
+        query=load_query_settings(),
+        profiling=load_profiling_settings(),
+    )
+
+
+def import_envs_and_create_db_config() -> dict[str, Any]:
+    load_env_file()
+    DB_CONFIG = load_database_settings()._asdict()
     return DB_CONFIG
 
 
-print(import_envs_and_create_db_config())
\ No newline at end of file
+def import_envs_and_create_replica_config() -> dict[str, Any]:
+    load_env_file()
+    REPLICA_CONFIG = load_replica_settings()._asdict()
+    return REPLICA_CONFIG
@@ -0,0 +1,256 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from create_envs import get_settings
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections shared by both apps.
+
+    Connections are handed out LIFO so the hottest ones stay warm. A
+    connection that has been idle longer than ``check_idle`` seconds is
+    pinged before checkout, and any connection found closed or broken
+    (e.g. after a server restart) is dropped and replaced transparently.
+    """
+
+    def __init__(
+        self,
+        db_config: dict[str, Any],
+        minconn: int = 1,
+        maxconn: int = 10,
+        timeout: float = 30.0,
+        check_idle: float = 30.0,
+        max_idle: float = 300.0,
+    ) -> None:
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(
+                f"Invalid pool size: minconn={minconn}, maxconn={maxconn}"
+            )
+        self._db_config = dict(db_config)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_idle = max_idle
+        self._cond = threading.Condition()
+        self._idle: list[tuple[Any, float]] = []
+        self._in_use: dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "connect_errors": 0,
+            "discarded": 0,
+            "checkout_time": 0.0,
+            "max_checkout_time": 0.0,
+            "hold_time": 0.0,
+        }
+
+    def warm(self) -> None:
+        """Open connections until ``minconn`` are idle in the pool."""
+        conns: list[Any] = []
+        try:
+            while len(conns) + self.stats()["idle"] < self.minconn:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def getconn(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        while True:
+            conn, returned_at = self._reserve(deadline)
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+            now = time.monotonic()
+            with self._cond:
+                self._in_use[id(conn)] = now
+                self._stats["checkouts"] += 1
+                elapsed = now - started
+                self._stats["checkout_time"] += elapsed
+                if elapsed > self._stats["max_checkout_time"]:
+                    self._stats["max_checkout_time"] = elapsed
+            return conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        now = time.monotonic()
+        with self._cond:
+            checked_out_at = self._in_use.pop(id(conn), None)
+            if checked_out_at is None:
+                raise PoolError("Connection was not checked out from this pool")
+            self._stats["hold_time"] += now - checked_out_at
+        if not close:
+            close = not self._reset(conn)
+        if close:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append((conn, now))
+                self._prune_idle(now)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict[str, float]:
+        with self._cond:
+            stats: dict[str, float] = dict(self._stats)
+            stats.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                maxconn=self.maxconn,
+            )
+        return stats
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _reserve(self, deadline: float) -> tuple[Any, float]:
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.maxconn:
+                    self._size += 1
+                    return None, 0.0
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No connection available within {self.timeout:.1f}s "
+                        f"({self.maxconn} in use)"
+                    )
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+    def _connect(self) -> Any:
+        try:
+            conn = psycopg2.connect(**self._db_config)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._stats["connect_errors"] += 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["connects"] += 1
+        return conn
+
+    def _is_healthy(self, conn: Any, returned_at: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _reset(self, conn: Any) -> bool:
+        if conn.closed:
+            return False
+        status = conn.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def _prune_idle(self, now: float) -> None:
+        # Called with the lock held; the oldest idle connections sit at the
+        # front of the LIFO list, so trim from there down to ``minconn``.
+        while len(self._idle) > self.minconn:
+            conn, returned_at = self._idle[0]
+            if now - returned_at < self.max_idle:
+                break
+            self._idle.pop(0)
+            self._size -= 1
+            self._stats["discarded"] += 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                _pool = ConnectionPool(settings.db._asdict(), **settings.pool._asdict())
+    return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,205 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import psycopg2
+
+from create_envs import get_settings
+from db_pool import ConnectionPool, get_pool
+from metrics import DB_READS
+
+# Seconds the replica is behind the primary; 0 when it is streaming and has
+# replayed everything it received (an idle primary sends nothing, so the last
+# replay timestamp alone would make a caught-up replica look ever more stale).
+# A replica whose WAL receiver has disconnected also has equal LSNs, frozen,
+# so it only counts as caught up while streaming. NULL (nothing replayed yet,
+# or status hidden from a role without pg_read_all_stats) means unknown.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')
+            THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+class Replica:
+    def __init__(self, name: str, pool: ConnectionPool) -> None:
+        self.name = name
+        self.pool = pool
+        # None until measured, and whenever the replica cannot tell.
+        self.lag: Optional[float] = None
+        self.checked_at = float("-inf")
+        self.down_until = 0.0
+        self.reads = 0
+        self.errors = 0
+
+
+class ReplicaRouter:
+    """Hands out connections for read-only queries.
+
+    Replicas are tried round-robin, starting one further along on every
+    call. A replica that fails to connect (or breaks mid-query) is skipped
+    for ``retry_after`` seconds. Replication lag is measured on a checked-out
+    connection at most every ``check_interval`` seconds, and replicas behind
+    by more than ``max_lag`` are passed over. With no usable replica the read
+    goes to the primary, so routing never makes a read fail that the primary
+    could have served.
+    """
+
+    def __init__(
+        self,
+        primary: Optional[ConnectionPool] = None,
+        replicas: Optional[list[Replica]] = None,
+        max_lag: Optional[float] = 30.0,
+        check_interval: float = 5.0,
+        retry_after: float = 30.0,
+    ) -> None:
+        self._primary = primary
+        self.replicas = list(replicas or [])
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._primary_reads = 0
+
+    @property
+    def primary(self) -> ConnectionPool:
+        return self._primary or get_pool()
+
+    @contextmanager
+    def read_connection(self, max_lag: Optional[float] = None) -> Iterator[Any]:
+        """Yield a connection for reads no more than ``max_lag`` seconds stale.
+
+        ``max_lag`` overrides the router default for this call; pass 0 to
+        require a replica that has replayed everything it received.
+        """
+        replica, pool, conn = self._checkout(self.max_lag if max_lag is None else max_lag)
+        try:
+            yield conn
+        except psycopg2.OperationalError as e:
+            if replica is not None:
+                self._mark_down(replica, e)
+            raise
+        finally:
+            pool.putconn(conn)
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "primary_reads": self._primary_reads,
+                "replicas": {
+                    replica.name: {
+                        "healthy": now >= replica.down_until,
+                        "lag": replica.lag,
+                        "reads": replica.reads,
+                        "errors": replica.errors,
+                    }
+                    for replica in self.replicas
+                },
+            }
+
+    def close(self) -> None:
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def _candidates(self) -> list[Replica]:
+        if not self.replicas:
+            return []
+        start = next(self._counter) % len(self.replicas)
+        now = time.monotonic()
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [replica for replica in ordered if now >= replica.down_until]
+
+    def _checkout(
+        self, max_lag: Optional[float]
+    ) -> tuple[Optional[Replica], ConnectionPool, Any]:
+        for replica in self._candidates():
+            # A lag known to be too high is trusted until the next check.
+            stale = time.monotonic() - replica.checked_at >= self.check_interval
+            if not stale and self._too_stale(replica, max_lag):
+                continue
+            try:
+                conn = replica.pool.getconn()
+            except Exception as e:
+                self._mark_down(replica, e)
+                continue
+            if stale:
+                try:
+                    self._measure_lag(replica, conn)
+                except psycopg2.Error as e:
+                    replica.pool.putconn(conn, close=True)
+                    self._mark_down(replica, e)
+                    continue
+            if self._too_stale(replica, max_lag):
+                replica.pool.putconn(conn)
+                continue
+            with self._lock:
+                replica.reads += 1
+            DB_READS.inc(target=replica.name)
+            return replica, replica.pool, conn
+        primary = self.primary
+        conn = primary.getconn()
+        with self._lock:
+            self._primary_reads += 1
+        DB_READS.inc(target="primary")
+        return None, primary, conn
+
+    def _too_stale(self, replica: Replica, max_lag: Optional[float]) -> bool:
+        # An unknown lag fails any bound: the replica may be hours behind.
+        return max_lag is not None and (replica.lag is None or replica.lag > max_lag)
+
+    def _measure_lag(self, replica: Replica, conn: Any) -> None:
+        with conn.cursor() as cur:
+            cur.execute(LAG_SQL)
+            (lag,) = cur.fetchone()
+        conn.rollback()
+        with self._lock:
+            replica.lag = None if lag is None else float(lag)
+            replica.checked_at = time.monotonic()
+
+    def _mark_down(self, replica: Replica, error: Exception) -> None:
+        print(f"Replica {replica.name} unavailable, retrying in {self.retry_after:.0f}s: {error}")
+        with self._lock:
+            replica.errors += 1
+            replica.down_until = time.monotonic() + self.retry_after
+
+
+_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ReplicaRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                config = get_settings().replica._asdict()
+                pool_config = get_settings().pool._asdict()
+                replicas = [
+                    Replica(f"{db_config['host']}:{db_config['port']}",
+                            ConnectionPool(db_config, **pool_config))
+                    for db_config in config["replicas"]
+                ]
+                _router = ReplicaRouter(
+                    None,
+                    replicas,
+                    max_lag=config["max_lag"],
+                    check_interval=config["check_interval"],
+                    retry_after=config["retry_after"],
+                )
+    return _router
+
+
+def close_router() -> None:
+    global _router
+    with _router_lock:
+        if _router is not None:
+            _router.close()
+            _router = None
@@ -0,0 +1,131 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+ERROR_PREFIXES = ("Error fetching joke",)
+
+
+# A partitioned table cannot have a unique index without the partition key,
+# so content hashes live in their own table and a row trigger skips (returns
+# NULL for) any insert whose hash is already there. Skipped rows are left out
+# of the rowcount like ON CONFLICT DO NOTHING, on every write path incl. COPY.
+# The hash matches ``content_hash`` below: md5 over the exact text.
+#
+# The backfill runs before the schema transaction locks ``table``, so writes
+# carry on meanwhile; the trigger statements run under that lock.
+def dedupe_backfill_statements(table: str = "data") -> list[str]:
+    return [
+        f"CREATE TABLE IF NOT EXISTS {table}_hashes (hash TEXT PRIMARY KEY, date DATE NOT NULL)",
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM {table}_hashes) THEN
+                INSERT INTO {table}_hashes (hash, date)
+                SELECT md5(name), max(date) FROM {table} GROUP BY md5(name)
+                ON CONFLICT DO NOTHING;
+            END IF;
+        END
+        $$
+        """,
+    ]
+
+
+def dedupe_trigger_statements(table: str = "data") -> list[str]:
+    return [
+        # Locks the hash table, so it must come after the lock on ``table``:
+        # writers take them in that order.
+        f"CREATE INDEX IF NOT EXISTS {table}_hashes_date_idx ON {table}_hashes (date)",
+        f"""
+        CREATE OR REPLACE FUNCTION {table}_skip_duplicate() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {table}_hashes (hash, date) VALUES (md5(NEW.name), NEW.date)
+            ON CONFLICT DO NOTHING;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Until the trigger exists, pick up rows committed during the backfill.
+        # New rows are dated today, so this only reads the last day through
+        # the (date, id) index; once installed, restarts skip it.
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgname = '{table}_dedupe' AND tgrelid = '{table}'::regclass
+            ) THEN
+                INSERT INTO {table}_hashes (hash, date)
+                SELECT md5(name), max(date) FROM {table}
+                WHERE date >= current_date - 1 GROUP BY md5(name)
+                ON CONFLICT DO NOTHING;
+            END IF;
+        END
+        $$
+        """,
+        f"""
+        CREATE OR REPLACE TRIGGER {table}_dedupe
+        BEFORE INSERT ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_skip_duplicate()
+        """,
+    ]
+
+
+DEDUPE_BACKFILL_STATEMENTS = dedupe_backfill_statements()
+DEDUPE_TRIGGER_STATEMENTS = dedupe_trigger_statements()
+PRUNE_HASHES_SQL = "DELETE FROM data_hashes WHERE date < %s"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.md5(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def is_valid_record(text: str, max_length: int = 1000) -> bool:
+    text = text.strip()
+    return (
+        bool(text)
+        and len(text) <= max_length
+        and not text.startswith(ERROR_PREFIXES)
+    )
+
+
+class Deduplicator:
+    """LRU of recently seen content hashes in front of ``data_hashes``.
+
+    Most repeats are caught here without a database round-trip; anything
+    that slips past (evicted from the LRU, or inserted by another process)
+    is skipped by the dedupe trigger and reported back through
+    ``record_db_duplicates`` so the hit rate covers both layers.
+    """
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._hashes: OrderedDict[str, None] = OrderedDict()
+        self._stats = {"checked": 0, "memory_hits": 0, "db_duplicates": 0}
+
+    def seen(self, text: str) -> bool:
+        key = content_hash(text)
+        with self._lock:
+            self._stats["checked"] += 1
+            if key in self._hashes:
+                self._hashes.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return True
+            self._hashes[key] = None
+            if len(self._hashes) > self.maxsize:
+                self._hashes.popitem(last=False)
+            return False
+
+    def record_db_duplicates(self, count: int) -> None:
+        with self._lock:
+            self._stats["db_duplicates"] += count
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            stats: dict[str, float] = dict(self._stats)
+        hits = stats["memory_hits"] + stats["db_duplicates"]
+        stats["hit_rate"] = hits / stats["checked"] if stats["checked"] else 0.0
+        return stats
@@ -0,0 +1,184 @@
+"""Serves the live feed (/api/feed) from one asyncio event loop.
+
+In the gunicorn frontend every open stream holds a request thread, so only a
+few dashboards fit per worker. Here a waiting client is a coroutine and a
+buffer: one feed thread reads new rows once per change and the event loop
+writes them to every open stream.
+
+    python feed_server.py   # listens on FEED_PORT (8081)
+"""
+import asyncio
+import json
+import signal
+from typing import Optional
+from urllib.parse import urlsplit
+
+from create_envs import Settings, get_settings
+from db_pool import close_pool
+from db_router import close_router, get_router
+from metrics import CONTENT_TYPE, REGISTRY
+from records_cache import DATA_CHANGED_CHANNEL, NotifyListener
+from records_feed import (
+    FEED_RETRY_MS,
+    AsyncFeedSubscription,
+    FeedFull,
+    RecordFeed,
+    busy_message,
+    feed_chunk,
+    parse_last_event_id,
+)
+from repository import NEWEST_RECORD, RECORDS_AFTER, get_repository
+
+FEED_PATH = "/api/feed"
+HEALTH_PATH = "/healthz"
+METRICS_PATH = "/metrics"
+# Streams per process when FEED_MAX_CLIENTS is 0. Each one costs a socket
+# and at most FEED_BUFFER_SIZE shared messages, not a thread.
+DEFAULT_MAX_CLIENTS = 1000
+MAX_REQUEST_HEAD = 8192
+REQUEST_TIMEOUT = 10.0
+REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed"}
+# The client went away, stalled or sent something that is not HTTP.
+CLIENT_ERRORS = (
+    ConnectionError,
+    ValueError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+    asyncio.LimitOverrunError,
+)
+
+
+def load_feed_records(after: Optional[int], limit: int) -> list[tuple]:
+    # With after=None the feed only needs the newest row to start from.
+    with get_router().read_connection(get_settings().replica.latest_max_lag) as conn:
+        if after is None:
+            return get_repository().fetch(conn, NEWEST_RECORD)
+        return get_repository().fetch(conn, RECORDS_AFTER, (after, limit))
+
+
+def response_head(
+    status: int, content_type: str, headers: Optional[dict[str, str]] = None
+) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict[str, str]]:
+    """Read a request head; returns (method, path, lower-cased headers)."""
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    method, target = request_line.split(" ")[:2]
+    headers = {}
+    for line in header_lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, urlsplit(target).path, headers
+
+
+class FeedServer:
+    """Answers ``/api/feed`` (plus ``/healthz`` and ``/metrics``) over raw asyncio streams."""
+
+    def __init__(self, feed: RecordFeed, heartbeat: float = 15.0, allow_origin: str = "") -> None:
+        self.feed = feed
+        self.heartbeat = heartbeat
+        self.allow_origin = allow_origin
+        self.port: Optional[int] = None
+        self._handlers: set[asyncio.Task] = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._handlers.add(task)
+        try:
+            method, path, headers = await read_request(reader)
+            if path == FEED_PATH and method == "GET":
+                await self.stream(writer, parse_last_event_id(headers.get("last-event-id")))
+            elif path == FEED_PATH:
+                writer.write(response_head(405, "text/plain", {"Allow": "GET"}))
+            elif path == HEALTH_PATH:
+                writer.write(response_head(200, "application/json"))
+                writer.write(json.dumps(self.feed.stats()).encode("utf-8"))
+            elif path == METRICS_PATH:
+                writer.write(response_head(200, CONTENT_TYPE))
+                writer.write(REGISTRY.render().encode("utf-8"))
+            else:
+                writer.write(response_head(404, "text/plain"))
+            await asyncio.wait_for(writer.drain(), self.heartbeat)
+        except CLIENT_ERRORS:
+            pass
+        except asyncio.CancelledError:
+            pass  # shutting down; ending quietly keeps asyncio from logging each stream
+        finally:
+            if task is not None:
+                self._handlers.discard(task)
+            writer.close()
+
+    async def stream(self, writer: asyncio.StreamWriter, last_event_id: Optional[int]) -> None:
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if self.allow_origin:
+            headers["Access-Control-Allow-Origin"] = self.allow_origin
+        writer.write(response_head(200, "text/event-stream", headers))
+        subscription = AsyncFeedSubscription(self.feed.buffer_size, asyncio.get_running_loop())
+        try:
+            self.feed.subscribe(last_event_id, subscription)
+        except FeedFull as e:
+            writer.write(busy_message(str(e)))
+            return
+        try:
+            writer.write(f"retry: {FEED_RETRY_MS}\n\n".encode("ascii"))
+            while not subscription.evicted:
+                # A client that cannot take a heartbeat's worth of data in
+                # time is dropped; it reconnects with Last-Event-ID.
+                await asyncio.wait_for(writer.drain(), self.heartbeat)
+                messages = await subscription.next(self.heartbeat)
+                writer.write(feed_chunk(subscription, messages))
+        finally:
+            self.feed.unsubscribe(subscription)
+
+    async def serve(self, host: str, port: int, stop: asyncio.Event) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_HEAD)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"Feed server listening on {host}:{self.port}")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await server.wait_closed()
+
+
+async def run(settings: Settings) -> None:
+    feed = RecordFeed(
+        load_feed_records,
+        max_clients=settings.feed.max_clients or DEFAULT_MAX_CLIENTS,
+        buffer_size=settings.feed.buffer_size,
+        poll_interval=settings.feed.poll_interval,
+    )
+    feed.start()
+    listener = None
+    if settings.cache.listen:
+        listener = NotifyListener(DATA_CHANGED_CHANNEL, feed.wake, settings.db._asdict())
+        listener.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await FeedServer(feed, settings.feed.heartbeat, settings.feed.allow_origin).serve(
+            settings.server.host, settings.feed.port, stop
+        )
+    finally:
+        feed.stop()
+        if listener is not None:
+            listener.stop()
+        close_router()
+        close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(get_settings()))
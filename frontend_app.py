@@ -1,77 +1,481 @@
-from bottle import Bottle, run, SimpleTemplate
-import psycopg2
-from create_envs import import_envs_and_create_db_config
+import functools
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import threading
+from contextlib import ExitStack
+from datetime import date, timedelta
+from typing import Any, Iterator, NamedTuple, Optional, Union
+
+from bottle import Bottle, FormsDict, SimpleTemplate, http_date, parse_date, request, response
+from compression import CompressionPlugin
+from create_envs import get_settings
+from db_pool import close_pool, get_pool
+from db_router import close_router, get_router
+from feed_server import load_feed_records
+from metrics import (
+    CONTENT_TYPE,
+    DB_ERRORS,
+    DB_QUERY_SECONDS,
+    RequestTimingPlugin,
+    SharedMetrics,
+    timed,
+)
+from profiling import get_profiler, install_profiler
+from records_cache import (
+    DATA_CHANGED_CHANNEL,
+    CacheEntry,
+    NotifyListener,
+    QueryCache,
+    RecordsCache,
+)
+from records_export import EXPORT_FORMATS, stream_rows
+from records_feed import FeedFull, RecordFeed, busy_message, parse_last_event_id, stream_feed
+from records_query import Cursor, decode_cursor, fetch_records_page
+from records_search import SearchPage, normalize_query, search_records
+from records_stats import DailyStats, fetch_daily_stats
+from repository import LAST_20_RECORDS, Record, get_repository
+from static_assets import IMMUTABLE_CACHE_CONTROL, StaticAssets
+from wsgi_server import serve
 # Ensure there is no local file named 'bottle.py' in this directory or PYTHONPATH
 
 app = Bottle()
+app.install(RequestTimingPlugin())
+COMPRESSION = CompressionPlugin()
+app.install(COMPRESSION)
+# Counts requests toward PROFILE_UNITS; a no-op unless a capture is running.
+app.add_hook('after_request', lambda: get_profiler().tick())
+
+# Importing this module reads no configuration and opens no connections;
+# settings are loaded on first use and the caches are sized in start_worker.
+RECORDS_CACHE = RecordsCache()
+SEARCH_CACHE = QueryCache()
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+class RenderedPage(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: int
+
+
+RENDERED_PAGES: dict[int, RenderedPage] = {}
+# gthread workers render from several request threads at once.
+RENDERED_PAGES_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_export_slots() -> threading.BoundedSemaphore:
+    # Each running export holds a pooled connection until the download ends.
+    return threading.BoundedSemaphore(get_settings().export.max_concurrent)
 
-DB_CONFIG = import_envs_and_create_db_config()
 
+@functools.lru_cache(maxsize=None)
+def get_static_assets() -> StaticAssets:
+    return StaticAssets()
 
 
-def get_last_20_records():
+@functools.lru_cache(maxsize=None)
+def get_shared_metrics() -> SharedMetrics:
+    # Made in the server's master process before the workers fork, so every
+    # worker writes to, and a scrape reads from, the same directory.
+    path = get_settings().metrics.dir or tempfile.mkdtemp(prefix='frontend-metrics-')
+    return SharedMetrics(path)
+
+
+@functools.lru_cache(maxsize=None)
+def get_record_feed() -> RecordFeed:
+    settings = get_settings()
+    # Each open stream holds a server thread for as long as it lasts, so
+    # dashboards should use feed_server.py (FEED_URL) instead.
+    max_clients = settings.feed.max_clients or max(1, settings.server.threads // 2)
+    return RecordFeed(
+        load_feed_records,
+        max_clients=max_clients,
+        buffer_size=settings.feed.buffer_size,
+        poll_interval=settings.feed.poll_interval,
+    )
+
+
+def get_last_20_records() -> list[Record]:
+    # The page is reloaded right after a change notification from the
+    # primary, so it can ask for a fresher replica than other reads.
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute('SELECT name, date FROM data ORDER BY id DESC LIMIT 20')
-        rows = cur.fetchall()
+        with get_router().read_connection(get_settings().replica.latest_max_lag) as conn:
+            rows = get_repository().fetch(conn, LAST_20_RECORDS)
     except Exception as e:
         print(f"Error fetching records: {e}")
         rows = []
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
     return rows
 
+def invalidate_caches(payloads: Optional[list[str]] = None) -> None:
+    RECORDS_CACHE.invalidate()
+    SEARCH_CACHE.invalidate()
+    get_record_feed().wake()
+
+def start_records_listener() -> NotifyListener:
+    listener = NotifyListener(
+        DATA_CHANGED_CHANNEL,
+        invalidate_caches,
+        get_settings().db._asdict(),
+    )
+    listener.start()
+    return listener
+
+@app.route('/internal/stats')
+def internal_stats() -> dict[str, Any]:
+    return {
+        "db_pool": get_pool().stats(),
+        "replicas": get_router().stats(),
+        "records_cache": RECORDS_CACHE.stats(),
+        "search_cache": SEARCH_CACHE.stats(),
+        "feed": get_record_feed().stats(),
+        "compression": COMPRESSION.stats(),
+        "static": get_static_assets().stats(),
+        "repository": get_repository().stats(),
+    }
+
+@app.route('/metrics')
+def metrics() -> str:
+    response.content_type = CONTENT_TYPE
+    # Whichever worker answers reports the totals of all of them.
+    return get_shared_metrics().render()
+
+@functools.lru_cache(maxsize=None)
+def get_index_template() -> SimpleTemplate:
+    template = SimpleTemplate(name='index.tpl', lookup=[TEMPLATES_DIR])
+    template.co  # compile now rather than on the first render
+    return template
+
+def render_index(entry: CacheEntry) -> RenderedPage:
+    page = RENDERED_PAGES.get(entry.version)
+    if page is None:
+        feed_url = get_settings().feed.url
+        body = get_index_template().render(
+            records=entry.value,
+            assets=get_static_assets(),
+            # A JavaScript string literal, or None to leave the page static.
+            feed_url=json.dumps(feed_url) if feed_url else None,
+        ).encode('utf-8')
+        page = RenderedPage(
+            body=body,
+            etag='"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest(),
+            last_modified=int(entry.last_modified),
+        )
+        with RENDERED_PAGES_LOCK:
+            # A thread that rendered an older entry must not evict a newer page.
+            if all(version < entry.version for version in RENDERED_PAGES):
+                RENDERED_PAGES.clear()
+                RENDERED_PAGES[entry.version] = page
+    return page
+
+def is_not_modified(page: RenderedPage) -> bool:
+    if_none_match = request.get_header('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or page.etag in tags
+    if_modified_since = parse_date(request.get_header('If-Modified-Since', ''))
+    return if_modified_since is not None and page.last_modified <= if_modified_since
+
 @app.route('/')
-def index():
-    records = get_last_20_records()
-    tpl = '''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1">
-                <title>Last 20 Records</title>
-                <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-            </head>
-                <body class="bg-light">
-                    <div class="container py-5">
-                    <div class="row justify-content-center">
-                        <div class="col-md-8">
-                        <div class="card shadow">
-                            <div class="card-header bg-primary text-white text-center">
-                            <h2 class="mb-0">Last 20 Records</h2>
-                            </div>
-                            <div class="card-body">
-                            <table class="table table-striped table-hover align-middle">
-                                <thead class="table-dark">
-                                <tr>
-                                    <th>Name</th>
-                                    <th>Date</th>
-                                </tr>
-                                </thead>
-                                <tbody>
-                                % for name, date in records:
-                                <tr>
-                                    <td>{{name}}</td>
-                                    <td>{{date}}</td>
-                                </tr>
-                                % end
-                                </tbody>
-                            </table>
-                            </div>
-                        </div>
-                        </div>
-                    </div>
-                    </div>
-                    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-                </body>
-                </html>
-                '''
-    return SimpleTemplate(tpl).render(records=records)
+def index() -> bytes:
+    page = render_index(RECORDS_CACHE.get_entry(get_last_20_records))
+    response.set_header('ETag', page.etag)
+    response.set_header('Last-Modified', http_date(page.last_modified))
+    response.set_header('Cache-Control', 'no-cache')
+    if is_not_modified(page):
+        response.status = 304
+        return b''
+    return page.body
+
+@app.route('/static/<path>', skip=[COMPRESSION])
+def static_file(path: str) -> bytes:
+    """Fingerprinted assets, precompressed at build time and cached for a year."""
+    asset = get_static_assets().get(path)
+    if asset is None:
+        response.status = 404
+        return b''
+    encoding, body = asset.negotiate(request.get_header('Accept-Encoding', ''))
+    response.content_type = asset.content_type
+    response.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+    if len(asset.bodies) > 1:
+        response.set_header('Vary', 'Accept-Encoding')
+    if encoding != 'identity':
+        response.set_header('Content-Encoding', encoding)
+    return body
+
+@app.route('/api/feed')
+def api_feed() -> Union[bytes, Iterator[bytes]]:
+    """Server-Sent Events stream of rows inserted after the client connected."""
+    last_event_id = parse_last_event_id(request.get_header('Last-Event-ID'))
+    feed = get_record_feed()
+    response.content_type = 'text/event-stream'
+    response.set_header('Cache-Control', 'no-cache')
+    # Stop nginx-style proxies from buffering the stream.
+    response.set_header('X-Accel-Buffering', 'no')
+    try:
+        subscription = feed.subscribe(last_event_id)
+    except FeedFull as e:
+        # Not a 503: EventSource would give up instead of retrying later.
+        return busy_message(str(e))
+    return stream_feed(feed, subscription, get_settings().feed.heartbeat)
+
+MAX_PROFILE_SECONDS = 300
+
+def parse_profile_params(query: FormsDict) -> tuple[float, int]:
+    seconds = float(query.get('seconds') or get_settings().profiling.seconds)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+    requests = int(query.get('requests') or 0)
+    if requests < 0:
+        raise ValueError("requests must not be negative")
+    return seconds, requests
+
+@app.route('/internal/profile')
+def internal_profile() -> Union[str, dict[str, str]]:
+    """Sample this worker's threads and return folded stacks for a flamegraph.
+
+    Needs ``Authorization: Bearer $PROFILE_TOKEN``; without a configured
+    token the endpoint does not exist.
+    """
+    token = get_settings().profiling.token
+    if not token:
+        response.status = 404
+        return {"error": "profiling endpoint is disabled"}
+    supplied = request.get_header('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        response.status = 403
+        return {"error": "invalid profiling token"}
+    try:
+        seconds, requests = parse_profile_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    profile = get_profiler().capture(seconds, requests)
+    if profile is None:
+        response.status = 409
+        return {"error": "a profile capture is already running"}
+    response.content_type = 'text/plain; charset=UTF-8'
+    return profile
+
+def parse_limit(query: FormsDict) -> int:
+    config = get_settings().api
+    limit = int(query.get('limit') or config.page_size)
+    if not 1 <= limit <= config.max_page_size:
+        raise ValueError(f"limit must be between 1 and {config.max_page_size}")
+    return limit
+
+def parse_page_params(
+    query: FormsDict,
+) -> tuple[int, Optional[Cursor], Optional[date], Optional[date]]:
+    limit = parse_limit(query)
+    after = decode_cursor(query['cursor']) if query.get('cursor') else None
+    date_from = date.fromisoformat(query['from']) if query.get('from') else None
+    date_to = date.fromisoformat(query['to']) if query.get('to') else None
+    return limit, after, date_from, date_to
+
+@app.route('/api/records')
+def api_records() -> dict[str, Any]:
+    try:
+        limit, after, date_from, date_to = parse_page_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    try:
+        with get_router().read_connection() as conn, conn.cursor() as cur:
+            with timed(DB_QUERY_SECONDS, DB_ERRORS, query="records_page"):
+                page = fetch_records_page(cur, limit, after, date_from, date_to)
+    except Exception as e:
+        print(f"Error fetching records: {e}")
+        response.status = 503
+        return {"error": "database unavailable"}
+    return {"records": page.records, "next_cursor": page.next_cursor}
+
+def parse_search_params(query: FormsDict) -> tuple[str, int, int]:
+    config = get_settings().search
+    text = normalize_query(query.get('q') or '')
+    if not text:
+        raise ValueError("q is required")
+    if len(text) > config.max_query_length:
+        raise ValueError(f"q must be at most {config.max_query_length} characters")
+    limit = parse_limit(query)
+    page = int(query.get('page') or 1)
+    if not 1 <= page <= config.max_page:
+        raise ValueError(f"page must be between 1 and {config.max_page}")
+    return text, limit, page
+
+def load_search_page(text: str, limit: int, page: int) -> SearchPage:
+    with get_router().read_connection() as conn, conn.cursor() as cur:
+        with timed(DB_QUERY_SECONDS, DB_ERRORS, query="search"):
+            return search_records(
+                cur, text, limit, page, max_candidates=get_settings().search.max_candidates
+            )
+
+@app.route('/api/search')
+def api_search() -> dict[str, Any]:
+    try:
+        text, limit, page = parse_search_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    try:
+        result = SEARCH_CACHE.get_or_load(
+            (text, limit, page), lambda: load_search_page(text, limit, page)
+        )
+    except Exception as e:
+        print(f"Error searching records: {e}")
+        response.status = 503
+        return {"error": "database unavailable"}
+    return {
+        "query": text,
+        "results": result.results,
+        "page": result.page,
+        "next_page": result.next_page,
+    }
+
+def parse_export_params(query: FormsDict) -> tuple[str, Optional[date], Optional[date]]:
+    fmt = query.get('format') or 'csv'
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    date_from = date.fromisoformat(query['from']) if query.get('from') else None
+    date_to = date.fromisoformat(query['to']) if query.get('to') else None
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("from must not be after to")
+    return fmt, date_from, date_to
+
+def export_records(
+    connection: ExitStack,
+    conn: Any,
+    fmt: str,
+    date_from: Optional[date],
+    date_to: Optional[date],
+) -> Iterator[bytes]:
+    try:
+        with connection, timed(DB_QUERY_SECONDS, DB_ERRORS, query="export"):
+            yield from stream_rows(
+                conn, fmt, date_from, date_to, get_settings().export.itersize
+            )
+    except Exception as e:
+        # Headers are already sent; re-raising makes the server drop the
+        # connection so the client sees a truncated download, not a short one.
+        print(f"Error exporting records: {e}")
+        raise
+    finally:
+        get_export_slots().release()
+
+@app.route('/api/export')
+def api_export() -> Union[dict[str, str], Iterator[bytes]]:
+    try:
+        fmt, date_from, date_to = parse_export_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    if not get_export_slots().acquire(blocking=False):
+        response.status = 429
+        return {"error": "too many exports in progress"}
+    # Entered here so a database outage is still a 503; the stream exits it.
+    connection = ExitStack()
+    try:
+        conn = connection.enter_context(get_router().read_connection())
+    except Exception as e:
+        get_export_slots().release()
+        print(f"Error connecting to database: {e}")
+        response.status = 503
+        return {"error": "database unavailable"}
+    response.content_type = EXPORT_FORMATS[fmt]
+    response.set_header('Content-Disposition', f'attachment; filename="data.{fmt}"')
+    return export_records(connection, conn, fmt, date_from, date_to)
+
+def parse_stats_params(query: FormsDict) -> tuple[date, date]:
+    config = get_settings().stats
+    days = int(query.get('days') or config.default_days)
+    if not 1 <= days <= config.max_days:
+        raise ValueError(f"days must be between 1 and {config.max_days}")
+    date_to = date.fromisoformat(query['to']) if query.get('to') else date.today()
+    return date_to - timedelta(days=days - 1), date_to
+
+def load_daily_stats(date_from: date, date_to: date) -> DailyStats:
+    # Reads the per-day summary table, never ``data`` itself, so the cost
+    # depends on the number of days asked for rather than the table size.
+    with get_router().read_connection() as conn, conn.cursor() as cur:
+        with timed(DB_QUERY_SECONDS, DB_ERRORS, query="daily_stats"):
+            return fetch_daily_stats(cur, date_from, date_to)
+
+@app.route('/api/stats')
+def api_stats() -> dict[str, Any]:
+    try:
+        date_from, date_to = parse_stats_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    try:
+        stats = load_daily_stats(date_from, date_to)
+    except Exception as e:
+        print(f"Error fetching stats: {e}")
+        response.status = 503
+        return {"error": "database unavailable"}
+    return {
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "total": stats.total,
+        "window_total": stats.window_total,
+        "days": stats.days,
+    }
+
+@functools.lru_cache(maxsize=None)
+def get_stats_template() -> SimpleTemplate:
+    template = SimpleTemplate(name='stats.tpl', lookup=[TEMPLATES_DIR])
+    template.co
+    return template
+
+@app.route('/stats')
+def stats_page() -> Union[str, dict[str, str]]:
+    try:
+        date_from, date_to = parse_stats_params(request.query)
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    try:
+        stats = load_daily_stats(date_from, date_to)
+    except Exception as e:
+        print(f"Error fetching stats: {e}")
+        response.status = 503
+        stats = None
+    page: str = get_stats_template().render(
+        stats=stats, date_from=date_from, date_to=date_to, assets=get_static_assets()
+    )
+    return page
+
+def start_worker() -> None:
+    # Runs in each server process after fork: connections and the listener
+    # thread must not be shared between processes.
+    settings = get_settings()
+    RECORDS_CACHE.ttl = settings.cache.ttl
+    SEARCH_CACHE.maxsize = settings.search.cache_size
+    SEARCH_CACHE.ttl = settings.search.cache_ttl
+    COMPRESSION.min_size = settings.compression.min_size
+    COMPRESSION.gzip_level = settings.compression.gzip_level
+    COMPRESSION.brotli_quality = settings.compression.brotli_quality
+    try:
+        get_pool().warm()
+    except Exception as e:
+        print(f"Error warming connection pool: {e}")
+    get_shared_metrics().start()
+    get_record_feed().start()
+    if settings.cache.listen:
+        start_records_listener()
+    get_static_assets()
+    get_index_template()
+    get_stats_template()
+
+def stop_worker() -> None:
+    get_shared_metrics().stop()
+    close_router()
+    close_pool()
 
 if __name__ == '__main__':
-    run(app, host='0.0.0.0', port=8080, debug=True)
+    get_shared_metrics().reset()
+    serve(app, get_settings().server._asdict(), start_worker, stop_worker, install_profiler)
@@ -0,0 +1,265 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, NamedTuple, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import (
+    HTTP_CLIENT_CACHE_HITS,
+    HTTP_CLIENT_CIRCUIT_OPEN,
+    HTTP_CLIENT_ERRORS,
+    HTTP_CLIENT_RETRIES,
+    HTTP_CLIENT_SECONDS,
+    timed,
+)
+
+# Worth another attempt: the upstream is overloaded or restarting, or a
+# proxy in front of it is. Any other 4xx is our fault and will not improve.
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class FetchError(Exception):
+    """The upstream did not produce a usable response.
+
+    Callers catch this instead of inspecting return values, so a failure can
+    never be mistaken for data.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        source: str,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.source = source
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(FetchError):
+    """Rejected without a request while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after ``failure_threshold`` failures in a row.
+
+    Once open, requests are rejected for ``reset_timeout`` seconds. After
+    that a single trial request is let through (half-open): success closes
+    the circuit, failure opens it for another ``reset_timeout``.
+    """
+
+    def __init__(
+        self,
+        source: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.source = source
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if self.clock() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+        HTTP_CLIENT_CIRCUIT_OPEN.set(0, source=self.source)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if not self._trial and self.failures < self.failure_threshold:
+                return
+            self.opened_at = self.clock()
+            self._trial = False
+        HTTP_CLIENT_CIRCUIT_OPEN.set(1, source=self.source)
+
+
+class CachedResponse(NamedTuple):
+    payload: Any
+    etag: Optional[str]
+    expires: float
+
+
+def cache_lifetime(headers: Any) -> Optional[float]:
+    """Seconds a response may be reused, or None if it must not be stored."""
+    directives = {}
+    for part in headers.get("Cache-Control", "").lower().split(","):
+        key, _, value = part.strip().partition("=")
+        directives[key] = value.strip('"')
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    try:
+        return max(0.0, float(directives.get("max-age", 0)))
+    except ValueError:
+        return 0.0
+
+
+class ResilientClient:
+    """JSON-over-HTTP client for flaky upstreams.
+
+    One ``requests.Session`` keeps connections alive across calls. Failed
+    attempts (connection errors, timeouts, 429 and 5xx) are retried up to
+    ``retries`` times with full-jitter exponential backoff, honouring a
+    ``Retry-After`` up to ``backoff_max``. Each source has its own circuit
+    breaker. Responses are only cached when the upstream allows it through
+    ``Cache-Control: max-age``; an ``ETag`` is revalidated with
+    ``If-None-Match``. Every failure surfaces as ``FetchError``.
+    """
+
+    def __init__(
+        self,
+        name: str = "http",
+        timeout: float = 10.0,
+        verify: Union[bool, str] = True,
+        retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        pool_size: int = 10,
+        cache_size: int = 128,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache_size = cache_size
+        self.sleep = sleep
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._cache: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def breaker(self, source: Optional[str] = None) -> CircuitBreaker:
+        source = source or self.name
+        with self._lock:
+            if source not in self._breakers:
+                self._breakers[source] = CircuitBreaker(
+                    source, self.failure_threshold, self.reset_timeout
+                )
+            return self._breakers[source]
+
+    def get_json(
+        self, url: str, timeout: Optional[float] = None, source: Optional[str] = None
+    ) -> Any:
+        source = source or self.name
+        cached = self._cached(url)
+        if cached is not None and cached.expires > time.monotonic():
+            HTTP_CLIENT_CACHE_HITS.inc(source=source)
+            return cached.payload
+        breaker = self.breaker(source)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"circuit open for {source}", source)
+            try:
+                payload = self._attempt(url, timeout or self.timeout, source, cached)
+            except FetchError as e:
+                breaker.record_failure()
+                if not e.retryable or attempt == self.retries:
+                    raise
+                HTTP_CLIENT_RETRIES.inc(source=source)
+                self.sleep(self._delay(attempt, e.retry_after))
+                continue
+            breaker.record_success()
+            return payload
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _attempt(
+        self, url: str, timeout: float, source: str, cached: Optional[CachedResponse]
+    ) -> Any:
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+        try:
+            with timed(HTTP_CLIENT_SECONDS, HTTP_CLIENT_ERRORS, source=source):
+                resp = self.session.get(url, timeout=timeout, headers=headers)
+                if resp.status_code == 304 and cached is not None:
+                    payload = cached.payload
+                elif resp.status_code >= 400:
+                    raise FetchError(
+                        f"{source} returned HTTP {resp.status_code}",
+                        source,
+                        retryable=resp.status_code in RETRYABLE_STATUSES,
+                        retry_after=_retry_after(resp.headers),
+                    )
+                else:
+                    payload = resp.json()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise FetchError(f"{source} unreachable: {e}", source, retryable=True) from e
+        except (requests.RequestException, ValueError) as e:
+            # Includes malformed JSON: a 200 that is not the API answering.
+            raise FetchError(f"{source} sent an invalid response: {e}", source) from e
+        self._store(url, payload, resp.headers)
+        return payload
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: clients that failed together do not retry together.
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def _cached(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+            return entry
+
+    def _store(self, url: str, payload: Any, headers: Any) -> None:
+        lifetime = cache_lifetime(headers)
+        etag = headers.get("ETag")
+        with self._lock:
+            if lifetime is None or (lifetime == 0 and etag is None) or self.cache_size <= 0:
+                self._cache.pop(url, None)
+                return
+            self._cache[url] = CachedResponse(payload, etag, time.monotonic() + lifetime)
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    try:
+        return max(0.0, float(headers.get("Retry-After", "")))
+    except ValueError:
+        return None
@@ -0,0 +1,297 @@
+import io
+import threading
+import time
+from datetime import date
+from typing import Any, Optional
+
+from psycopg2 import InterfaceError, OperationalError, sql
+from psycopg2.extras import execute_values
+
+from db_pool import ConnectionPool, PoolTimeout, get_pool
+from dedupe import Deduplicator, is_valid_record
+from metrics import DB_ERRORS, DB_QUERY_SECONDS, ROWS_INSERTED, timed
+from spool import REJECTED_ERRORS, DiskSpool, SpoolFull
+
+WRITE_METHODS = ("values", "copy")
+# The database is down, unreachable or out of connections; the same rows
+# will go in later. Only these send a batch to the spool.
+UNAVAILABLE_ERRORS: tuple[type[Exception], ...] = (OperationalError, InterfaceError, PoolTimeout)
+
+
+def _copy_escape(value: Any) -> str:
+    text = str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def rows_to_copy_buffer(rows: list[tuple[Any, ...]]) -> io.StringIO:
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_escape(value) for value in row))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+class BufferedWriter:
+    """Collects ``(name, date)`` rows and writes them in batches.
+
+    A batch is flushed when ``batch_size`` rows are pending or when the
+    oldest pending row is ``flush_interval`` seconds old, whichever comes
+    first. Rows from a failed flush stay buffered and are retried with the
+    next batch; past ``max_pending`` the oldest rows are dropped.
+
+    Invalid rows (empty, oversized, fetch error messages) are rejected and
+    repeats are filtered by the deduplicator before they are buffered; the
+    table's dedupe trigger skips anything already stored.
+
+    A batch refused for its content (``REJECTED_ERRORS``) is split until the
+    rows at fault are found; those alone are dropped, or dead-lettered in
+    the spool. With a ``spool``, a batch the database cannot take right now
+    (``UNAVAILABLE_ERRORS``) is appended to disk instead, and for
+    ``retry_after`` seconds further batches go straight there without
+    waiting on the database. Once the writer thread runs,
+    ``add`` never writes itself: a full batch wakes the thread, and rows
+    piling up behind a slow write are spooled rather than dropped.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[ConnectionPool] = None,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        method: str = "values",
+        max_pending: Optional[int] = None,
+        table: str = "data",
+        deduplicator: Optional[Deduplicator] = None,
+        spool: Optional[DiskSpool] = None,
+        retry_after: float = 5.0,
+    ) -> None:
+        if method not in WRITE_METHODS:
+            raise ValueError(
+                f"Unknown write method {method!r}, expected one of {WRITE_METHODS}"
+            )
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.max_pending = max_pending or batch_size * 10
+        self.table = table
+        self.deduplicator = deduplicator or Deduplicator()
+        self.spool = spool
+        self.retry_after = retry_after
+        self._unhealthy_until = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: list[tuple[str, date]] = []
+        self._oldest: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "rows_written": 0,
+            "batches": 0,
+            "errors": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "spooled": 0,
+            "refused": 0,
+        }
+
+    @property
+    def pool(self) -> ConnectionPool:
+        return self._pool or get_pool()
+
+    def add(self, name: str, date_value: date) -> None:
+        name = name.strip()
+        if not is_valid_record(name):
+            with self._lock:
+                self._stats["rejected"] += 1
+            return
+        if self.deduplicator.seen(name):
+            return
+        with self._lock:
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((name, date_value))
+            full = len(self._pending) >= self.batch_size
+            spill = None
+            if self.spool is not None and len(self._pending) >= self.max_pending:
+                spill, self._pending = self._pending, []
+                self._oldest = None
+        if spill:
+            try:
+                self._spool(spill)
+            except SpoolFull as e:
+                print(f"Error spooling {len(spill)} rows: {e}")
+                self._requeue(spill)
+        elif full and self.spool is not None and self._thread is not None:
+            self._wake_event.set()
+        elif full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def is_due(self) -> bool:
+        with self._lock:
+            return (
+                self._oldest is not None
+                and time.monotonic() - self._oldest >= self.flush_interval
+            )
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                self._oldest = None
+            if not rows:
+                return 0
+            try:
+                return self.write(rows)
+            except Exception as e:
+                print(f"Error flushing {len(rows)} rows: {e}")
+                self._requeue(rows)
+                return 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="buffered-writer", daemon=True
+            )
+            self._thread.start()
+
+    def close(self) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            stats: dict[str, float] = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats.update(
+            {f"dedupe_{key}": value for key, value in self.deduplicator.stats().items()}
+        )
+        return stats
+
+    def write(self, rows: list[tuple[str, date]]) -> int:
+        """Insert ``rows`` in one transaction and return how many were new.
+
+        With a spool, rows the database cannot take are spooled (and 0
+        returned); only a full spool raises.
+        """
+        if self.spool is None:
+            return self.insert_isolating(rows)
+        if time.monotonic() < self._unhealthy_until:
+            self._spool(rows)
+            return 0
+        try:
+            return self.insert_isolating(rows)
+        except UNAVAILABLE_ERRORS as e:
+            print(f"Error writing {len(rows)} rows, spooling them: {e}")
+            self._unhealthy_until = time.monotonic() + self.retry_after
+            with self._lock:
+                self._stats["errors"] += 1
+            self._spool(rows)
+            return 0
+
+    def replay(self, rows: list[tuple[str, date]]) -> int:
+        """Sink for the spool replayer; a successful COPY means the database is back."""
+        inserted = self.insert_isolating(rows, method="copy")
+        self._unhealthy_until = 0.0
+        return inserted
+
+    def insert_isolating(
+        self, rows: list[tuple[str, date]], method: Optional[str] = None
+    ) -> int:
+        """Like ``insert``, but a batch refused for its content is halved until
+        the rows at fault are found, so they alone are set aside."""
+        try:
+            return self.insert(rows, method)
+        except REJECTED_ERRORS as e:
+            if len(rows) == 1:
+                self._refuse(rows, e)
+                return 0
+            middle = len(rows) // 2
+            return self.insert_isolating(rows[:middle], method) + self.insert_isolating(
+                rows[middle:], method
+            )
+
+    def insert(self, rows: list[tuple[str, date]], method: Optional[str] = None) -> int:
+        method = method or self.method
+        pool = self.pool
+        conn = pool.getconn()
+        try:
+            with timed(DB_QUERY_SECONDS, DB_ERRORS, query=f"insert_{method}"), conn:
+                with conn.cursor() as cur:
+                    table = sql.Identifier(self.table)
+                    if method == "copy":
+                        cur.copy_expert(
+                            sql.SQL("COPY {} (name, date) FROM STDIN").format(table),
+                            rows_to_copy_buffer(rows),
+                        )
+                    else:
+                        execute_values(
+                            cur,
+                            sql.SQL("INSERT INTO {} (name, date) VALUES %s").format(table),
+                            rows,
+                            page_size=len(rows),
+                        )
+                    inserted: int = cur.rowcount
+        finally:
+            pool.putconn(conn)
+        ROWS_INSERTED.inc(inserted, method=method)
+        self.deduplicator.record_db_duplicates(len(rows) - inserted)
+        with self._lock:
+            self._stats["rows_written"] += inserted
+            self._stats["batches"] += 1
+        return inserted
+
+    def _run(self) -> None:
+        tick = min(self.flush_interval, 1.0)
+        while not self._stop_event.is_set():
+            self._wake_event.wait(tick)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                return
+            if self.is_due() or self.pending() >= self.batch_size:
+                self.flush()
+
+    def _spool(self, rows: list[tuple[str, date]]) -> None:
+        if self.spool is None:
+            raise SpoolFull("no spool configured")
+        self.spool.append(rows)
+        with self._lock:
+            self._stats["spooled"] += len(rows)
+
+    def _refuse(self, rows: list[tuple[str, date]], error: Exception) -> None:
+        with self._lock:
+            self._stats["refused"] += len(rows)
+        if self.spool is not None:
+            self.spool.dead_letter(rows, str(error).strip().split("\n")[0])
+        else:
+            print(f"Dropping {len(rows)} rows the database refused: {error}")
+
+    def _requeue(self, rows: list[tuple[str, date]]) -> None:
+        with self._lock:
+            self._stats["errors"] += 1
+            pending = rows + self._pending
+            overflow = len(pending) - self.max_pending
+            if overflow > 0:
+                print(f"Dropping {overflow} buffered rows: pending limit reached")
+                self._stats["dropped"] += overflow
+                pending = pending[overflow:]
+            self._pending = pending
+            if pending:
+                self._oldest = time.monotonic()
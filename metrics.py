@@ -0,0 +1,523 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import bottle
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cached page render up to a slow external API call.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _copy(value: Any) -> Any:
+    return list(value) if isinstance(value, list) else value
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name!r} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, metric: "_Metric") -> None:
+        with self._lock:
+            self._metrics.pop(metric.name, None)
+
+    def kind(self, name: str) -> Optional[str]:
+        with self._lock:
+            metric = self._metrics.get(name)
+        return metric.kind if metric is not None else None
+
+    def snapshot(self) -> dict[str, list[list[Any]]]:
+        """Every metric's values as JSON-friendly ``[labels, value]`` pairs."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+            for metric in metrics
+        }
+
+    def render(self, others: Iterable[dict[str, list[list[Any]]]] = ()) -> str:
+        """Text exposition of this registry, plus ``others`` (snapshots from
+        other processes) merged into it."""
+        others = list(others)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            values = metric.snapshot()
+            for other in others:
+                for key, value in other.get(metric.name, ()):
+                    metric.merge(values, tuple(key), value)
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.format(values))
+        return "\n".join(lines) + "\n"
+
+    def merge(
+        self, snapshots: Iterable[dict[str, list[list[Any]]]]
+    ) -> dict[str, list[list[Any]]]:
+        """``snapshots`` added up into one, in the form ``snapshot`` returns."""
+        with self._lock:
+            metrics = dict(self._metrics)
+        merged: dict[str, dict[tuple[str, ...], Any]] = {}
+        for snapshot in snapshots:
+            for name, pairs in snapshot.items():
+                metric = metrics.get(name)
+                if metric is None:
+                    continue
+                values = merged.setdefault(name, {})
+                for key, value in pairs:
+                    metric.merge(values, tuple(key), value)
+        return {
+            name: [[list(key), value] for key, value in values.items()]
+            for name, values in merged.items()
+        }
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+    _values: dict[tuple[str, ...], Any]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict[tuple[str, ...], Any]:
+        with self._lock:
+            return {key: _copy(value) for key, value in self._values.items()}
+
+    def merge(self, values: dict[tuple[str, ...], Any], key: tuple[str, ...], value: Any) -> None:
+        """Add another process's ``value`` for ``key`` into ``values``."""
+        values[key] = values.get(key, 0) + value
+
+    def format(self, values: dict[tuple[str, ...], Any]) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+    def samples(self) -> list[str]:
+        return self.format(self.snapshot())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from ``callback`` on scrape.
+
+    Across processes the values are summed, or the largest is taken with
+    ``aggregate="max"``.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        *args: Any,
+        callback: Optional[Callable[[], float]] = None,
+        aggregate: str = "sum",
+        **kwargs: Any,
+    ) -> None:
+        if aggregate not in ("sum", "max"):
+            raise ValueError(f"Unknown gauge aggregate {aggregate!r}")
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self.aggregate = aggregate
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def snapshot(self) -> dict[tuple[str, ...], Any]:
+        if self.callback is not None:
+            return {(): self.callback()}
+        return super().snapshot()
+
+    def merge(self, values: dict[tuple[str, ...], Any], key: tuple[str, ...], value: Any) -> None:
+        if self.aggregate == "max" and key in values:
+            values[key] = max(values[key], value)
+        else:
+            super().merge(values, key, value)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; ``observe`` is a bisect and three adds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, *args: Any, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Per label set: [count per bucket..., sum]; buckets are not cumulative
+        # until rendered so each observation touches a single slot.
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            slots = self._values.get(key)
+            if slots is None:
+                slots = self._values[key] = [0] * len(self.buckets) + [0.0]
+            slots[index] += 1
+            slots[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: Any) -> int:
+        with self._lock:
+            slots = self._values.get(self._key(labels))
+            return int(sum(slots[:-1])) if slots else 0
+
+    def merge(self, values: dict[tuple[str, ...], Any], key: tuple[str, ...], value: Any) -> None:
+        slots = values.get(key)
+        values[key] = list(value) if slots is None else [a + b for a, b in zip(slots, value)]
+
+    def format(self, values: dict[tuple[str, ...], Any]) -> list[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, slots in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, slots):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(slots[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time spent running a database query.", ("query",)
+)
+DB_ERRORS = Counter("db_errors_total", "Database queries that raised an error.", ("query",))
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "Queries slower than DB_SLOW_QUERY_MS.", ("query",)
+)
+HTTP_CLIENT_SECONDS = Histogram(
+    "http_client_request_duration_seconds", "Outgoing HTTP request latency.", ("source",)
+)
+HTTP_CLIENT_ERRORS = Counter(
+    "http_client_errors_total", "Outgoing HTTP requests that failed.", ("source",)
+)
+HTTP_CLIENT_RETRIES = Counter(
+    "http_client_retries_total", "Outgoing HTTP requests retried after a failure.", ("source",)
+)
+HTTP_CLIENT_CACHE_HITS = Counter(
+    "http_client_cache_hits_total", "Outgoing HTTP requests answered from cache.", ("source",)
+)
+HTTP_CLIENT_CIRCUIT_OPEN = Gauge(
+    "http_client_circuit_open",
+    "1 while the circuit breaker rejects requests.",
+    ("source",),
+    aggregate="max",
+)
+DB_READS = Counter(
+    "db_reads_total", "Read connections handed out, by primary or replica.", ("target",)
+)
+ROWS_INSERTED = Counter("rows_inserted_total", "Rows written to the data table.", ("method",))
+SPOOL_ROWS = Counter(
+    "ingest_spool_rows_total", "Rows written to or replayed from the disk spool.", ("action",)
+)
+SPOOL_BYTES = Gauge("ingest_spool_bytes", "Bytes waiting in the disk spool for replay.")
+FEED_CLIENTS = Gauge("feed_clients", "Open live feed streams.")
+FEED_EVICTIONS = Counter("feed_evictions_total", "Live feed clients dropped for falling behind.")
+INGEST_SHARDS_OWNED = Gauge("ingest_shards_owned", "Ingest shards leased by this worker.")
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an incoming HTTP request.",
+    ("method", "route", "status"),
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, errors: Optional[Counter] = None, **labels: Any) -> Iterator[None]:
+    """Observe the block's duration, and count it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+class RequestTimingPlugin:
+    """Bottle plugin that records ``HTTP_REQUEST_SECONDS`` for every route.
+
+    Routes are labelled by their rule (``/api/records``), not the raw path,
+    so the number of series stays bounded.
+    """
+
+    name = "metrics"
+    api = 2
+
+    def __init__(self, histogram: Histogram = HTTP_REQUEST_SECONDS) -> None:
+        self.histogram = histogram
+
+    def apply(self, callback: Callable[..., Any], route: bottle.Route) -> Callable[..., Any]:
+        histogram = self.histogram
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            status = 500
+            try:
+                result = callback(*args, **kwargs)
+                status = bottle.response.status_code
+                return result
+            except bottle.HTTPResponse as e:
+                status = e.status_code
+                raise
+            finally:
+                histogram.observe(
+                    time.perf_counter() - started,
+                    method=route.method,
+                    route=route.rule,
+                    status=status,
+                )
+
+        return wrapper
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """Lets any worker of a pre-forking server answer ``/metrics`` for all of them.
+
+    Each worker writes its registry to ``<path>/<pid>.json`` every
+    ``interval`` seconds and when it exits; a scrape merges the other
+    workers' files into its own live values. Counters and histograms of
+    workers that have exited stay in the sum, so totals do not go backwards
+    when gunicorn replaces a worker; their gauges are dropped.
+
+    The scrape that finds an exited worker adds its file to
+    ``<path>/exited.json`` and removes it, so a scrape reads one file per
+    live worker however often workers are recycled.
+    """
+
+    EXITED = "exited.json"
+
+    def __init__(self, path: str, registry: Registry = REGISTRY, interval: float = 5.0) -> None:
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(path, exist_ok=True)
+
+    def reset(self) -> None:
+        """Forget a previous run's workers; call once, before forking."""
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.path, name))
+
+    def start(self) -> None:
+        if self._thread is None:
+            # An exited worker whose pid we were given: keep its counters
+            # instead of overwriting them.
+            with self._locked():
+                if self._read(f"{os.getpid()}.json") is not None:
+                    self._fold([f"{os.getpid()}.json"])
+            self.write()
+            self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write(exited=True)
+
+    def write(self, exited: bool = False) -> None:
+        pid = os.getpid()
+        self._dump(f"{pid}.json", {"pid": pid, "exited": exited, "metrics": self.registry.snapshot()})
+
+    def others(self) -> list[dict[str, list[list[Any]]]]:
+        """Snapshots of every other live worker, plus the sum of the exited ones."""
+        snapshots = []
+        exited = []
+        # Folding happens under the lock, so no file is counted twice.
+        with self._locked():
+            for name in os.listdir(self.path):
+                if not name.endswith(".json") or name in (f"{os.getpid()}.json", self.EXITED):
+                    continue
+                data = self._read(name)
+                if data is None:
+                    continue
+                if data["exited"] or not _is_running(data["pid"]):
+                    exited.append(name)
+                else:
+                    snapshots.append(data["metrics"])
+            if exited:
+                self._fold(exited)
+            folded = self._read(self.EXITED)
+        if folded is not None:
+            snapshots.append(folded["metrics"])
+        return snapshots
+
+    def render(self) -> str:
+        return self.registry.render(self.others())
+
+    def _fold(self, names: list[str]) -> None:
+        # Add exited workers' counters and histograms to EXITED, then drop
+        # their files. Call with the lock held.
+        folded = self._read(self.EXITED)
+        snapshots = [folded["metrics"]] if folded is not None else []
+        for name in names:
+            data = self._read(name)
+            if data is not None:
+                snapshots.append({
+                    metric: values
+                    for metric, values in data["metrics"].items()
+                    if self.registry.kind(metric) != "gauge"
+                })
+        self._dump(self.EXITED, {"pid": None, "exited": True, "metrics": self.registry.merge(snapshots)})
+        for name in names:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.path, "fold.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read(self, name: str) -> Optional[dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                data: dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None  # removed or replaced while we listed the directory
+        return data
+
+    def _dump(self, name: str, data: dict[str, Any]) -> None:
+        path = os.path.join(self.path, name)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error writing metrics snapshot: {e}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_http_server(
+    port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread, for processes without a web app."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,425 @@
+"""Versioned schema migrations.
+
+    python migrations.py             # apply pending migrations, then partition upkeep
+    python migrations.py --status    # list applied and pending migrations
+    python migrations.py --target 3  # stop after version 3
+
+Run it once per deploy (the Kubernetes manifests use an init container)
+rather than from every process. Each applied version is recorded in
+``schema_migrations``; a session-level advisory lock lets only one runner
+work at a time, so replicas starting together do not race.
+"""
+import argparse
+import functools
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Callable, Iterator, NamedTuple, Optional, Sequence
+
+import psycopg2
+from psycopg2 import sql
+
+from coordination import LEASE_SCHEMA_STATEMENTS
+from create_envs import PartitionSettings, get_settings
+from dedupe import DEDUPE_BACKFILL_STATEMENTS, DEDUPE_TRIGGER_STATEMENTS
+from partitions import apply_retention, create_partitioned_table, create_partitions
+from records_cache import DATA_CHANGED_CHANNEL
+from records_query import RECORDS_INDEX_DEFINITION, RECORDS_INDEX_NAME
+from records_search import (
+    SEARCH_BACKFILL_ASSIGNMENTS,
+    SEARCH_BACKFILL_PENDING,
+    SEARCH_COLUMN_STATEMENTS,
+    SEARCH_INDEX_DEFINITION,
+    SEARCH_INDEX_NAME,
+)
+from records_stats import (
+    DAILY_COUNTS_BACKFILL_STATEMENTS,
+    DAILY_COUNTS_SLOT_STATEMENTS,
+    DAILY_COUNTS_TRIGGER_STATEMENTS,
+)
+
+# Arbitrary, but unique among the advisory locks taken in this database.
+MIGRATION_LOCK_ID = 4_242_001
+BACKFILL_BATCH_SIZE = 5000
+
+CREATE_MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+APPLIED_SQL = "SELECT version, applied_at FROM schema_migrations ORDER BY version"
+RECORD_SQL = "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)"
+TRY_LOCK_SQL = "SELECT pg_try_advisory_lock(%s)"
+UNLOCK_SQL = "SELECT pg_advisory_unlock(%s)"
+RELKIND_SQL = "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)"
+INVALID_INDEX_SQL = (
+    "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid"
+)
+CHILD_TABLES_SQL = """
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname
+"""
+# Partitions whose index is already attached to the partitioned index.
+INDEXED_CHILD_TABLES_SQL = """
+    SELECT t.relname FROM pg_inherits i
+    JOIN pg_index x ON x.indexrelid = i.inhrelid
+    JOIN pg_class t ON t.oid = x.indrelid
+    WHERE i.inhparent = to_regclass(%s)
+"""
+BACKFILL_SQL = sql.SQL("""
+    WITH batch AS (
+        SELECT {key} FROM {table} WHERE {after} ({pending})
+        ORDER BY {key} LIMIT %s
+    )
+    UPDATE {table} SET {assignments} FROM batch WHERE {table}.{key} = batch.{key}
+    RETURNING {table}.{key}
+""")
+
+# The schema from before versioned migrations, so existing databases record
+# it as applied without changes. Backfills go first, while writes carry on.
+# The explicit lock then blocks writes until commit; taking it before anything
+# touches data_hashes keeps the order writers use (data, then data_hashes), so
+# the two cannot deadlock.
+TRIGGER_SCHEMA_STATEMENTS = [
+    *DAILY_COUNTS_BACKFILL_STATEMENTS,
+    *DEDUPE_BACKFILL_STATEMENTS,
+    "LOCK TABLE data IN SHARE ROW EXCLUSIVE MODE",
+    *DEDUPE_TRIGGER_STATEMENTS,
+    *DAILY_COUNTS_TRIGGER_STATEMENTS,
+    f"""
+    CREATE OR REPLACE FUNCTION notify_data_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{DATA_CHANGED_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER data_changed_notify
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON data
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_data_changed()
+    """,
+]
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration(NamedTuple):
+    """One schema version. ``apply`` gets the connection.
+
+    A transactional migration runs in one transaction together with its
+    ``schema_migrations`` row. Otherwise ``apply`` runs in autocommit mode
+    (needed for ``CREATE INDEX CONCURRENTLY``) and is recorded afterwards,
+    so it has to be safe to rerun after a crash half way through.
+    """
+
+    version: int
+    name: str
+    apply: Callable[..., object]
+    transactional: bool = True
+
+
+def run_statements(conn: Any, statements: Sequence[str]) -> None:
+    with conn.cursor() as cur:
+        for statement in statements:
+            cur.execute(statement)
+
+
+def build_index_concurrently(conn: Any, index: str, table: str, definition: str) -> None:
+    """Build ``index`` without blocking writes; ``conn`` must be in autocommit.
+
+    Postgres cannot build an index on a partitioned table concurrently, so
+    for one the parent index is created ``ON ONLY`` the parent (instant, and
+    invalid until complete), each partition is indexed concurrently and its
+    index attached. Partitions created meanwhile get the index automatically,
+    and the parent index turns valid once every partition has it.
+    """
+    with conn.cursor() as cur:
+        cur.execute(RELKIND_SQL, (table,))
+        row = cur.fetchone()
+        if not row or row[0] != "p":
+            _create_index_concurrently(cur, index, table, definition)
+            return
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {index} ON ONLY {table} {definition}")
+        cur.execute(INDEXED_CHILD_TABLES_SQL, (index,))
+        indexed = {name for (name,) in cur.fetchall()}
+        cur.execute(CHILD_TABLES_SQL, (table,))
+        for (partition,) in cur.fetchall():
+            if partition in indexed:
+                continue
+            suffix = index[len(table):] if index.startswith(f"{table}_") else f"_{index}"
+            child = f"{partition}{suffix}"
+            _create_index_concurrently(cur, child, partition, definition)
+            cur.execute(f"ALTER INDEX {index} ATTACH PARTITION {child}")
+
+
+def _create_index_concurrently(cur: Any, index: str, table: str, definition: str) -> None:
+    # A failed concurrent build leaves an invalid index behind, which
+    # IF NOT EXISTS would then keep forever.
+    cur.execute(INVALID_INDEX_SQL, (index,))
+    if cur.fetchone():
+        cur.execute(f"DROP INDEX CONCURRENTLY {index}")
+    cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} {definition}")
+
+
+def backfill_in_batches(
+    conn: Any,
+    table: str,
+    assignments: str,
+    pending: str = "true",
+    key: str = "id",
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause: float = 0.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> int:
+    """Run ``UPDATE table SET assignments`` over rows matching ``pending``.
+
+    Rows are walked in ``key`` order, ``batch_size`` at a time, and each batch
+    commits on its own. Row locks are held for one batch only, and vacuum and
+    replicas keep up in between (``pause`` gives them extra time). A rerun
+    after a crash only redoes rows that still match ``pending``. Returns the
+    number of rows updated.
+    """
+    names = {
+        "table": sql.Identifier(table),
+        "key": sql.Identifier(key),
+        "assignments": sql.SQL(assignments),
+        "pending": sql.SQL(pending),
+    }
+    first = BACKFILL_SQL.format(after=sql.SQL(""), **names)
+    rest = BACKFILL_SQL.format(after=sql.SQL("{} > %s AND").format(names["key"]), **names)
+    after, total = None, 0
+    while True:
+        with conn:
+            with conn.cursor() as cur:
+                if after is None:
+                    cur.execute(first, (batch_size,))
+                else:
+                    cur.execute(rest, (after, batch_size))
+                keys = [row[0] for row in cur.fetchall()]
+        if not keys:
+            return total
+        total += len(keys)
+        after = max(keys)
+        if pause:
+            sleep(pause)
+
+
+def sql_migration(version: int, name: str, *statements: str) -> Migration:
+    return Migration(version, name, functools.partial(run_statements, statements=statements))
+
+
+def index_migration(version: int, name: str, index: str, table: str, definition: str) -> Migration:
+    apply = functools.partial(
+        build_index_concurrently, index=index, table=table, definition=definition
+    )
+    return Migration(version, name, apply, transactional=False)
+
+
+def backfill_migration(
+    version: int, name: str, table: str, assignments: str, pending: str, **options: Any
+) -> Migration:
+    apply = functools.partial(
+        backfill_in_batches, table=table, assignments=assignments, pending=pending, **options
+    )
+    return Migration(version, name, apply, transactional=False)
+
+
+def _create_data_table(conn: Any) -> None:
+    create_partitioned_table(conn, date.today())
+
+
+# Append only: a version, once released, is never edited or renumbered.
+MIGRATIONS = [
+    Migration(1, "partitioned data table", _create_data_table, transactional=False),
+    sql_migration(2, "dedupe, daily counts and change triggers", *TRIGGER_SCHEMA_STATEMENTS),
+    index_migration(3, "records paging index", RECORDS_INDEX_NAME, "data", RECORDS_INDEX_DEFINITION),
+    sql_migration(4, "search column", *SEARCH_COLUMN_STATEMENTS),
+    backfill_migration(
+        5, "search column backfill", "data", SEARCH_BACKFILL_ASSIGNMENTS, SEARCH_BACKFILL_PENDING
+    ),
+    index_migration(6, "search index", SEARCH_INDEX_NAME, "data", SEARCH_INDEX_DEFINITION),
+    sql_migration(7, "ingest shard leases", *LEASE_SCHEMA_STATEMENTS),
+    sql_migration(8, "daily counter slots", *DAILY_COUNTS_SLOT_STATEMENTS),
+]
+
+
+@contextmanager
+def migration_lock(
+    conn: Any,
+    timeout: float = 600.0,
+    poll_interval: float = 1.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[None]:
+    """Hold the migration advisory lock, waiting up to ``timeout`` seconds.
+
+    Waiting is a poll of ``pg_try_advisory_lock`` in autocommit mode rather
+    than a blocking ``pg_advisory_lock``: a session blocked inside a statement
+    holds a snapshot, and ``CREATE INDEX CONCURRENTLY`` in the session that
+    owns the lock would wait for that snapshot forever.
+    """
+    conn.autocommit = True
+    deadline = time.monotonic() + timeout
+    waiting = False
+    try:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute(TRY_LOCK_SQL, (MIGRATION_LOCK_ID,))
+                if cur.fetchone()[0]:
+                    break
+                if time.monotonic() >= deadline:
+                    raise MigrationError(f"another migration run held the lock for {timeout:g}s")
+                if not waiting:
+                    print("Waiting for another migration run to finish")
+                    waiting = True
+                sleep(poll_interval)
+    except Exception:
+        conn.autocommit = False
+        raise
+    try:
+        yield
+    finally:
+        # The lock belongs to the session, not a transaction: release it
+        # explicitly, since pooled connections outlive this call.
+        if not conn.closed:
+            conn.rollback()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(UNLOCK_SQL, (MIGRATION_LOCK_ID,))
+            conn.autocommit = False
+
+
+def applied_migrations(conn: Any) -> dict:
+    """Applied versions mapped to when they were applied."""
+    with conn.cursor() as cur:
+        cur.execute(CREATE_MIGRATIONS_TABLE_SQL)
+        cur.execute(APPLIED_SQL)
+        return dict(cur.fetchall())
+
+
+def pending_migrations(
+    applied: dict, migrations: Sequence[Migration] = MIGRATIONS, target: Optional[int] = None
+) -> list[Migration]:
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise MigrationError(f"migration versions must be unique and ascending, got {versions}")
+    unknown = sorted(set(applied) - set(versions))
+    if unknown:
+        # A rollback to an older release: its schema is a subset of the database's.
+        print(f"Database has migrations this release does not know: {unknown}")
+    return [
+        migration
+        for migration in migrations
+        if migration.version not in applied and (target is None or migration.version <= target)
+    ]
+
+
+def apply_migration(conn: Any, migration: Migration) -> None:
+    """Apply one migration and record it; the caller holds ``migration_lock``."""
+    print(f"Applying migration {migration.version}: {migration.name}")
+    started = time.perf_counter()
+    if migration.transactional:
+        conn.autocommit = False
+        with conn:
+            migration.apply(conn)
+            with conn.cursor() as cur:
+                cur.execute(RECORD_SQL, (migration.version, migration.name))
+    else:
+        conn.autocommit = True
+        migration.apply(conn)
+        conn.autocommit = False
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(RECORD_SQL, (migration.version, migration.name))
+    conn.autocommit = True
+    print(f"Migration {migration.version} applied in {time.perf_counter() - started:.1f}s")
+
+
+def migrate(
+    conn: Any,
+    migrations: Sequence[Migration] = MIGRATIONS,
+    target: Optional[int] = None,
+    lock_timeout: float = 600.0,
+) -> list[Migration]:
+    """Apply pending migrations in version order; returns those applied."""
+    with migration_lock(conn, lock_timeout):
+        return _migrate(conn, migrations, target)
+
+
+def _migrate(conn: Any, migrations: Sequence[Migration], target: Optional[int]) -> list[Migration]:
+    pending = pending_migrations(applied_migrations(conn), migrations, target)
+    for migration in pending:
+        apply_migration(conn, migration)
+    return pending
+
+
+def upgrade(
+    conn: Any,
+    partition: PartitionSettings,
+    target: Optional[int] = None,
+    lock_timeout: float = 600.0,
+    today: Optional[date] = None,
+) -> list[Migration]:
+    """Migrate, then create upcoming partitions and apply retention.
+
+    Partition upkeep runs under the same lock, so replicas starting together
+    do not race to create the same partition.
+    """
+    today = today or date.today()
+    with migration_lock(conn, lock_timeout):
+        applied = _migrate(conn, MIGRATIONS, target)
+        conn.autocommit = False
+        with conn:
+            with conn.cursor() as cur:
+                for name in create_partitions(cur, today, partition.months_ahead):
+                    print("Partition ready:", name)
+        apply_retention(conn, today, partition.retention_days, partition.retention_action)
+    return applied
+
+
+def print_status(conn: Any, migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    """Print every migration with when it was applied; returns the number pending."""
+    conn.autocommit = True
+    try:
+        applied = applied_migrations(conn)
+    finally:
+        conn.autocommit = False
+    for migration in migrations:
+        applied_at = applied.get(migration.version)
+        state = f"applied {applied_at:%Y-%m-%d %H:%M}" if applied_at else "pending"
+        print(f"{migration.version:>4}  {state:<24}  {migration.name}")
+    return sum(1 for migration in migrations if migration.version not in applied)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--status", action="store_true", help="list migrations and exit")
+    parser.add_argument("--target", type=int, help="apply migrations up to this version only")
+    args = parser.parse_args(argv)
+    settings = get_settings()
+    try:
+        conn = psycopg2.connect(**settings.db._asdict())
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        return 1
+    try:
+        if args.status:
+            print_status(conn)
+            return 0
+        applied = upgrade(conn, settings.partition, args.target, settings.migration.lock_timeout)
+        print(f"Schema up to date, {len(applied)} migration(s) applied")
+        return 0
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
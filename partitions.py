@@ -0,0 +1,273 @@
+import re
+import threading
+from datetime import date, timedelta
+from typing import Any, Callable, NamedTuple, Optional
+
+from dedupe import PRUNE_HASHES_SQL
+from records_stats import PRUNE_DAILY_COUNTS_SQL
+
+RETENTION_ACTIONS = ("detach", "drop")
+LEGACY_PARTITION = "data_legacy"
+
+# The partition key has to be part of every unique index, so the primary key
+# becomes (id, date); ids still come from the one shared sequence.
+CREATE_PARTITIONED_SQL = """
+    CREATE TABLE IF NOT EXISTS data (
+        id SERIAL,
+        name TEXT NOT NULL,
+        date DATE NOT NULL,
+        PRIMARY KEY (id, date)
+    ) PARTITION BY RANGE (date)
+"""
+TABLE_KIND_SQL = "SELECT relkind FROM pg_class WHERE oid = to_regclass('data')"
+PARTITIONS_SQL = """
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'data'::regclass
+"""
+CREATE_PARTITION_SQL = (
+    "CREATE TABLE IF NOT EXISTS {name} PARTITION OF data FOR VALUES FROM (%s) TO (%s)"
+)
+
+_UPPER_BOUND = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    upper: date
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: date) -> str:
+    return f"data_p{start:%Y%m}"
+
+
+def table_kind(cur: Any) -> Optional[str]:
+    """``'r'`` for a plain table, ``'p'`` for a partitioned one, None if missing."""
+    cur.execute(TABLE_KIND_SQL)
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(cur: Any) -> list[Partition]:
+    cur.execute(PARTITIONS_SQL)
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = _UPPER_BOUND.search(bound)
+        if match:
+            partitions.append(Partition(name, date.fromisoformat(match.group(1))))
+    return sorted(partitions, key=lambda p: p.upper)
+
+
+def create_partitions(cur: Any, today: date, months_ahead: int) -> list[str]:
+    """Create monthly partitions up to ``months_ahead`` months past ``today``.
+
+    New ranges start where the newest existing partition ends, so they never
+    overlap the legacy partition left behind by ``migrate_to_partitioned``.
+    """
+    start = month_start(today)
+    partitions = list_partitions(cur)
+    if partitions:
+        start = max(start, partitions[-1].upper)
+    end = add_months(month_start(today), months_ahead + 1)
+    created = []
+    while start < end:
+        name = partition_name(start)
+        cur.execute(CREATE_PARTITION_SQL.format(name=name), (start, add_months(start, 1)))
+        created.append(name)
+        start = add_months(start, 1)
+    return created
+
+
+def _rename_indexes(cur: Any, table: str) -> None:
+    # Renaming a table keeps its index names; free them for the new parent.
+    cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (table,))
+    for (index,) in cur.fetchall():
+        if index.startswith("data_") and not index.startswith(table):
+            cur.execute(f"ALTER INDEX {index} RENAME TO {table}{index[len('data'):]}")
+
+
+def migrate_to_partitioned(conn: Any, today: date, lock_timeout: str = "5s") -> date:
+    """Turn the plain ``data`` table into the first partition of a new parent.
+
+    Nothing is copied: the old table is attached as ``data_legacy`` covering
+    everything before the returned bound. The slow steps (the unique index
+    and the CHECK constraint that lets ATTACH skip its scan) run without
+    blocking writes; only the rename and attach take an exclusive lock, for
+    milliseconds, and give up after ``lock_timeout`` rather than queue
+    behind long queries. Rerunning after a failure picks up where it left off.
+    """
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT max(date) FROM data")
+            (newest,) = cur.fetchone()
+            bound = add_months(month_start(max(today, newest or today)), 1)
+            cur.execute(
+                "SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass('data_id_date_key')"
+            )
+            row = cur.fetchone()
+            if row and not row[0]:
+                cur.execute("DROP INDEX CONCURRENTLY data_id_date_key")
+            cur.execute(
+                "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS data_id_date_key "
+                "ON data (id, date)"
+            )
+            cur.execute("ALTER TABLE data DROP CONSTRAINT IF EXISTS data_legacy_bound")
+            cur.execute(
+                "ALTER TABLE data ADD CONSTRAINT data_legacy_bound "
+                "CHECK (date < %s) NOT VALID",
+                (bound,),
+            )
+            cur.execute("ALTER TABLE data VALIDATE CONSTRAINT data_legacy_bound")
+    finally:
+        conn.autocommit = False
+
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+            cur.execute("LOCK TABLE data IN ACCESS EXCLUSIVE MODE")
+            cur.execute(f"ALTER TABLE data RENAME TO {LEGACY_PARTITION}")
+            _rename_indexes(cur, LEGACY_PARTITION)
+            # Triggers are recreated on the parent by the schema statements,
+            # and the content hash index is replaced by data_hashes.
+            cur.execute(f"DROP TRIGGER IF EXISTS data_changed_notify ON {LEGACY_PARTITION}")
+            cur.execute(f"DROP TRIGGER IF EXISTS data_dedupe ON {LEGACY_PARTITION}")
+            cur.execute(f"DROP INDEX IF EXISTS {LEGACY_PARTITION}_name_md5_key")
+            # ATTACH only reuses a unique index for the parent's primary key
+            # if it already backs a constraint; promoting it is instant.
+            cur.execute(
+                f"ALTER TABLE {LEGACY_PARTITION} DROP CONSTRAINT {LEGACY_PARTITION}_pkey, "
+                f"ADD PRIMARY KEY USING INDEX {LEGACY_PARTITION}_id_date_key"
+            )
+            cur.execute(
+                f"CREATE TABLE data (LIKE {LEGACY_PARTITION} "
+                "INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY RANGE (date)"
+            )
+            cur.execute("ALTER TABLE data ADD PRIMARY KEY (id, date)")
+            cur.execute("ALTER SEQUENCE data_id_seq OWNED BY data.id")
+            cur.execute(
+                f"ALTER TABLE data ATTACH PARTITION {LEGACY_PARTITION} "
+                "FOR VALUES FROM (MINVALUE) TO (%s)",
+                (bound,),
+            )
+    return bound
+
+
+def create_partitioned_table(conn: Any, today: date) -> None:
+    """Create the partitioned ``data`` table, migrating a plain one in place."""
+    with conn:
+        with conn.cursor() as cur:
+            kind = table_kind(cur)
+    if kind == "r":
+        bound = migrate_to_partitioned(conn, today)
+        print(f"Migrated data to a partitioned table, {LEGACY_PARTITION} holds rows before {bound}")
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_PARTITIONED_SQL)
+
+
+def ensure_partitioned_table(conn: Any, today: date, months_ahead: int) -> None:
+    """Create (or migrate to) the partitioned ``data`` table and its partitions."""
+    create_partitioned_table(conn, today)
+    with conn:
+        with conn.cursor() as cur:
+            for name in create_partitions(cur, today, months_ahead):
+                print("Partition ready:", name)
+
+
+def apply_retention(conn: Any, today: date, retention_days: int, action: str = "detach") -> list[str]:
+    """Detach (and with ``action="drop"`` also drop) partitions past retention.
+
+    Only partitions whose whole range is older than the window are touched.
+    DETACH ... CONCURRENTLY never blocks readers or writers of ``data``; a
+    detached partition stays around as a plain table for archiving. Content
+    hashes of the removed rows are pruned so those jokes may be stored again,
+    and their daily counters so the stats only count rows still stored.
+    """
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"Unknown retention action {action!r}, expected one of {RETENTION_ACTIONS}")
+    if retention_days <= 0:
+        return []
+    cutoff = today - timedelta(days=retention_days)
+    with conn:
+        with conn.cursor() as cur:
+            expired = [p for p in list_partitions(cur) if p.upper <= cutoff]
+    if not expired:
+        return []
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for partition in expired:
+                cur.execute(f"ALTER TABLE data DETACH PARTITION {partition.name} CONCURRENTLY")
+                if action == "drop":
+                    cur.execute(f"DROP TABLE {partition.name}")
+                past = "dropped" if action == "drop" else "detached"
+                print(f"Partition {partition.name} {past}: older than {retention_days} days")
+            # A hash or counter carries the date of its rows, so anything older
+            # than the last removed range no longer has a row in data.
+            cur.execute(PRUNE_DAILY_COUNTS_SQL, (expired[-1].upper,))
+            cur.execute(PRUNE_HASHES_SQL, (expired[-1].upper,))
+    finally:
+        conn.autocommit = False
+    return [partition.name for partition in expired]
+
+
+class PartitionMaintainer(threading.Thread):
+    """Background thread that keeps future partitions and retention up to date.
+
+    A long-running backend would otherwise run out of premade partitions, and
+    inserts for a date with no partition fail. With several backend replicas
+    only the one for which ``is_leader()`` is true does the work.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        months_ahead: int = 3,
+        retention_days: int = 0,
+        retention_action: str = "detach",
+        interval: float = 3600.0,
+        is_leader: Callable[[], bool] = lambda: True,
+    ) -> None:
+        super().__init__(name="partition-maintainer", daemon=True)
+        self.pool = pool
+        self.months_ahead = months_ahead
+        self.retention_days = retention_days
+        self.retention_action = retention_action
+        self.interval = interval
+        self.is_leader = is_leader
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run_once(self, today: Optional[date] = None) -> None:
+        today = today or date.today()
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    for name in create_partitions(cur, today, self.months_ahead):
+                        print("Partition ready:", name)
+            apply_retention(conn, today, self.retention_days, self.retention_action)
+        finally:
+            self.pool.putconn(conn)
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if not self.is_leader():
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error maintaining partitions: {e}")
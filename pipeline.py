@@ -0,0 +1,351 @@
+import asyncio
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Awaitable, Callable, Optional, Protocol, TextIO, Union
+
+from async_ingest import AsyncFetcher, HttpSource, RateLimiter
+from dedupe import Deduplicator, is_valid_record
+
+Emit = Callable[[str], Awaitable[None]]
+Validator = Callable[[str], bool]
+
+_DONE = object()
+
+
+class Source(Protocol):
+    name: str
+
+    async def run(self, emit: Emit, stop: asyncio.Event) -> None: ...
+
+
+SOURCE_TYPES: dict[str, Callable[..., Source]] = {}
+
+
+def register_source(kind: str) -> Callable[[Callable[..., Source]], Callable[..., Source]]:
+    def decorator(factory: Callable[..., Source]) -> Callable[..., Source]:
+        SOURCE_TYPES[kind] = factory
+        return factory
+
+    return decorator
+
+
+def build_source(spec: str, **options: Any) -> Source:
+    """Build a source from ``kind:argument`` (e.g. ``file:/data/jokes.txt``)."""
+    kind, _, argument = spec.strip().partition(":")
+    if kind not in SOURCE_TYPES:
+        raise ValueError(
+            f"Unknown source type {kind!r}, expected one of {sorted(SOURCE_TYPES)}"
+        )
+    return SOURCE_TYPES[kind](argument, **options)
+
+
+@register_source("http")
+class HttpPollSource:
+    """Polls a JSON API with ``concurrency`` workers under a shared rate limit."""
+
+    def __init__(
+        self,
+        url: str,
+        field: str = "joke",
+        timeout: float = 10.0,
+        concurrency: int = 4,
+        rate: float = 10.0,
+        verify: Union[bool, str] = True,
+        **_: Any,
+    ) -> None:
+        self.name = f"http:{url}"
+        self.source = HttpSource(self.name, url, field=field, timeout=timeout)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.verify = verify
+
+    async def run(self, emit: Emit, stop: asyncio.Event) -> None:
+        fetcher = AsyncFetcher(concurrency=self.concurrency, verify=self.verify)
+        limiter = RateLimiter(self.rate)
+
+        async def worker() -> None:
+            while not stop.is_set():
+                await limiter.acquire()
+                if stop.is_set():
+                    return
+                text = await fetcher.fetch(self.source)
+                if text:
+                    await emit(text)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, fetcher.close)
+
+
+class _LineSource:
+    name = "lines"
+
+    def _open(self) -> TextIO:
+        raise NotImplementedError
+
+    async def run(self, emit: Emit, stop: asyncio.Event) -> None:
+        loop = asyncio.get_running_loop()
+        stream = self._open()
+        try:
+            while not stop.is_set():
+                line = await loop.run_in_executor(None, stream.readline)
+                if not line:
+                    return
+                await emit(line.rstrip("\n"))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+@register_source("file")
+class FileSource(_LineSource):
+    """Emits one record per line of a text file, then finishes."""
+
+    def __init__(self, path: str, **_: Any) -> None:
+        self.path = path
+        self.name = f"file:{path}"
+
+    def _open(self) -> TextIO:
+        return open(self.path, encoding="utf-8")
+
+
+@register_source("stdin")
+class StdinSource(_LineSource):
+    """Emits one record per line read from standard input until EOF."""
+
+    def __init__(self, _argument: str = "", **_: Any) -> None:
+        self.name = "stdin"
+
+    def _open(self) -> TextIO:
+        return sys.stdin
+
+
+class StageMetrics:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.dropped = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def snapshot(self, queue: Optional[asyncio.Queue] = None) -> dict[str, float]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        snapshot: dict[str, float] = {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "throughput": self.items_out / elapsed,
+        }
+        if queue is not None:
+            snapshot["queue_depth"] = queue.qsize()
+            snapshot["queue_size"] = queue.maxsize
+        return snapshot
+
+
+class Pipeline:
+    """Streaming ingestion: sources -> validate/dedupe -> batch -> sink.
+
+    Every stage is connected by a bounded queue, so when the sink (the
+    database) slows down the queues fill up and the sources block on
+    ``emit`` instead of buffering without limit. File and stdin sources end
+    on EOF; the pipeline finishes once all sources are done and every queue
+    has drained, or when ``stop`` is set.
+    """
+
+    def __init__(
+        self,
+        sources: list[Source],
+        sink: Callable[[list[tuple[str, date]]], object],
+        validators: Optional[list[Validator]] = None,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        queue_size: int = 1000,
+        deduplicator: Optional[Deduplicator] = None,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 30.0,
+    ) -> None:
+        self.sources = sources
+        self.sink = sink
+        self.validators = validators if validators is not None else [is_valid_record]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.deduplicator = deduplicator or Deduplicator()
+        self.raw_queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=queue_size)
+        self.valid_queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=queue_size)
+        # Batches are large, so only a couple may wait for the sink.
+        self.batch_queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=2)
+        self.stage_metrics = {
+            name: StageMetrics(name) for name in ("source", "validate", "batch", "sink")
+        }
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        queues = {
+            "source": self.raw_queue,
+            "validate": self.valid_queue,
+            "batch": self.batch_queue,
+        }
+        metrics = {
+            name: stage.snapshot(queues.get(name))
+            for name, stage in self.stage_metrics.items()
+        }
+        metrics["validate"]["dedupe_hit_rate"] = self.deduplicator.stats()["hit_rate"]
+        return metrics
+
+    def format_metrics(self) -> str:
+        parts = []
+        for name, m in self.metrics().items():
+            part = f"{name} {m['throughput']:.1f}/s"
+            if "queue_depth" in m:
+                part += f" q={m['queue_depth']:.0f}/{m['queue_size']:.0f}"
+            if m["dropped"]:
+                part += f" dropped={m['dropped']:.0f}"
+            if "dedupe_hit_rate" in m:
+                part += f" dedupe={m['dedupe_hit_rate']:.0%}"
+            parts.append(part)
+        return " | ".join(parts)
+
+    async def run(
+        self,
+        stop: Optional[asyncio.Event] = None,
+        report_interval: Optional[float] = None,
+    ) -> None:
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # not the main thread, or no signal support on this platform
+        stages = [
+            asyncio.create_task(self._run_sources(stop)),
+            asyncio.create_task(self._validate()),
+            asyncio.create_task(self._batch()),
+            asyncio.create_task(self._sink(stop)),
+        ]
+        reporter = None
+        if report_interval:
+            reporter = asyncio.create_task(self._report(report_interval))
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            for task in stages:
+                task.cancel()
+
+    async def _run_sources(self, stop: asyncio.Event) -> None:
+        metrics = self.stage_metrics["source"]
+
+        async def emit(text: str) -> None:
+            metrics.items_in += 1
+            await self.raw_queue.put(text)
+            metrics.items_out += 1
+
+        async def run_source(source: Source) -> None:
+            try:
+                await source.run(emit, stop)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.errors += 1
+                print(f"Error in source {source.name}: {e}")
+
+        tasks = [asyncio.create_task(run_source(source)) for source in self.sources]
+        done = asyncio.gather(*tasks)
+        stopped = asyncio.create_task(stop.wait())
+        waiters: list[asyncio.Future[Any]] = [done, stopped]
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        if not done.done():
+            # Give sources a moment to notice the stop flag, then cut them off.
+            await asyncio.wait([done], timeout=1.0)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        stopped.cancel()
+        await self.raw_queue.put(_DONE)
+
+    async def _validate(self) -> None:
+        metrics = self.stage_metrics["validate"]
+        while True:
+            text = await self.raw_queue.get()
+            if text is _DONE:
+                await self.valid_queue.put(_DONE)
+                return
+            metrics.items_in += 1
+            text = text.strip()
+            if not all(validator(text) for validator in self.validators):
+                metrics.dropped += 1
+                continue
+            if self.deduplicator.seen(text):
+                metrics.dropped += 1
+                continue
+            await self.valid_queue.put((text, date.today()))
+            metrics.items_out += 1
+
+    async def _batch(self) -> None:
+        metrics = self.stage_metrics["batch"]
+        batch: list[tuple[str, date]] = []
+        deadline: Optional[float] = None
+        while True:
+            timeout: Optional[float] = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(self.valid_queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is not None and item is not _DONE:
+                metrics.items_in += 1
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            full = len(batch) >= self.batch_size
+            if batch and (full or item is None or item is _DONE):
+                await self.batch_queue.put(batch)
+                metrics.items_out += len(batch)
+                batch, deadline = [], None
+            if item is _DONE:
+                await self.batch_queue.put(_DONE)
+                return
+
+    async def _sink(self, stop: asyncio.Event) -> None:
+        metrics = self.stage_metrics["sink"]
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sink") as executor:
+            while True:
+                batch = await self.batch_queue.get()
+                if batch is _DONE:
+                    return
+                metrics.items_in += len(batch)
+                delay = self.retry_delay
+                while True:
+                    try:
+                        await loop.run_in_executor(executor, self.sink, batch)
+                        metrics.items_out += len(batch)
+                        break
+                    except Exception as e:
+                        metrics.errors += 1
+                        if stop.is_set():
+                            metrics.dropped += len(batch)
+                            print(f"Dropping {len(batch)} rows on shutdown: {e}")
+                            break
+                        print(
+                            f"Error writing batch of {len(batch)} rows, "
+                            f"retrying in {delay:.0f}s: {e}"
+                        )
+                        # Holding the batch here is what pushes back on the
+                        # upstream queues while the database is unavailable.
+                        await asyncio.sleep(delay)
+                        delay = min(delay * 2, self.max_retry_delay)
+
+    async def _report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            print(f"pipeline: {self.format_metrics()}")
@@ -0,0 +1,203 @@
+"""On-demand sampling profiler with flamegraph-compatible output.
+
+While a capture runs, a background thread snapshots every thread's stack
+with ``sys._current_frames()`` every ``interval`` seconds and counts each
+distinct stack. The result is written in the folded format that
+``flamegraph.pl``, speedscope and inferno read: one line per stack, frames
+root first and separated by ``;``, then a space and the sample count.
+
+Samples are wall-clock: a request thread waiting on Postgres shows up in
+the ``execute`` frame it waits in, which is usually what a slow page needs.
+
+Nothing runs while no capture is active; the per-request and per-iteration
+``tick()`` is then a single attribute check. A capture ends after
+``seconds``, or after ``units`` ticks (requests or ingest iterations) if
+that comes first, or when toggled off again.
+"""
+import functools
+import os
+import re
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+from create_envs import get_settings
+
+_THREAD_NUMBER = re.compile(r"[-_]?\d+")
+
+
+def thread_label(name: str) -> str:
+    # Pool threads differ only by number; merge them into one root frame.
+    return _THREAD_NUMBER.sub("", name) or "thread"
+
+
+def fold_stack(frame: Optional[FrameType], labels: dict) -> list[str]:
+    """Frame labels of ``frame``'s stack, outermost first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            label = labels[code] = name.replace(";", ":")
+        stack.append(label)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def format_folded(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class ProfileWindow:
+    """One capture: its limits and the stacks sampled so far."""
+
+    def __init__(self, seconds: float, units: int) -> None:
+        self.deadline = time.monotonic() + seconds
+        self.units = units
+        self.ticks = 0
+        self.samples = 0
+        self.counts: Counter = Counter()
+        self.done = threading.Event()
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        interval: float = 0.01,
+        seconds: float = 30.0,
+        units: int = 0,
+        directory: str = "/tmp/profiles",
+    ) -> None:
+        self.interval = interval
+        self.seconds = seconds
+        self.units = units
+        self.directory = directory
+        self.last_profile = ""
+        self.last_path: Optional[str] = None
+        self._window: Optional[ProfileWindow] = None
+        self._lock = threading.Lock()
+
+    @property
+    def capturing(self) -> bool:
+        return self._window is not None
+
+    def start(self, seconds: Optional[float] = None, units: Optional[int] = None) -> bool:
+        """Begin a capture; False if one is already running."""
+        with self._lock:
+            if self._window is not None:
+                return False
+            window = ProfileWindow(
+                self.seconds if seconds is None else seconds,
+                self.units if units is None else units,
+            )
+            self._window = window
+        threading.Thread(
+            target=self._sample, args=(window,), name="profiler", daemon=True
+        ).start()
+        print(f"Profiling started ({self._describe(window)})")
+        return True
+
+    def stop(self) -> None:
+        window = self._window
+        if window is not None:
+            window.done.set()
+
+    def toggle(self) -> None:
+        if self.capturing:
+            self.stop()
+        else:
+            self.start()
+
+    def tick(self) -> None:
+        """Count one request or loop iteration toward the capture's ``units``."""
+        window = self._window
+        if window is None:
+            return
+        window.ticks += 1
+        if window.units and window.ticks >= window.units:
+            window.done.set()
+
+    def capture(self, seconds: Optional[float] = None, units: Optional[int] = None) -> Optional[str]:
+        """Run a capture to the end and return its folded stacks, or None if busy."""
+        if not self.start(seconds, units):
+            return None
+        window = self._window
+        # The sampler publishes the result only after the window has ended.
+        while window is not None and self._window is window:
+            time.sleep(self.interval)
+        return self.last_profile
+
+    def _describe(self, window: ProfileWindow) -> str:
+        limit = f"{window.deadline - time.monotonic():.0f}s"
+        return f"{limit} or {window.units} ticks" if window.units else limit
+
+    def _sample(self, window: ProfileWindow) -> None:
+        own = threading.get_ident()
+        labels: dict = {}
+        try:
+            while not window.done.wait(self.interval) and time.monotonic() < window.deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    root = thread_label(names.get(ident, "thread"))
+                    window.counts[";".join([root] + fold_stack(frame, labels))] += 1
+                window.samples += 1
+        finally:
+            self.last_profile = format_folded(window.counts)
+            self.last_path = self._write(window)
+            with self._lock:
+                self._window = None
+
+    def _write(self, window: ProfileWindow) -> Optional[str]:
+        if not self.directory:
+            return None
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(
+            self.directory, f"profile-{socket.gethostname()}-{os.getpid()}-{stamp}.folded"
+        )
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w") as f:
+                f.write(self.last_profile)
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+            return None
+        print(f"Wrote profile of {window.samples} samples ({window.ticks} ticks) to {path}")
+        return path
+
+
+@functools.lru_cache(maxsize=None)
+def get_profiler() -> SamplingProfiler:
+    settings = get_settings().profiling
+    return SamplingProfiler(
+        interval=settings.interval_ms / 1000,
+        seconds=settings.seconds,
+        units=settings.units,
+        directory=settings.directory,
+    )
+
+
+def install_profiler(signum: int = signal.SIGUSR2) -> SamplingProfiler:
+    """Toggle captures on ``signum``; start one now if PROFILE_ON_START is set.
+
+    Call it from the process's main thread, after any server framework has
+    installed its own signal handlers.
+    """
+    profiler = get_profiler()
+
+    def handle(signum: int, frame: Optional[FrameType]) -> None:
+        # Off the handler: a print interrupted by the signal must not be re-entered.
+        threading.Thread(target=profiler.toggle, name="profiler-toggle", daemon=True).start()
+
+    signal.signal(signum, handle)
+    if get_settings().profiling.on_start and not profiler.capturing:
+        profiler.start()
+    return profiler
@@ -0,0 +1,200 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple
+
+import psycopg2
+import psycopg2.extensions
+
+DATA_CHANGED_CHANNEL = "data_changed"
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    version: int
+    last_modified: float
+
+
+class RecordsCache:
+    """Single-value read-through cache with a TTL and explicit invalidation.
+
+    Only one caller reloads on a miss; concurrent readers wait for that load
+    instead of stampeding the database. An invalidation that lands while a
+    load is in flight discards the (possibly stale) result.
+
+    Every entry carries a version that only changes when a reload returns
+    different data, so callers can key derived artefacts (rendered pages,
+    ETags) on it.
+    """
+
+    def __init__(self, ttl: float = 10.0) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entry: CacheEntry | None = None
+        self._last_entry: CacheEntry | None = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._version = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "loads": 0}
+
+    def get_or_load(self, loader: Callable[[], Any]) -> Any:
+        return self.get_entry(loader).value
+
+    def get_entry(self, loader: Callable[[], Any]) -> CacheEntry:
+        entry = self._get_fresh()
+        if entry is not None:
+            return entry
+        with self._load_lock:
+            entry = self._get_fresh(count_hit=False)
+            if entry is not None:
+                return entry
+            with self._lock:
+                self._stats["misses"] += 1
+                generation = self._generation
+            value = loader()
+            with self._lock:
+                self._stats["loads"] += 1
+                last = self._last_entry
+                if last is not None and last.value == value:
+                    entry = last
+                else:
+                    self._version += 1
+                    entry = CacheEntry(value, self._version, time.time())
+                if generation == self._generation:
+                    self._entry = self._last_entry = entry
+                    self._expires_at = time.monotonic() + self.ttl
+        return entry
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entry = None
+            self._generation += 1
+            self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entry = self._last_entry = None
+            self._generation += 1
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _get_fresh(self, count_hit: bool = True) -> CacheEntry | None:
+        with self._lock:
+            if self._entry is not None and time.monotonic() < self._expires_at:
+                if count_hit:
+                    self._stats["hits"] += 1
+                return self._entry
+        return None
+
+
+class QueryCache:
+    """Keyed LRU cache with a TTL, for results that depend on request input.
+
+    Meant for hot, repeated queries such as popular searches. Like
+    ``RecordsCache`` it is emptied by ``invalidate`` when the data changes,
+    and a load that raced with an invalidation is not stored.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and time.monotonic() < cached[0]:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return cached[1]
+            self._stats["misses"] += 1
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+class NotifyListener(threading.Thread):
+    """Background thread that LISTENs on a channel and reports notifications.
+
+    It holds its own autocommit connection (outside the pool) and reconnects
+    after errors. The callback also fires right after every (re)connect,
+    since notifications sent while disconnected are lost.
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        callback: Callable[[list[str]], None],
+        db_config: dict[str, Any],
+        poll_interval: float = 5.0,
+        reconnect_delay: float = 5.0,
+    ) -> None:
+        super().__init__(name=f"listen-{channel}", daemon=True)
+        self.channel = channel
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._db_config = dict(db_config)
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"Error listening on {self.channel}: {e}")
+            self._stop_event.wait(self.reconnect_delay)
+
+    def _listen(self) -> None:
+        conn = psycopg2.connect(**self._db_config)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+            self.callback([])
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    payloads = [notify.payload for notify in conn.notifies]
+                    conn.notifies.clear()
+                    self.callback(payloads)
+        finally:
+            conn.close()
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Generator, NamedTuple, Optional
+
+from metrics import FEED_CLIENTS, FEED_EVICTIONS
+
+# Rows of a transaction that commits after a higher id has already been
+# streamed (several backend replicas insert concurrently) are picked up as
+# long as they are at most this many ids behind.
+FEED_LOOKBACK = 100
+FEED_BATCH_SIZE = 500
+# Recent events kept for clients that reconnect with Last-Event-ID.
+FEED_HISTORY = 100
+FEED_RETRY_MS = 3000
+# How long a client turned away by the client limit waits before it retries.
+FEED_BUSY_RETRY_MS = 30000
+
+
+class FeedFull(Exception):
+    pass
+
+
+class FeedEvent(NamedTuple):
+    id: int
+    message: bytes
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value or 0) or None
+    except ValueError:
+        return None
+
+
+def record_event(row: tuple) -> FeedEvent:
+    record_id, name, record_date = row
+    data = {"id": record_id, "name": name, "date": record_date.isoformat()}
+    return FeedEvent(record_id, format_event("record", data, record_id))
+
+
+class FeedSubscription:
+    """One client's bounded buffer of pending messages.
+
+    Each poll publishes one message, however many rows it found, and every
+    client queues a reference to the same bytes. A client that lets
+    ``buffer_size`` messages pile up is evicted: its buffer is dropped and
+    its stream ends, so a stalled connection cannot hold on to more.
+    """
+
+    def __init__(self, buffer_size: int) -> None:
+        self.buffer_size = buffer_size
+        self.evicted = False
+        self._messages: deque[bytes] = deque()
+        self._cond = threading.Condition()
+
+    def push(self, message: bytes) -> bool:
+        with self._cond:
+            if self.evicted:
+                return False
+            if len(self._messages) >= self.buffer_size:
+                self.evicted = True
+                self._messages.clear()
+            else:
+                self._messages.append(message)
+            self._cond.notify()
+            return not self.evicted
+
+    def get(self, timeout: float) -> bytes:
+        """Wait up to ``timeout`` seconds, then take every pending message."""
+        with self._cond:
+            if not self._messages and not self.evicted:
+                self._cond.wait(timeout)
+            messages = b"".join(self._messages)
+            self._messages.clear()
+        return messages
+
+
+class AsyncFeedSubscription(FeedSubscription):
+    """A subscription read from an asyncio event loop instead of a thread.
+
+    The feed thread still pushes into the shared buffer; each push only
+    schedules a wake-up on ``loop``, so a waiting client costs no thread.
+    """
+
+    def __init__(self, buffer_size: int, loop: asyncio.AbstractEventLoop) -> None:
+        super().__init__(buffer_size)
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def push(self, message: bytes) -> bool:
+        accepted = super().push(message)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # the loop has shut down
+        return accepted
+
+    async def next(self, timeout: float) -> bytes:
+        """Wait up to ``timeout`` seconds, then take every pending message."""
+        deadline = self._loop.time() + timeout
+        while True:
+            remaining = deadline - self._loop.time()
+            if remaining > 0 and not self._ready.is_set():
+                try:
+                    await asyncio.wait_for(self._ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self._ready.clear()
+            messages = self.get(0)
+            if messages or self.evicted or self._loop.time() >= deadline:
+                return messages
+
+
+class RecordFeed(threading.Thread):
+    """Fans newly inserted rows out to every open stream in this process.
+
+    One thread runs one query per wake-up, however many clients are
+    connected; ``wake`` is meant to be called from the change listener, and
+    the thread also polls every ``poll_interval`` seconds in case a
+    notification is lost. Nothing is queried while no client is connected.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Optional[int], int], list[tuple]],
+        max_clients: int = 2,
+        buffer_size: int = 32,
+        poll_interval: float = 5.0,
+    ) -> None:
+        super().__init__(name="record-feed", daemon=True)
+        self.load = load
+        self.max_clients = max_clients
+        self.buffer_size = buffer_size
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._clients: set[FeedSubscription] = set()
+        self._history: deque[FeedEvent] = deque(maxlen=FEED_HISTORY)
+        self._watermark: Optional[int] = None
+        self._start = 0
+        self._sent: set[int] = set()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._stats = {"queries": 0, "events": 0, "evictions": 0, "rejected": 0}
+
+    def subscribe(
+        self,
+        last_event_id: Optional[int] = None,
+        subscription: Optional[FeedSubscription] = None,
+    ) -> FeedSubscription:
+        if subscription is None:
+            subscription = FeedSubscription(self.buffer_size)
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                self._stats["rejected"] += 1
+                raise FeedFull(f"{self.max_clients} feed clients already connected")
+            if last_event_id is not None:
+                missed = [e.message for e in self._history if e.id > last_event_id]
+                if missed:
+                    subscription.push(b"".join(missed))
+            self._clients.add(subscription)
+            FEED_CLIENTS.set(len(self._clients))
+            starting = self._watermark is None
+        if starting:
+            self._wake_event.set()
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription) -> None:
+        with self._lock:
+            self._clients.discard(subscription)
+            FEED_CLIENTS.set(len(self._clients))
+
+    def publish(self, events: list[FeedEvent]) -> None:
+        message = b"".join(event.message for event in events)
+        with self._lock:
+            self._history.extend(events)
+            self._stats["events"] += len(events)
+            clients = list(self._clients)
+        for subscription in clients:
+            if not subscription.push(message):
+                self.unsubscribe(subscription)
+                with self._lock:
+                    self._stats["evictions"] += 1
+                FEED_EVICTIONS.inc()
+
+    def wake(self, payloads: Optional[list[str]] = None) -> None:
+        self._wake_event.set()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["clients"] = len(self._clients)
+        return stats
+
+    def poll_once(self) -> None:
+        with self._lock:
+            if not self._clients:
+                # Start from the newest row again when the next client comes.
+                self._watermark = None
+                return
+            self._stats["queries"] += 1
+        if self._watermark is None:
+            rows = self.load(None, 1)
+            # Rows that existed when the first client connected are on its page.
+            self._watermark = self._start = rows[0][0] if rows else 0
+            self._sent = set()
+            return
+        after = self._watermark - FEED_LOOKBACK
+        while True:
+            rows = self.load(after, FEED_BATCH_SIZE)
+            fresh = [row for row in rows if row[0] > self._start and row[0] not in self._sent]
+            if fresh:
+                self._sent.update(row[0] for row in fresh)
+                self._watermark = max(self._watermark, fresh[-1][0])
+                self.publish([record_event(row) for row in fresh])
+            if len(rows) < FEED_BATCH_SIZE:
+                break
+            after = rows[-1][0]
+        floor = self._watermark - FEED_LOOKBACK
+        self._sent = {record_id for record_id in self._sent if record_id > floor}
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.poll_interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Error polling record feed: {e}")
+
+
+def feed_chunk(subscription: FeedSubscription, messages: bytes) -> bytes:
+    """What to send after a wait: the messages, a keep-alive or the eviction."""
+    if subscription.evicted:
+        # The browser reconnects and catches up through Last-Event-ID.
+        return format_event("evicted", {"reason": "client too slow"})
+    return messages or b": keepalive\n\n"
+
+
+def busy_message(reason: str) -> bytes:
+    """The whole body for a client turned away by the client limit.
+
+    EventSource gives up for good on an error status, but reconnects after
+    ``retry`` milliseconds when a 200 stream ends.
+    """
+    return f"retry: {FEED_BUSY_RETRY_MS}\n\n".encode("ascii") + format_event(
+        "busy", {"reason": reason}
+    )
+
+
+def stream_feed(
+    feed: RecordFeed, subscription: FeedSubscription, heartbeat: float = 15.0
+) -> Generator[bytes, None, None]:
+    """The body of one text/event-stream response.
+
+    A comment line goes out every ``heartbeat`` seconds without events, which
+    keeps proxies from timing the stream out and lets the server notice a
+    client that has gone away.
+    """
+    try:
+        yield f"retry: {FEED_RETRY_MS}\n\n".encode("ascii")
+        while True:
+            yield feed_chunk(subscription, subscription.get(heartbeat))
+            if subscription.evicted:
+                return
+    finally:
+        feed.unsubscribe(subscription)
@@ -0,0 +1,77 @@
+import base64
+import binascii
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+from psycopg2 import sql
+
+# Pages walk the (date, id) index backwards, newest first. Keyset pagination
+# resumes from the last row seen instead of counting past skipped rows, so a
+# page deep into the table costs the same as the first one.
+RECORDS_INDEX_NAME = "data_date_id_idx"
+RECORDS_INDEX_DEFINITION = "(date, id)"
+
+RECORDS_PAGE_SQL = sql.SQL(
+    "SELECT id, name, date FROM {table} WHERE {where} "
+    "ORDER BY date DESC, id DESC LIMIT %s"
+)
+
+
+class Cursor(NamedTuple):
+    date: date
+    id: int
+
+
+class RecordsPage(NamedTuple):
+    records: list[dict[str, Any]]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(position: Cursor) -> str:
+    raw = f"{position.date.isoformat()}:{position.id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+        date_text, _, id_text = raw.partition(":")
+        return Cursor(date.fromisoformat(date_text), int(id_text))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {token!r}") from None
+
+
+def fetch_records_page(
+    cur: Any,
+    limit: int,
+    after: Optional[Cursor] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    table: str = "data",
+) -> RecordsPage:
+    conditions = [sql.SQL("TRUE")]
+    params: list[Any] = []
+    if after is not None:
+        conditions.append(sql.SQL("(date, id) < (%s, %s)"))
+        params.extend(after)
+    if date_from is not None:
+        conditions.append(sql.SQL("date >= %s"))
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append(sql.SQL("date <= %s"))
+        params.append(date_to)
+    query = RECORDS_PAGE_SQL.format(
+        table=sql.Identifier(table), where=sql.SQL(" AND ").join(conditions)
+    )
+    # One extra row tells us whether there is a next page.
+    cur.execute(query, params + [limit + 1])
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(Cursor(rows[-1][2], rows[-1][0]))
+    records = [
+        {"id": row_id, "name": name, "date": row_date.isoformat()}
+        for row_id, name, row_date in rows
+    ]
+    return RecordsPage(records, next_cursor)
@@ -0,0 +1,103 @@
+from typing import Any, NamedTuple, Optional
+
+from psycopg2 import sql
+
+SEARCH_CONFIG = "english"
+
+# A plain nullable column is added without rewriting the table (a generated
+# STORED column would rewrite every partition under an exclusive lock). A row
+# trigger fills it on every write path (single inserts, execute_values and
+# COPY); rows stored before are filled by a batched backfill migration, and
+# the GIN index is built concurrently afterwards. BEFORE triggers fire in name
+# order, so the dedupe trigger skips a repeat before it is vectorized.
+SEARCH_COLUMN_STATEMENTS = [
+    # Both steps take brief table locks; give up rather than queue behind a
+    # long query and stall every writer waiting behind us.
+    "SET LOCAL lock_timeout = '5s'",
+    "ALTER TABLE data ADD COLUMN IF NOT EXISTS name_tsv tsvector",
+    f"""
+    CREATE OR REPLACE FUNCTION data_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.name_tsv := to_tsvector('{SEARCH_CONFIG}', NEW.name);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER data_search_vector
+    BEFORE INSERT OR UPDATE OF name ON data
+    FOR EACH ROW EXECUTE FUNCTION data_search_vector()
+    """,
+]
+SEARCH_BACKFILL_ASSIGNMENTS = f"name_tsv = to_tsvector('{SEARCH_CONFIG}', name)"
+SEARCH_BACKFILL_PENDING = "name_tsv IS NULL"
+SEARCH_INDEX_NAME = "data_name_tsv_idx"
+SEARCH_INDEX_DEFINITION = "USING GIN (name_tsv)"
+
+# Ranking needs every matching row, so a common word would rank a large slice
+# of the table. A cheap probe (stops after ``max_candidates + 1`` matches)
+# picks the plan: rare terms rank every match found through the GIN index,
+# common ones rank only the newest ``max_candidates`` matches, which the
+# planner finds by walking the (date, id) index backwards from the newest
+# partition. Choosing in the query itself goes wrong because the row
+# estimate for a rare lexeme is far too high.
+PROBE_SQL = sql.SQL(
+    "SELECT count(*) FROM (SELECT 1 FROM {table} "
+    "WHERE name_tsv @@ websearch_to_tsquery({config}, %(text)s) "
+    "LIMIT %(probe)s) AS probe"
+)
+NEWEST_MATCHES_SQL = sql.SQL(
+    "(SELECT id, name, date, name_tsv FROM {table} "
+    "WHERE name_tsv @@ websearch_to_tsquery({config}, %(text)s) "
+    "ORDER BY date DESC, id DESC LIMIT %(candidates)s) AS matches"
+)
+SEARCH_SQL = sql.SQL(
+    "SELECT id, name, date, ts_rank(name_tsv, query) AS rank "
+    "FROM {matches}, websearch_to_tsquery({config}, %(text)s) AS query "
+    "WHERE name_tsv @@ query "
+    "ORDER BY rank DESC, id DESC LIMIT %(limit)s OFFSET %(offset)s"
+)
+
+
+class SearchPage(NamedTuple):
+    results: list[dict[str, Any]]
+    page: int
+    next_page: Optional[int]
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case so equivalent queries share a cache entry."""
+    return " ".join(text.lower().split())
+
+
+def search_records(
+    cur: Any,
+    text: str,
+    limit: int,
+    page: int = 1,
+    max_candidates: int = 1000,
+    table: str = "data",
+) -> SearchPage:
+    # websearch_to_tsquery accepts free-form input ("quoted phrases", or, -not)
+    # and never raises a syntax error on user text.
+    params = {
+        "text": text,
+        "probe": max_candidates + 1,
+        "candidates": max_candidates,
+        "limit": limit + 1,
+        "offset": (page - 1) * limit,
+    }
+    names = {"table": sql.Identifier(table), "config": sql.Literal(SEARCH_CONFIG)}
+    cur.execute(PROBE_SQL.format(**names), params)
+    (matches,) = cur.fetchone()
+    source = names["table"]
+    if matches > max_candidates:
+        source = NEWEST_MATCHES_SQL.format(**names)
+    cur.execute(SEARCH_SQL.format(matches=source, config=names["config"]), params)
+    rows = cur.fetchall()
+    next_page = page + 1 if len(rows) > limit else None
+    results = [
+        {"id": row_id, "name": name, "date": row_date.isoformat(), "rank": round(rank, 6)}
+        for row_id, name, row_date, rank in rows[:limit]
+    ]
+    return SearchPage(results, page, next_page)
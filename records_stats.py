@@ -0,0 +1,149 @@
+from datetime import date, timedelta
+from typing import Any, NamedTuple
+
+from psycopg2 import sql
+
+TREND_DAYS = 7
+# Counter rows per day. Each INSERT adds to one slot picked at random, so
+# concurrent writers rarely wait on each other's counter row until commit.
+COUNTER_SLOTS = 8
+
+
+# A statement trigger adds each INSERT's rows to a counter row per day, so
+# the stats read a handful of small rows instead of grouping the whole table.
+# The transition table only holds rows that got past the dedupe trigger, and
+# a COPY or multi-row insert costs one upsert per distinct date, not per row.
+# Retention deletes the counters of the dates it removes (PRUNE_DAILY_COUNTS_SQL).
+#
+# Like the dedupe hashes, an existing table is backfilled before the schema
+# transaction locks ``data``, so writes carry on meanwhile. Under the lock,
+# and only until the trigger exists, the last two days are recounted exactly
+# (new rows are dated today) to cover anything written during the backfill.
+def daily_counts_backfill_statements(table: str = "data") -> list[str]:
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {table}_daily_counts (
+            date DATE PRIMARY KEY,
+            count BIGINT NOT NULL
+        )
+        """,
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM {table}_daily_counts) THEN
+                INSERT INTO {table}_daily_counts (date, count)
+                SELECT date, count(*) FROM {table} GROUP BY date
+                ON CONFLICT (date) DO UPDATE SET count = EXCLUDED.count;
+            END IF;
+        END
+        $$
+        """,
+    ]
+
+
+def daily_counts_trigger_statements(table: str = "data") -> list[str]:
+    return [
+        # Sorting the dates makes concurrent writers lock counter rows in the
+        # same order, so two multi-day batches cannot deadlock.
+        f"""
+        CREATE OR REPLACE FUNCTION {table}_count_daily() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {table}_daily_counts AS counts (date, count)
+            SELECT date, count(*) FROM new_rows GROUP BY date ORDER BY date
+            ON CONFLICT (date) DO UPDATE SET count = counts.count + EXCLUDED.count;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgname = '{table}_daily_count' AND tgrelid = '{table}'::regclass
+            ) THEN
+                INSERT INTO {table}_daily_counts (date, count)
+                SELECT date, count(*) FROM {table}
+                WHERE date >= current_date - 1 GROUP BY date
+                ON CONFLICT (date) DO UPDATE SET count = EXCLUDED.count;
+            END IF;
+        END
+        $$
+        """,
+        f"""
+        CREATE OR REPLACE TRIGGER {table}_daily_count
+        AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION {table}_count_daily()
+        """,
+    ]
+
+
+# The counters above were keyed by date alone; these spread each day over
+# COUNTER_SLOTS rows. The existing rows become slot 0. The table holds one
+# row per day, so re-keying it is instant, and the function is replaced in
+# the same transaction, before any writer can run the old ON CONFLICT (date).
+# Sorting the dates still fixes the lock order within the slot a writer picks.
+def daily_counts_slot_statements(table: str = "data") -> list[str]:
+    return [
+        f"ALTER TABLE {table}_daily_counts ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0",
+        f"ALTER TABLE {table}_daily_counts DROP CONSTRAINT IF EXISTS {table}_daily_counts_pkey",
+        f"ALTER TABLE {table}_daily_counts ADD PRIMARY KEY (date, slot)",
+        f"""
+        CREATE OR REPLACE FUNCTION {table}_count_daily() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {table}_daily_counts AS counts (date, slot, count)
+            SELECT date, floor(random() * {COUNTER_SLOTS})::smallint, count(*)
+            FROM new_rows GROUP BY date ORDER BY date
+            ON CONFLICT (date, slot) DO UPDATE SET count = counts.count + EXCLUDED.count;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+    ]
+
+
+DAILY_COUNTS_BACKFILL_STATEMENTS = daily_counts_backfill_statements()
+DAILY_COUNTS_TRIGGER_STATEMENTS = daily_counts_trigger_statements()
+DAILY_COUNTS_SLOT_STATEMENTS = daily_counts_slot_statements()
+
+DAILY_COUNTS_SQL = sql.SQL(
+    "SELECT date, sum(count)::bigint FROM {table} WHERE date >= %s AND date <= %s "
+    "GROUP BY date ORDER BY date"
+)
+TOTAL_COUNT_SQL = sql.SQL("SELECT COALESCE(sum(count), 0)::bigint FROM {table}")
+# Run by retention: the rows of every date before the bound are gone.
+PRUNE_DAILY_COUNTS_SQL = "DELETE FROM data_daily_counts WHERE date < %s"
+
+
+class DailyStats(NamedTuple):
+    days: list[dict[str, Any]]
+    window_total: int
+    total: int
+
+
+def fetch_daily_stats(cur: Any, date_from: date, date_to: date, table: str = "data") -> DailyStats:
+    """Read per-day counts for ``date_from``..``date_to`` from the summary table.
+
+    Each day carries the trailing ``TREND_DAYS`` average, so the counts from
+    the days before the window are read too. Days without rows count as 0.
+    """
+    counts_table = sql.Identifier(f"{table}_daily_counts")
+    first = date_from - timedelta(days=TREND_DAYS - 1)
+    cur.execute(DAILY_COUNTS_SQL.format(table=counts_table), (first, date_to))
+    counts = dict(cur.fetchall())
+    cur.execute(TOTAL_COUNT_SQL.format(table=counts_table))
+    (total,) = cur.fetchone()
+
+    series = [
+        counts.get(first + timedelta(days=offset), 0)
+        for offset in range((date_to - first).days + 1)
+    ]
+    days = []
+    for offset, count in enumerate(series[TREND_DAYS - 1:]):
+        trailing = series[offset:offset + TREND_DAYS]
+        days.append({
+            "date": (date_from + timedelta(days=offset)).isoformat(),
+            "count": count,
+            "average": round(sum(trailing) / TREND_DAYS, 2),
+        })
+    return DailyStats(days, sum(day["count"] for day in days), int(total))
@@ -0,0 +1,207 @@
+"""The fixed-shape queries on ``data``, run as server-side prepared statements.
+
+Each ``Statement`` is prepared once per pooled connection, on first use,
+and then run with ``EXECUTE``, so Postgres parses it once per connection
+instead of once per call. Rows come back as NamedTuples. Every execution is
+timed under its statement name in ``db_query_duration_seconds``; one slower
+than the configured threshold is counted in ``db_slow_queries_total`` and
+logged with its ``EXPLAIN`` plan (at most once a minute per statement, so a
+struggling database is not asked for a plan on every call).
+
+Queries whose text depends on the request (pagination, search, export)
+still build their SQL in their own modules.
+
+Set ``DB_PREPARE=0`` behind a transaction-pooling proxy such as PgBouncer,
+where consecutive transactions may land on different server connections.
+"""
+import functools
+import re
+import threading
+import time
+import weakref
+from datetime import date
+from typing import Any, NamedTuple, Optional, Sequence, Union
+
+from create_envs import get_settings
+from metrics import DB_ERRORS, DB_QUERY_SECONDS, DB_SLOW_QUERIES, timed
+
+EXPLAIN_INTERVAL = 60.0
+
+
+class Record(NamedTuple):
+    name: str
+    date: date
+
+
+class FeedRecord(NamedTuple):
+    id: int
+    name: str
+    date: date
+
+
+class Statement(NamedTuple):
+    name: str
+    sql: str
+    # NamedTuple built from each row; None returns the row count instead.
+    row: Optional[type[Any]] = None
+
+
+INSERT_ROW = Statement("insert_row", "INSERT INTO data (name, date) VALUES (%s, %s)")
+# Ordering by the partition key lets Postgres read the newest partition
+# first and stop there once it has 20 rows.
+LAST_20_RECORDS = Statement(
+    "last_20_records", "SELECT name, date FROM data ORDER BY date DESC, id DESC LIMIT 20", Record
+)
+NEWEST_RECORD = Statement(
+    "newest_record", "SELECT id, name, date FROM data ORDER BY id DESC LIMIT 1", FeedRecord
+)
+RECORDS_AFTER = Statement(
+    "records_after",
+    "SELECT id, name, date FROM data WHERE id > %s ORDER BY id LIMIT %s",
+    FeedRecord,
+)
+
+_PLACEHOLDER = re.compile(r"%s|%%")
+
+# Statement names already prepared on each connection. Kept per connection
+# object rather than per Repository, since the names are connection-wide.
+_prepared: "weakref.WeakKeyDictionary[Any, set[str]]" = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def to_prepared_sql(text: str) -> tuple[str, int]:
+    """``text`` with psycopg2's ``%s`` placeholders numbered ``$1, $2, ...``."""
+    count = 0
+
+    def number(match: re.Match) -> str:
+        nonlocal count
+        if match.group() == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER.sub(number, text), count
+
+
+class Repository:
+    """Runs ``Statement``s on connections handed in by the caller.
+
+    Statements already prepared are remembered per connection object; a
+    connection the pool replaces starts with none.
+    """
+
+    def __init__(
+        self, prepare: bool = True, slow_query_ms: float = 500.0, explain_slow: bool = True
+    ) -> None:
+        self.prepare = prepare
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow = explain_slow
+        self._lock = threading.Lock()
+        self._explained_at: dict[str, float] = {}
+        self._stats = {"executions": 0, "prepares": 0, "slow": 0}
+
+    def execute(
+        self, conn: Any, statement: Statement, params: Sequence[Any] = ()
+    ) -> Union[list[Any], int]:
+        """Run ``statement``; rows as ``statement.row`` tuples, or the row count."""
+        cur = conn.cursor()
+        try:
+            if self.prepare:
+                self._ensure_prepared(conn, cur, statement)
+                query = f"EXECUTE {statement.name}" + self._arguments(params)
+            else:
+                query = statement.sql
+            started = time.perf_counter()
+            try:
+                with timed(DB_QUERY_SECONDS, DB_ERRORS, query=statement.name):
+                    cur.execute(query, tuple(params)) if params else cur.execute(query)
+                    if statement.row is None:
+                        result: Union[list[Any], int] = cur.rowcount
+                    else:
+                        result = [statement.row._make(row) for row in cur.fetchall()]
+            except Exception as e:
+                if getattr(e, "pgcode", None) == "26000":
+                    # Prepared statement gone (e.g. DISCARD ALL): prepare again next time.
+                    self._forget(conn)
+                raise
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        finally:
+            cur.close()
+        with self._lock:
+            self._stats["executions"] += 1
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            self._report_slow(conn, statement, params, elapsed_ms)
+        return result
+
+    def fetch(self, conn: Any, statement: Statement, params: Sequence[Any] = ()) -> list[Any]:
+        """Run a statement that returns rows; its rows as ``statement.row`` tuples."""
+        result = self.execute(conn, statement, params)
+        if isinstance(result, int):
+            raise TypeError(f"Statement {statement.name} returns a row count, not rows")
+        return result
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        with _prepared_lock:
+            stats["connections"] = len(_prepared)
+        return stats
+
+    def _arguments(self, params: Sequence[Any]) -> str:
+        return " (" + ", ".join(["%s"] * len(params)) + ")" if params else ""
+
+    def _ensure_prepared(self, conn: Any, cur: Any, statement: Statement) -> None:
+        with _prepared_lock:
+            prepared = _prepared.setdefault(conn, set())
+            if statement.name in prepared:
+                return
+        text, _ = to_prepared_sql(statement.sql)
+        cur.execute(f"PREPARE {statement.name} AS {text}")
+        with _prepared_lock:
+            prepared.add(statement.name)
+        with self._lock:
+            self._stats["prepares"] += 1
+
+    def _forget(self, conn: Any) -> None:
+        with _prepared_lock:
+            _prepared.pop(conn, None)
+
+    def _report_slow(
+        self, conn: Any, statement: Statement, params: Sequence[Any], elapsed_ms: float
+    ) -> None:
+        DB_SLOW_QUERIES.inc(query=statement.name)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["slow"] += 1
+            last = self._explained_at.get(statement.name)
+            explain = self.explain_slow and (last is None or now - last >= EXPLAIN_INTERVAL)
+            if explain:
+                self._explained_at[statement.name] = now
+        message = f"Slow query {statement.name}: {elapsed_ms:.0f} ms"
+        if not explain:
+            print(message)
+            return
+        # Plain EXPLAIN plans the statement without running it again.
+        if self.prepare:
+            query = f"EXPLAIN EXECUTE {statement.name}" + self._arguments(params)
+        else:
+            query = "EXPLAIN " + statement.sql
+        try:
+            with conn.cursor() as cur:
+                # A failed EXPLAIN must not abort the caller's transaction.
+                cur.execute("SAVEPOINT explain_slow_query")
+                try:
+                    cur.execute(query, tuple(params)) if params else cur.execute(query)
+                    plan = "\n".join(f"    {row[0]}" for row in cur.fetchall())
+                except Exception:
+                    cur.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+                    raise
+                cur.execute("RELEASE SAVEPOINT explain_slow_query")
+        except Exception as e:
+            plan = f"    (EXPLAIN failed: {e})"
+        print(f"{message}, plan:\n{plan}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_repository() -> Repository:
+    return Repository(**get_settings().query._asdict())
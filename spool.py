@@ -0,0 +1,315 @@
+"""Durable local spool for rows the database could not take yet.
+
+Rows are appended to numbered segment files (``segment-000001.spool``...).
+Each record is ``<length><crc32><payload>`` with the payload
+``<date>\\t<name>``, so a torn write at the tail is detected and cut off
+when the spool is reopened. Every ``append`` is one write and one fsync,
+however many rows it carries.
+
+The replayer reads from a checkpoint, COPYs a batch into the database and
+only then moves the checkpoint forward (written to a temporary file,
+fsynced and renamed into place). A crash between the two replays the batch
+again; the table's dedupe trigger drops the repeats. A batch the database
+refuses for its content (say its month partition was dropped while it sat
+here) is moved to ``dead-letter.spool`` in the same format, and the
+checkpoint moves past it.
+"""
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import date
+from typing import BinaryIO, Callable, NamedTuple, Optional
+
+from psycopg2 import DataError, IntegrityError
+
+from metrics import SPOOL_BYTES, SPOOL_ROWS
+
+RECORD_HEADER = struct.Struct("<II")
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.spool$")
+CHECKPOINT_FILE = "checkpoint"
+DEAD_LETTER_FILE = "dead-letter.spool"
+# The rows themselves are at fault (a value out of range, no partition for
+# the date): sending the same rows again can never succeed.
+REJECTED_ERRORS: tuple[type[Exception], ...] = (DataError, IntegrityError)
+
+
+class SpoolFull(Exception):
+    pass
+
+
+class SpoolPosition(NamedTuple):
+    segment: int
+    offset: int
+
+
+def encode_rows(rows: list[tuple[str, date]]) -> bytes:
+    chunks = []
+    for name, date_value in rows:
+        payload = f"{date_value.isoformat()}\t{name}".encode("utf-8")
+        chunks.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        chunks.append(payload)
+    return b"".join(chunks)
+
+
+def decode_records(data: bytes, limit: int) -> tuple[list[tuple[str, date]], int]:
+    """Decode up to ``limit`` whole, intact records; returns them and the bytes used."""
+    rows: list[tuple[str, date]] = []
+    offset = 0
+    while len(rows) < limit and offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        end = offset + RECORD_HEADER.size + length
+        payload = data[offset + RECORD_HEADER.size:end]
+        if end > len(data) or zlib.crc32(payload) != crc:
+            break
+        date_text, _, name = payload.decode("utf-8").partition("\t")
+        rows.append((name, date.fromisoformat(date_text)))
+        offset = end
+    return rows, offset
+
+
+def _fsync_dir(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DiskSpool:
+    """Append-only segment files plus a replay checkpoint, capped at ``max_bytes``."""
+
+    def __init__(
+        self, path: str, max_bytes: int = 256 * 1024 * 1024, segment_bytes: int = 16 * 1024 * 1024
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._stats = {"appended": 0, "replayed": 0, "rejected": 0, "dead_lettered": 0}
+        # Segment state, set up by _recover from what is on disk.
+        self._sizes: dict[int, int] = {}
+        self._checkpoint = SpoolPosition(1, 0)
+        self._active = 1
+        self._active_size = 0
+        self._file: BinaryIO
+        os.makedirs(path, exist_ok=True)
+        self._recover()
+
+    def append(self, rows: list[tuple[str, date]]) -> None:
+        data = encode_rows(rows)
+        with self._lock:
+            if self._backlog() + len(data) > self.max_bytes:
+                self._stats["rejected"] += len(rows)
+                raise SpoolFull(f"spool at {self.path} would exceed {self.max_bytes} bytes")
+            if self._active_size >= self.segment_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._active_size += len(data)
+            self._sizes[self._active] = self._active_size
+            self._stats["appended"] += len(rows)
+            backlog = self._backlog()
+        SPOOL_ROWS.inc(len(rows), action="spooled")
+        SPOOL_BYTES.set(backlog)
+
+    def dead_letter(self, rows: list[tuple[str, date]], reason: str) -> None:
+        """Set aside rows the database refused for their content."""
+        path = os.path.join(self.path, DEAD_LETTER_FILE)
+        data = encode_rows(rows)
+        with self._lock:
+            with open(path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._stats["dead_lettered"] += len(rows)
+        print(f"Moved {len(rows)} refused rows to {path}: {reason}")
+        SPOOL_ROWS.inc(len(rows), action="dead_lettered")
+
+    def dead_letters(self) -> list[tuple[str, date]]:
+        try:
+            with open(os.path.join(self.path, DEAD_LETTER_FILE), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        return decode_records(data, len(data))[0]
+
+    def read(self, limit: int) -> tuple[list[tuple[str, date]], SpoolPosition]:
+        """Up to ``limit`` rows after the checkpoint, and the position after them."""
+        with self._lock:
+            position = self._checkpoint
+            end = self._sizes.get(position.segment, 0)
+            later = [n for n in self._sizes if n > position.segment]
+        if position.offset >= end:
+            if later:
+                # Finished (or unreadable) segment: move on to the next one.
+                return [], SpoolPosition(min(later), 0)
+            return [], position
+        with open(self._segment_path(position.segment), "rb") as f:
+            f.seek(position.offset)
+            data = f.read(end - position.offset)
+        rows, used = decode_records(data, limit)
+        if not rows and later:
+            print(f"Skipping corrupt spool data in segment {position.segment} at {position.offset}")
+            return [], SpoolPosition(min(later), 0)
+        return rows, SpoolPosition(position.segment, position.offset + used)
+
+    def commit(self, position: SpoolPosition, rows: int = 0) -> None:
+        """Record that everything before ``position`` is in the database."""
+        with self._lock:
+            if position.segment == self._active and position.offset >= self._active_size:
+                # Fully drained: start a fresh segment so the old one can go.
+                self._rotate()
+                position = SpoolPosition(self._active, 0)
+            self._write_checkpoint(position)
+            for number in [n for n in self._sizes if n < position.segment]:
+                os.remove(self._segment_path(number))
+                del self._sizes[number]
+            self._checkpoint = position
+            self._stats["replayed"] += rows
+            backlog = self._backlog()
+        if rows:
+            SPOOL_ROWS.inc(rows, action="replayed")
+        SPOOL_BYTES.set(backlog)
+
+    def position(self) -> SpoolPosition:
+        with self._lock:
+            return self._checkpoint
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self._backlog()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["bytes"] = self._backlog()
+            stats["segments"] = len(self._sizes)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def _backlog(self) -> int:
+        return max(0, sum(self._sizes.values()) - self._checkpoint.offset)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.path, f"segment-{number:06d}.spool")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._active += 1
+        self._open_active()
+        _fsync_dir(self.path)
+
+    def _open_active(self) -> None:
+        self._file = open(self._segment_path(self._active), "ab")
+        self._active_size = self._file.tell()
+        self._sizes[self._active] = self._active_size
+
+    def _write_checkpoint(self, position: SpoolPosition) -> None:
+        path = os.path.join(self.path, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(position._asdict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_dir(self.path)
+
+    def _recover(self) -> None:
+        try:
+            with open(os.path.join(self.path, CHECKPOINT_FILE)) as f:
+                checkpoint = SpoolPosition(**json.load(f))
+        except FileNotFoundError:
+            checkpoint = None
+        numbers = sorted(
+            int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.path)) if m
+        )
+        if checkpoint is None:
+            checkpoint = SpoolPosition(numbers[0] if numbers else 1, 0)
+        self._sizes = {}
+        for number in numbers:
+            if number < checkpoint.segment:
+                os.remove(self._segment_path(number))
+            else:
+                self._sizes[number] = os.path.getsize(self._segment_path(number))
+        self._checkpoint = checkpoint
+        self._active = max(self._sizes, default=checkpoint.segment)
+        if self._active in self._sizes:
+            self._truncate_torn_tail(self._active)
+        self._open_active()
+        SPOOL_BYTES.set(self._backlog())
+
+    def _truncate_torn_tail(self, number: int) -> None:
+        path = self._segment_path(number)
+        with open(path, "rb") as f:
+            data = f.read()
+        _, valid = decode_records(data, len(data))
+        if valid < len(data):
+            print(f"Truncating {len(data) - valid} torn bytes from {path}")
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+                os.fsync(f.fileno())
+            self._sizes[number] = valid
+
+
+class SpoolReplayer(threading.Thread):
+    """Drains the spool into the database in batches, checkpointing each one.
+
+    ``sink`` must raise when the database refuses the batch; the replayer
+    then waits ``interval`` seconds and tries again from the same checkpoint.
+    A batch refused with one of ``reject`` is dead-lettered instead, so it
+    cannot hold back everything spooled after it.
+    """
+
+    def __init__(
+        self,
+        spool: DiskSpool,
+        sink: Callable[[list[tuple[str, date]]], int],
+        batch_size: int = 5000,
+        interval: float = 5.0,
+        reject: tuple[type[Exception], ...] = REJECTED_ERRORS,
+    ) -> None:
+        super().__init__(name="spool-replayer", daemon=True)
+        self.spool = spool
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.reject = reject
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def replay_once(self, max_batches: Optional[int] = None) -> int:
+        """Replay until the spool is empty (or ``max_batches``); returns rows replayed."""
+        replayed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            rows, position = self.spool.read(self.batch_size)
+            if not rows and position == self.spool.position():
+                return replayed
+            if rows:
+                try:
+                    self.sink(rows)
+                except self.reject as e:
+                    self.spool.dead_letter(rows, str(e))
+                    rows = []
+            self.spool.commit(position, len(rows))
+            replayed += len(rows)
+            batches += 1
+        return replayed
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                replayed = self.replay_once()
+                if replayed:
+                    print(f"Replayed {replayed} spooled rows")
+            except Exception as e:
+                print(f"Error replaying spool: {e}")
+            self._stop_event.wait(self.interval)
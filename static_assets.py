@@ -0,0 +1,121 @@
+"""Self-hosted, fingerprinted static files.
+
+``build_assets.py`` writes each vendored file to ``static/`` under a name
+that includes a hash of its contents (``bootstrap.min.1a2b3c4d5e6f.css``),
+next to ``.gz`` and ``.br`` copies and a ``manifest.json`` that maps the
+logical name to the fingerprinted one. A fingerprinted URL never changes
+meaning, so browsers may cache it for a year without revalidating.
+
+Without a manifest (a checkout that never ran the build) pages link the
+pinned CDN copies instead, with subresource integrity.
+"""
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+from typing import NamedTuple, Optional
+
+from compression import negotiate_encoding
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+MANIFEST_FILE = "manifest.json"
+STATIC_URL = "/static/"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Suffixes of the precompressed copies, in order of preference.
+PRECOMPRESSED = {"br": ".br", "gzip": ".gz"}
+
+
+class VendorAsset(NamedTuple):
+    url: str
+    integrity: str
+
+
+BOOTSTRAP_VERSION = "5.3.0"
+_BOOTSTRAP_CDN = f"https://cdn.jsdelivr.net/npm/bootstrap@{BOOTSTRAP_VERSION}/dist"
+VENDOR_ASSETS = {
+    "bootstrap.min.css": VendorAsset(
+        f"{_BOOTSTRAP_CDN}/css/bootstrap.min.css",
+        "sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM",
+    ),
+    "bootstrap.bundle.min.js": VendorAsset(
+        f"{_BOOTSTRAP_CDN}/js/bootstrap.bundle.min.js",
+        "sha384-geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz",
+    ),
+}
+
+
+def integrity_of(body: bytes) -> str:
+    return "sha384-" + base64.b64encode(hashlib.sha384(body).digest()).decode("ascii")
+
+
+def fingerprinted_name(name: str, body: bytes) -> str:
+    stem, dot, ext = name.rpartition(".")
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+
+class StaticFile(NamedTuple):
+    content_type: str
+    # Encoding ("identity", "br", "gzip") -> body.
+    bodies: dict[str, bytes]
+
+    def negotiate(self, accept_encoding: str) -> tuple[str, bytes]:
+        offered = [encoding for encoding in PRECOMPRESSED if encoding in self.bodies]
+        encoding = negotiate_encoding(accept_encoding, offered) or "identity"
+        return encoding, self.bodies[encoding]
+
+
+class StaticAssets:
+    """The built files, read into memory once per process, and their URLs."""
+
+    def __init__(self, directory: str = STATIC_DIR) -> None:
+        self.directory = directory
+        self.manifest: dict[str, dict] = {}
+        self.files: dict[str, StaticFile] = {}
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            print(f"No {MANIFEST_FILE} in {directory}, linking assets from the CDN")
+            return
+        for entry in self.manifest.values():
+            self.files[entry["path"]] = self._load(entry["path"])
+
+    def url(self, name: str) -> str:
+        entry = self.manifest.get(name)
+        return STATIC_URL + entry["path"] if entry else VENDOR_ASSETS[name].url
+
+    def stylesheet(self, name: str) -> str:
+        return f'<link href="{self.url(name)}" rel="stylesheet"{self._integrity(name)}>'
+
+    def script(self, name: str) -> str:
+        return f'<script src="{self.url(name)}"{self._integrity(name)}></script>'
+
+    def get(self, path: str) -> Optional[StaticFile]:
+        return self.files.get(path)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "files": len(self.files),
+            "bytes": sum(len(body) for f in self.files.values() for body in f.bodies.values()),
+        }
+
+    def _integrity(self, name: str) -> str:
+        if name in self.manifest:
+            return ""
+        # Only the CDN fallback needs SRI; self-hosted files come from us.
+        return f' integrity="{VENDOR_ASSETS[name].integrity}" crossorigin="anonymous"'
+
+    def _load(self, path: str) -> StaticFile:
+        full = os.path.join(self.directory, path)
+        with open(full, "rb") as f:
+            bodies = {"identity": f.read()}
+        for encoding, suffix in PRECOMPRESSED.items():
+            if os.path.exists(full + suffix):
+                with open(full + suffix, "rb") as f:
+                    bodies[encoding] = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=UTF-8"
+        return StaticFile(content_type, bodies)
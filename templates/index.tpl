@@ -0,0 +1,58 @@
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Last 20 Records</title>
+    {{!assets.stylesheet('bootstrap.min.css')}}
+</head>
+<body class="bg-light">
+    <div class="container py-5">
+        <div class="row justify-content-center">
+            <div class="col-md-8">
+                <div class="card shadow">
+                    <div class="card-header bg-primary text-white text-center">
+                        <h2 class="mb-0">Last 20 Records</h2>
+                    </div>
+                    <div class="card-body">
+                        <table class="table table-striped table-hover align-middle">
+                            <thead class="table-dark">
+                                <tr>
+                                    <th>Name</th>
+                                    <th>Date</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                % for name, date in records:
+                                <tr>
+                                    <td>{{name}}</td>
+                                    <td>{{date}}</td>
+                                </tr>
+                                % end
+                            </tbody>
+                        </table>
+                    </div>
+                </div>
+            </div>
+        </div>
+    </div>
+    {{!assets.script('bootstrap.bundle.min.js')}}
+    % if feed_url:
+    <script>
+        // New rows arrive over the feed server (FEED_URL) instead of a page reload.
+        if (window.EventSource) {
+            const rows = document.querySelector('table tbody');
+            new EventSource({{!feed_url}}).addEventListener('record', (event) => {
+                const record = JSON.parse(event.data);
+                const row = rows.insertRow(0);
+                row.insertCell().textContent = record.name;
+                row.insertCell().textContent = record.date;
+                while (rows.rows.length > 20) {
+                    rows.deleteRow(-1);
+                }
+            });
+        }
+    </script>
+    % end
+</body>
+</html>
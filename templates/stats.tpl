@@ -0,0 +1,69 @@
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Records per Day</title>
+    {{!assets.stylesheet('bootstrap.min.css')}}
+</head>
+<body class="bg-light">
+    <div class="container py-5">
+        <div class="row justify-content-center">
+            <div class="col-md-8">
+                <div class="card shadow">
+                    <div class="card-header bg-primary text-white text-center">
+                        <h2 class="mb-0">Records per Day</h2>
+                        <small>{{date_from}} to {{date_to}}</small>
+                    </div>
+                    <div class="card-body">
+                        % if stats is None:
+                        <div class="alert alert-warning mb-0">Statistics are unavailable right now.</div>
+                        % else:
+                        % peak = max([day['count'] for day in stats.days] + [1])
+                        <div class="row text-center mb-4">
+                            <div class="col">
+                                <div class="fs-4 fw-bold">{{stats.window_total}}</div>
+                                <div class="text-muted">in this period</div>
+                            </div>
+                            <div class="col">
+                                <div class="fs-4 fw-bold">{{stats.days[-1]['average']}}</div>
+                                <div class="text-muted">7-day average</div>
+                            </div>
+                            <div class="col">
+                                <div class="fs-4 fw-bold">{{stats.total}}</div>
+                                <div class="text-muted">all time</div>
+                            </div>
+                        </div>
+                        <table class="table table-sm table-hover align-middle">
+                            <thead class="table-dark">
+                                <tr>
+                                    <th>Date</th>
+                                    <th class="text-end">Records</th>
+                                    <th class="w-50"></th>
+                                    <th class="text-end">7-day avg</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                % for day in reversed(stats.days):
+                                <tr>
+                                    <td>{{day['date']}}</td>
+                                    <td class="text-end">{{day['count']}}</td>
+                                    <td>
+                                        <div class="progress" style="height: 0.75rem;">
+                                            <div class="progress-bar" style="width: {{'%.1f' % (100 * day['count'] / peak)}}%;"></div>
+                                        </div>
+                                    </td>
+                                    <td class="text-end">{{day['average']}}</td>
+                                </tr>
+                                % end
+                            </tbody>
+                        </table>
+                        % end
+                    </div>
+                </div>
+            </div>
+        </div>
+    </div>
+    {{!assets.script('bootstrap.bundle.min.js')}}
+</body>
+</html>
@@ -6,6 +6,11 @@ import psycopg2
 from unittest.mock import patch, MagicMock
 import os
 
+import create_envs
+import db_pool
+import profiling
+import repository
+
 
 @pytest.fixture
 def mock_db_config():
@@ -49,5 +54,39 @@ def setup_test_env():
         'DB_USER': 'testuser',
         'DB_PASSWORD': 'testpass'
     })
+    # Settings are cached per process; re-read them so each test sees its env.
+    create_envs.get_settings.cache_clear()
+    yield
+    create_envs.get_settings.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_db_pool():
+    """Drop the shared connection pool so mocks never leak between tests"""
+    db_pool.close_pool()
     yield
-    # Cleanup if needed
\ No newline at end of file
+    db_pool.close_pool()
+
+
+@pytest.fixture(autouse=True)
+def reset_repository():
+    """Forget prepared statements and query settings between tests"""
+    repository.get_repository.cache_clear()
+    yield
+    repository.get_repository.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_profiler():
+    """Stop any capture and rebuild the profiler from each test's settings"""
+    stop_profiler()
+    yield
+    stop_profiler()
+
+
+def stop_profiler():
+    # Only a profiler that exists: building one would load (and cache) the
+    # settings before the test has set up its environment.
+    if profiling.get_profiler.cache_info().currsize:
+        profiling.get_profiler().stop()
+    profiling.get_profiler.cache_clear()
@@ -0,0 +1,157 @@
+"""
+Tests for async_ingest.py, run against a local stub HTTP server
+"""
+import pytest
+from unittest.mock import MagicMock
+from typing import Any, Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+import time
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_ingest
+
+
+class StubJokeHandler(BaseHTTPRequestHandler):
+    """Serves numbered jokes; /slow sleeps and /broken returns 500"""
+
+    protocol_version = 'HTTP/1.1'
+    counter = 0
+    connections: set[tuple[str, int]] = set()
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        with self.lock:
+            StubJokeHandler.counter += 1
+            number = StubJokeHandler.counter
+            StubJokeHandler.connections.add(self.client_address)
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/broken':
+            body = b'oops'
+            self.send_response(500)
+        else:
+            body = json.dumps({'joke': f'joke {number}'}).encode()
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: Any, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def stub_server() -> Iterator[str]:
+    """Start a threaded stub joke API on a free local port"""
+    StubJokeHandler.counter = 0
+    StubJokeHandler.connections = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubJokeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def make_writer() -> Any:
+    """Writer double that records added rows"""
+    writer = MagicMock()
+    writer.rows = []
+    writer.flush_interval = 0.05
+    writer.batch_size = 50
+    writer.is_due.return_value = False
+    writer.add.side_effect = lambda name, date_value: writer.rows.append(name)
+    return writer
+
+
+class TestAsyncIngest:
+    """Test suite for the asyncio ingestion mode"""
+
+    def test_ingests_from_stub_server(self, stub_server: str) -> None:
+        """Test that concurrent fetches land in the writer"""
+        writer = make_writer()
+        source = async_ingest.HttpSource('stub', stub_server + '/')
+
+        asyncio.run(async_ingest.run_async_ingest(
+            [source], writer, concurrency=4, rate=1000, max_items=40
+        ))
+
+        assert len(writer.rows) >= 40
+        assert all(row.startswith('joke ') for row in writer.rows)
+        writer.close.assert_called_once()
+
+    def test_keep_alive_reuses_connections(self, stub_server: str) -> None:
+        """Test that the pooled session does not open a socket per request"""
+        writer = make_writer()
+        source = async_ingest.HttpSource('stub', stub_server + '/')
+
+        asyncio.run(async_ingest.run_async_ingest(
+            [source], writer, concurrency=2, rate=1000, max_items=30
+        ))
+
+        assert StubJokeHandler.counter >= 30
+        assert len(StubJokeHandler.connections) <= 2
+
+    def test_failing_and_slow_sources_are_skipped(self, stub_server: str) -> None:
+        """Test that errors and per-source timeouts do not reach the writer"""
+        writer = make_writer()
+        sources = [
+            async_ingest.HttpSource('broken', stub_server + '/broken'),
+            async_ingest.HttpSource('slow', stub_server + '/slow', timeout=0.1),
+            async_ingest.HttpSource('ok', stub_server + '/'),
+        ]
+
+        asyncio.run(async_ingest.run_async_ingest(
+            sources, writer, concurrency=3, rate=1000, max_items=5
+        ))
+
+        assert len(writer.rows) >= 5
+        assert all(row.startswith('joke ') for row in writer.rows)
+
+    def test_flush_interval_honoured_under_steady_load(self) -> None:
+        """Test that a due partial batch is flushed even when the queue never idles"""
+        writer = make_writer()
+        writer.is_due.return_value = True
+
+        async def run() -> None:
+            queue: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+            for number in range(3):
+                queue.put_nowait((f'joke {number}', None))
+            await async_ingest._write_worker(writer, queue, asyncio.Event(), max_items=3)
+
+        asyncio.run(run())
+
+        assert writer.rows == ['joke 0', 'joke 1', 'joke 2']
+        writer.flush.assert_called()
+
+    def test_rate_limiter_paces_requests(self) -> None:
+        """Test that the token bucket enforces the configured rate"""
+        async def take(count: Any) -> Any:
+            limiter = async_ingest.RateLimiter(rate=50, burst=1)
+            started = time.monotonic()
+            for _ in range(count):
+                await limiter.acquire()
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(take(11))
+
+        assert elapsed >= 0.18
+
+    def test_rate_limiter_rejects_zero_rate(self) -> None:
+        """Test that a non-positive rate is refused"""
+        with pytest.raises(ValueError):
+            async_ingest.RateLimiter(rate=0)
+
+    def test_http_source_parses_field(self) -> None:
+        """Test that the configured JSON field is extracted"""
+        source = async_ingest.HttpSource('stub', 'http://unused', field='value')
+        assert source.parse({'value': '  hello  '}) == 'hello'
+        assert source.parse({}) == ''
@@ -10,7 +10,21 @@ import os
 # Add the project root to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import requests
+
 import backend_app
+from metrics import DB_QUERY_SECONDS, HTTP_CLIENT_ERRORS
+
+
+@pytest.fixture
+def mock_session_get(monkeypatch):
+    """Mock the joke client's session; retries off so failures return at once"""
+    monkeypatch.setenv('JOKE_API_RETRIES', '0')
+    backend_app.get_settings.cache_clear()
+    backend_app.get_joke_client.cache_clear()
+    with patch('requests.Session.get') as mock_get:
+        yield mock_get
+    backend_app.get_joke_client.cache_clear()
 
 
 class TestBackendApp:
@@ -28,8 +42,18 @@ class TestBackendApp:
         assert mock_cursor.execute.called
         
         # Check that the CREATE TABLE query was executed
-        call_args = mock_cursor.execute.call_args[0][0]
-        assert "CREATE TABLE IF NOT EXISTS data" in call_args
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert any("CREATE TABLE IF NOT EXISTS data" in sql for sql in statements)
+
+    def test_ensure_table_exists_installs_notify_trigger(self, mock_db_connection):
+        """Test that inserts notify listeners through a trigger"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert any("pg_notify('data_changed'" in sql for sql in statements)
+        assert any("TRIGGER data_changed_notify" in sql for sql in statements)
 
     def test_ensure_table_exists_connection_error(self):
         """Test table creation with connection error"""
@@ -47,12 +71,122 @@ class TestBackendApp:
         # Call the function
         backend_app.create_row(test_name, test_date)
         
-        # Verify the INSERT query was called with correct parameters
+        # Verify the prepared INSERT was executed with correct parameters
+        mock_cursor.execute.assert_any_call(
+            "PREPARE insert_row AS INSERT INTO data (name, date) VALUES ($1, $2)"
+        )
         mock_cursor.execute.assert_called_with(
-            "INSERT INTO data (name, date) VALUES (%s, %s)",
+            "EXECUTE insert_row (%s, %s)",
             (test_name, test_date)
         )
 
+    def test_create_row_records_metrics(self, mock_db_connection):
+        """Test that inserts are timed and counted"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.rowcount = 1
+        inserted = backend_app.ROWS_INSERTED.value(method="single")
+        timed_queries = DB_QUERY_SECONDS.count(query="insert_row")
+
+        with patch('builtins.print'):
+            backend_app.create_row("Metered joke", date(2024, 1, 1))
+
+        assert backend_app.ROWS_INSERTED.value(method="single") == inserted + 1
+        assert DB_QUERY_SECONDS.count(query="insert_row") == timed_queries + 1
+
+    def test_fetch_joke_error_counted(self, mock_session_get):
+        """Test that a failed API call increments the HTTP error counter"""
+        mock_session_get.side_effect = requests.Timeout("timeout")
+        errors = HTTP_CLIENT_ERRORS.value(source="joke_api")
+
+        with pytest.raises(backend_app.FetchError):
+            backend_app.fetch_joke()
+
+        assert HTTP_CLIENT_ERRORS.value(source="joke_api") == errors + 1
+
+    def test_create_row_skips_error_messages(self, mock_db_connection):
+        """Test that fetch error strings are never stored as jokes"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        with patch('builtins.print'):
+            backend_app.create_row("Error fetching joke: timeout", date(2024, 1, 1))
+
+        assert not mock_cursor.execute.called
+
+    def test_create_row_reports_duplicate(self, mock_db_connection):
+        """Test that a conflicting insert is reported as a duplicate"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.rowcount = 0
+
+        with patch('builtins.print') as mock_print:
+            backend_app.create_row("Old joke", date(2024, 1, 1))
+
+        mock_print.assert_called_with("Duplicate row skipped:", "Old joke")
+
+    def test_ensure_table_exists_adds_dedupe_trigger(self, mock_db_connection):
+        """Test that schema setup installs the content hash table and trigger"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert any("CREATE TABLE IF NOT EXISTS data_hashes" in sql for sql in statements)
+        assert any("TRIGGER data_dedupe" in sql for sql in statements)
+
+    def test_ensure_table_exists_adds_daily_counts(self, mock_db_connection):
+        """Test that backfills run before the table lock, which precedes any lock on data_hashes"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        position = {
+            label: next(i for i, sql in enumerate(statements) if marker in sql)
+            for label, marker in [
+                ("backfill", "FROM data GROUP BY date"),
+                ("lock", "LOCK TABLE data"),
+                ("hashes_index", "ON data_hashes (date)"),
+                ("counts", "TRIGGER data_daily_count"),
+            ]
+        }
+        assert position["backfill"] < position["lock"] < position["hashes_index"]
+        assert position["lock"] < position["counts"]
+
+    def test_ensure_table_exists_creates_partitions(self, mock_db_connection):
+        """Test that the table is partitioned by date with partitions ahead"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchone.return_value = ("p",)
+        mock_cursor.fetchall.return_value = []
+
+        with patch('builtins.print'):
+            backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert any("PARTITION BY RANGE (date)" in sql for sql in statements)
+        created = [sql for sql in statements if "PARTITION OF data" in sql]
+        assert len(created) == 4
+
+    def test_ensure_table_exists_adds_date_index(self, mock_db_connection):
+        """Test that schema setup indexes the date column for paging, without blocking writes"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS data_date_id_idx ON data (date, id)"
+            in statements
+        )
+
+    def test_ensure_table_exists_adds_search_index(self, mock_db_connection):
+        """Test that schema setup adds the tsvector column and its GIN index"""
+        mock_conn, mock_cursor = mock_db_connection
+
+        backend_app.ensure_table_exists()
+
+        statements = [call[0][0] for call in mock_cursor.execute.call_args_list]
+        assert any("ADD COLUMN IF NOT EXISTS name_tsv tsvector" in sql for sql in statements)
+        assert any("USING GIN (name_tsv)" in sql for sql in statements)
+
     def test_create_row_connection_error(self):
         """Test row creation with connection error"""
         with patch('psycopg2.connect', side_effect=Exception("Connection failed")):
@@ -60,50 +194,113 @@ class TestBackendApp:
                 backend_app.create_row("test", date.today())
                 mock_print.assert_called_with("Error connecting to database: Connection failed")
 
-    def test_fetch_joke_success(self, mock_requests):
+    def test_fetch_joke_success(self, mock_session_get):
         """Test successful joke fetching"""
         # Mock successful API response
-        mock_response = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={})
         mock_response.json.return_value = {"joke": "Test joke"}
-        mock_response.raise_for_status.return_value = None
-        mock_requests.return_value = mock_response
-        
+        mock_session_get.return_value = mock_response
+
         # Call the function
         result = backend_app.fetch_joke()
-        
+
         # Verify the result
         assert result == "Test joke"
-        mock_requests.assert_called_once_with(
+        assert mock_session_get.call_args[0] == (
             "https://geek-jokes.sameerkumar.website/api?format=json",
-            timeout=10,
-            verify=False
         )
+        assert mock_session_get.call_args[1]["timeout"] == 10
+        assert backend_app.get_joke_client().session.verify is True
 
-    def test_fetch_joke_api_error(self, mock_requests):
+    def test_fetch_joke_api_error(self, mock_session_get):
         """Test joke fetching with API error"""
         # Mock API error
-        mock_requests.side_effect = Exception("API Error")
-        
-        # Call the function
-        result = backend_app.fetch_joke()
-        
-        # Verify error handling
-        assert "Error fetching joke: API Error" in result
+        mock_session_get.side_effect = requests.ConnectionError("API Error")
+
+        # The failure is raised, never returned as if it were a joke
+        with pytest.raises(backend_app.FetchError, match="API Error"):
+            backend_app.fetch_joke()
 
-    def test_fetch_joke_empty_response(self, mock_requests):
+    def test_fetch_joke_empty_response(self, mock_session_get):
         """Test joke fetching with empty response"""
         # Mock empty response
-        mock_response = MagicMock()
+        mock_response = MagicMock(status_code=200, headers={})
         mock_response.json.return_value = {}
-        mock_response.raise_for_status.return_value = None
-        mock_requests.return_value = mock_response
-        
+        mock_session_get.return_value = mock_response
+
         # Call the function
         result = backend_app.fetch_joke()
-        
+
         # Verify empty string is returned
         assert result == ""
 
+    def test_ingest_loop_skips_failed_fetches(self):
+        """Test that a failed fetch is logged and nothing is written"""
+        writer = MagicMock()
+        error = backend_app.FetchError("joke_api returned HTTP 503", "joke_api")
+
+        with patch('backend_app.fetch_joke', side_effect=error):
+            with patch('backend_app.time.sleep', side_effect=KeyboardInterrupt):
+                with patch('builtins.print') as mock_print:
+                    with pytest.raises(KeyboardInterrupt):
+                        backend_app.run_ingest_loop(writer, 30)
+
+        assert not writer.add.called
+        mock_print.assert_called_with("Error fetching joke: joke_api returned HTTP 503")
+
+    def test_build_pipeline_defaults_to_joke_api(self):
+        """Test that pipeline mode falls back to the joke API source"""
+        writer = MagicMock(batch_size=50, flush_interval=2)
+        async_config = {
+            'source_timeout': 5, 'concurrency': 3, 'rate': 7,
+            'verify': True, 'queue_size': 100,
+        }
+        pipeline_config = {'sources': []}
+
+        p = backend_app.build_pipeline(writer, async_config, pipeline_config)
+
+        assert [source.name for source in p.sources] == [f"http:{backend_app.JOKE_API_URL}"]
+        assert p.sink == writer.write
+        assert p.deduplicator is writer.deduplicator
+        assert p.batch_size == 50
+
+    def test_sharded_pipeline_polls_once_per_shard(self):
+        """Test that each shard gets its own HTTP poller and a file is read by one shard"""
+        writer = MagicMock(batch_size=50, flush_interval=2)
+        async_config = {
+            'source_timeout': 5, 'concurrency': 3, 'rate': 7,
+            'verify': True, 'queue_size': 100,
+        }
+        pipeline_config = {'sources': ['http://example.test/', 'file:/tmp/a.txt', 'file:/tmp/b.txt']}
+        coordinator = MagicMock(shards=2, renew_interval=1.0)
+
+        p = backend_app.build_pipeline(writer, async_config, pipeline_config, coordinator)
+
+        assert [(source.name, source.shard) for source in p.sources] == [
+            ('http://example.test/', 0),
+            ('http://example.test/', 1),
+            ('file:/tmp/a.txt', 1),
+            ('file:/tmp/b.txt', 0),
+        ]
+
+    def test_sharded_ingest_loop_fetches_for_owned_shards(self):
+        """Test that every leased shard is polled once per interval, and others not at all"""
+        writer = MagicMock()
+        coordinator = MagicMock()
+        coordinator.owned.return_value = [1, 3]
+        coordinator.owns.side_effect = lambda shard: shard in (1, 3)
+        stop = MagicMock()
+        stop.is_set.side_effect = [False, False, True]
+
+        with patch('backend_app.fetch_joke', side_effect=["a", "b", "c"]) as mock_fetch:
+            with patch('backend_app.time.sleep') as mock_sleep:
+                backend_app.run_sharded_ingest_loop(writer, 30, coordinator, stop)
+
+        # Both shards are due on the first pass; on the second the loop waits.
+        assert mock_fetch.call_count == 2
+        assert [c[0][0] for c in writer.add.call_args_list] == ["a", "b"]
+        assert 0 < mock_sleep.call_args[0][0] <= 1.0
+
     @patch('backend_app.time.sleep')
     @patch('backend_app.fetch_joke')
     @patch('backend_app.create_row')
@@ -0,0 +1,103 @@
+"""
+Tests for compression.py
+"""
+import pytest
+from typing import Any, Iterator
+from contextlib import contextmanager
+import gzip
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bottle
+from compression import CompressionPlugin, negotiate_encoding
+
+
+@contextmanager
+def boddle(**environ: Any) -> Iterator[Any]:
+    """Bind bottle's request to an environ and reset the response"""
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    env.update(environ)
+    bottle.request.bind(env)
+    bottle.response.bind()
+    try:
+        yield bottle.request, bottle.response
+    finally:
+        bottle.request.bind({})
+
+
+def wrap(plugin: Any, result: Any) -> Any:
+    return plugin.apply(lambda: result, bottle.Route(bottle.Bottle(), '/', 'GET', None))
+
+
+class TestNegotiateEncoding:
+    """Test suite for Accept-Encoding parsing"""
+
+    @pytest.mark.parametrize("header, expected", [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.5, gzip;q=0.8", "gzip"),
+        ("*", "br"),
+        ("*, br;q=0", "gzip"),
+        ("identity", None),
+        ("", None),
+        ("gzip;q=0", None),
+        ("gzip;q=bogus", None),
+    ])
+    def test_preference(self, header: Any, expected: Any) -> None:
+        """Test that q-values, wildcards and refusals are honoured"""
+        assert negotiate_encoding(header, ("br", "gzip")) == expected
+
+
+class TestCompressionPlugin:
+    """Test suite for compressing dynamic responses"""
+
+    def test_large_html_is_gzipped(self) -> None:
+        """Test that a large body is compressed and marked as such"""
+        body = b"<p>joke</p>" * 500
+        with boddle(HTTP_ACCEPT_ENCODING='gzip'):
+            result = wrap(CompressionPlugin(), body)()
+
+            assert bottle.response.get_header('Content-Encoding') == 'gzip'
+            assert bottle.response.get_header('Vary') == 'Accept-Encoding'
+        assert gzip.decompress(result) == body
+
+    def test_small_or_unaccepted_bodies_pass_through(self) -> None:
+        """Test that small bodies and clients without gzip get identity"""
+        plugin = CompressionPlugin(min_size=100)
+        with boddle(HTTP_ACCEPT_ENCODING='gzip'):
+            assert wrap(plugin, b"short")() == b"short"
+            assert bottle.response.get_header('Content-Encoding') is None
+        with boddle():
+            assert wrap(plugin, b"x" * 500)() == b"x" * 500
+
+    def test_dict_serialized_and_compressed(self) -> None:
+        """Test that JSON results are encoded here so they can be compressed"""
+        with boddle(HTTP_ACCEPT_ENCODING='gzip'):
+            result = wrap(CompressionPlugin(min_size=0), {"rows": ["joke"] * 200})()
+
+            assert bottle.response.content_type == 'application/json'
+        assert gzip.decompress(result).startswith(b'{"rows": ["joke"')
+
+    def test_streams_and_binary_untouched(self) -> None:
+        """Test that generators and non-text types are passed through"""
+        stream = iter([b"chunk"])
+        with boddle(HTTP_ACCEPT_ENCODING='gzip'):
+            assert wrap(CompressionPlugin(min_size=0), stream)() is stream
+            bottle.response.content_type = 'image/png'
+            assert wrap(CompressionPlugin(min_size=0), b"\x89PNG" * 500)() == b"\x89PNG" * 500
+
+    def test_etag_weakened_and_body_cached(self) -> None:
+        """Test that a page with an ETag is compressed once per version"""
+        plugin = CompressionPlugin()
+        body = b"<p>joke</p>" * 500
+        for _ in range(3):
+            with boddle(HTTP_ACCEPT_ENCODING='gzip'):
+                bottle.response.set_header('ETag', '"v1"')
+                wrap(plugin, body)()
+                assert bottle.response.get_header('ETag') == 'W/"v1"'
+
+        assert plugin.stats()["compressed"] == 1
+        assert plugin.stats()["cache_hits"] == 2
@@ -0,0 +1,311 @@
+"""
+Tests for coordination.py; the multi-process test runs against DATABASE_URL
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from typing import Any, Iterator, cast
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import multiprocessing
+import signal
+import threading
+import time
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+import coordination
+from coordination import ShardCoordinator, ShardedSource, shard_quota
+
+
+def make_pool(fetchall: Any) -> Any:
+    """Pool whose connection answers fetchall() calls in the given order"""
+    pool = MagicMock()
+    conn = pool.getconn.return_value
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.side_effect = fetchall
+    return pool, cur
+
+
+def statements(cur: MagicMock) -> list[str]:
+    return [c[0][0] for c in cur.execute.call_args_list]
+
+
+class TestShardQuota:
+    """Test suite for splitting shards between live workers"""
+
+    @pytest.mark.parametrize("shards", [1, 4, 7, 16])
+    @pytest.mark.parametrize("count", [1, 2, 3, 5])
+    def test_quotas_cover_every_shard(self, shards: Any, count: Any) -> None:
+        """Test that the quotas of all workers add up to the shard count"""
+        workers = [f"w{i}" for i in range(count)]
+
+        quotas = [shard_quota(shards, workers, w) for w in workers]
+
+        assert sum(quotas) == shards
+        assert max(quotas) - min(quotas) <= 1
+
+    def test_unregistered_worker_counts_itself(self) -> None:
+        """Test that a worker not yet listed still gets a share"""
+        assert shard_quota(4, ["a"], "b") == 2
+
+
+class TestShardCoordinator:
+    """Test suite for claiming, renewing and releasing leases"""
+
+    def test_claims_up_to_its_share(self) -> None:
+        """Test that a worker under quota claims free or expired shards"""
+        pool, cur = make_pool([[("a",), ("b",)], [], [(0,), (1,)]])
+        coordinator = ShardCoordinator(pool, 4, lease_ttl=3, worker_id="a")
+
+        with patch('builtins.print'):
+            assert coordinator.sync() == [0, 1]
+
+        assert coordinator.owned() == [0, 1]
+        assert coordinator.is_leader()
+        claim = cur.execute.call_args_list[-1]
+        assert claim[0][0] == coordination.CLAIM_SQL
+        assert claim[0][1]["limit"] == 2
+        assert coordination.SEED_SHARDS_SQL in statements(cur)
+
+    def test_releases_extra_shards_when_a_peer_joins(self) -> None:
+        """Test that a worker over quota hands back its highest shards"""
+        pool, cur = make_pool([[("a",), ("b",), ("c",)], [(1,), (2,), (3,)]])
+        coordinator = ShardCoordinator(pool, 4, lease_ttl=3, worker_id="b")
+
+        assert coordinator.sync() == [1]
+
+        assert cur.execute.call_args_list[-1][0] == (coordination.RELEASE_SQL, ("b", [2, 3]))
+        assert not coordinator.owns(2)
+
+    def test_lease_lapses_when_renewal_fails(self) -> None:
+        """Test that work stops once the TTL passes without a successful renewal"""
+        now = [100.0]
+        pool, cur = make_pool([[("a",)], [(0,)]])
+        coordinator = ShardCoordinator(pool, 1, lease_ttl=3, worker_id="a", clock=lambda: now[0])
+        coordinator.sync()
+        pool.getconn.side_effect = psycopg2.OperationalError("server closed the connection")
+
+        now[0] = 102.0
+        with pytest.raises(psycopg2.OperationalError):
+            coordinator.sync()
+        assert coordinator.owns(0)
+        now[0] = 103.5
+        assert not coordinator.owns(0)
+
+    def test_leave_releases_everything(self) -> None:
+        """Test that a graceful stop frees the leases for immediate takeover"""
+        pool, cur = make_pool([[("a",)], [(0,)]])
+        coordinator = ShardCoordinator(pool, 1, lease_ttl=3, worker_id="a")
+        coordinator.sync()
+
+        coordinator.leave()
+
+        assert statements(cur)[-2:] == [coordination.RELEASE_ALL_SQL, coordination.LEAVE_SQL]
+        assert coordinator.owned() == []
+
+
+class CountingSource:
+    """Source that emits until stopped and records how often it was started"""
+
+    name = "counting"
+
+    def __init__(self) -> None:
+        self.starts = 0
+
+    async def run(self, emit: Any, stop: Any) -> None:
+        self.starts += 1
+        while not stop.is_set():
+            await emit("x")
+            await asyncio.sleep(0.01)
+
+
+class TestShardedSource:
+    """Test suite for running pipeline sources only on the lease holder"""
+
+    def test_runs_only_while_owned(self) -> None:
+        """Test that the source starts on claim, stops on loss and restarts on reclaim"""
+        owned = [False]
+        coordinator = MagicMock(renew_interval=1.0)
+        coordinator.owns.side_effect = lambda shard: owned[0]
+        inner = CountingSource()
+        source = ShardedSource(inner, 0, coordinator, poll_interval=0.01)
+        emitted = []
+
+        async def emit(text: Any) -> None:
+            emitted.append(text)
+
+        async def main() -> None:
+            stop = asyncio.Event()
+            task = asyncio.create_task(source.run(emit, stop))
+            await asyncio.sleep(0.05)
+            assert emitted == []
+            owned[0] = True
+            await asyncio.sleep(0.05)
+            owned[0] = False
+            await asyncio.sleep(0.05)
+            count = len(emitted)
+            await asyncio.sleep(0.05)
+            assert len(emitted) == count
+            owned[0] = True
+            await asyncio.sleep(0.05)
+            stop.set()
+            await asyncio.wait_for(task, 1)
+
+        asyncio.run(main())
+
+        assert inner.starts == 2
+        assert emitted
+
+
+class SlowJokeHandler(BaseHTTPRequestHandler):
+    """Answers every request with a joke after a fixed delay, counting requests"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.02
+    count = 0
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        time.sleep(self.delay)
+        with self.lock:
+            SlowJokeHandler.count += 1
+            number = SlowJokeHandler.count
+        body = json.dumps({"joke": f"joke {number}"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: Any, *args: Any) -> None:
+        pass
+
+
+class NullWriter:
+    def add(self, name: Any, date_value: Any) -> None:
+        pass
+
+
+def run_worker(db_config: Any, url: Any, shards: Any, lease_ttl: Any) -> None:
+    """Child process: a backend worker polling the stub for the shards it leases"""
+    import backend_app
+    from db_pool import ConnectionPool
+    from ingest_writer import BufferedWriter
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    backend_app.JOKE_API_URL = url
+    coordinator = ShardCoordinator(ConnectionPool(db_config, maxconn=2), shards, lease_ttl=lease_ttl)
+    coordinator.start()
+    try:
+        backend_app.run_sharded_ingest_loop(cast(BufferedWriter, NullWriter()), 0, coordinator)
+    finally:
+        coordinator.stop()
+        coordinator.join(timeout=5)
+
+
+@pytest.fixture
+def lease_db() -> Iterator[Any]:
+    """Lease tables in a scratch schema of the DATABASE_URL database"""
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        pytest.skip("DATABASE_URL is not set")
+    schema = f"coordination_test_{os.getpid()}"
+    try:
+        admin = psycopg2.connect(url)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"database unavailable: {e}")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+        for statement in coordination.LEASE_SCHEMA_STATEMENTS:
+            cur.execute(statement)
+    try:
+        yield {"dsn": url, "options": f"-c search_path={schema}"}, admin
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+
+@pytest.fixture
+def slow_stub() -> Iterator[str]:
+    SlowJokeHandler.count = 0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowJokeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.integration
+@pytest.mark.slow
+class TestMultiProcess:
+    """Several worker processes sharing shards through the real lease table"""
+
+    SHARDS = 4
+    LEASE_TTL = 1.5
+
+    def owners(self, admin: Any) -> Any:
+        with admin.cursor() as cur:
+            cur.execute(
+                "SELECT owner, count(*) FROM ingest_leases WHERE expires_at > now() GROUP BY owner"
+            )
+            return dict(cur.fetchall())
+
+    def wait_for_owners(self, admin: Any, count: Any, timeout: Any = 10) -> Any:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            owners = self.owners(admin)
+            if len(owners) == count and sum(owners.values()) == self.SHARDS:
+                return owners
+            time.sleep(0.1)
+        pytest.fail(f"shards not split between {count} workers: {self.owners(admin)}")
+
+    def rate(self, seconds: Any = 2.0) -> Any:
+        # Workers look for newly leased shards once a second.
+        time.sleep(1.0)
+        start = SlowJokeHandler.count
+        time.sleep(seconds)
+        return (SlowJokeHandler.count - start) / seconds
+
+    def test_throughput_scales_and_survives_a_crash(self, lease_db: Any, slow_stub: str) -> None:
+        """Test that a second worker doubles the fetch rate and takes over when the first dies"""
+        db_config, admin = lease_db
+        context = multiprocessing.get_context("spawn")
+        args = (db_config, slow_stub, self.SHARDS, self.LEASE_TTL)
+        workers = [context.Process(target=run_worker, args=args)]
+        try:
+            workers[0].start()
+            assert list(self.wait_for_owners(admin, 1).values()) == [self.SHARDS]
+            single = self.rate()
+
+            workers.append(context.Process(target=run_worker, args=args))
+            workers[1].start()
+            assert sorted(self.wait_for_owners(admin, 2).values()) == [2, 2]
+            double = self.rate()
+            assert double > 1.7 * single
+
+            # SIGKILL: no chance to hand leases back, so they have to expire.
+            workers[0].kill()
+            workers[0].join()
+            owners = self.wait_for_owners(admin, 1, timeout=4 * self.LEASE_TTL)
+            assert list(owners.values()) == [self.SHARDS]
+            assert self.rate(1.0) > 0.8 * single
+
+            workers[1].terminate()
+            workers[1].join(timeout=10)
+            assert self.owners(admin) == {}
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.kill()
+                    worker.join()
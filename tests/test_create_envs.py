@@ -36,9 +36,9 @@ class TestCreateEnvs:
         
         assert config == expected_config
 
-    @patch.dict(os.environ, {}, clear=True)
+    @patch.dict(os.environ, {'SERVER_MODE': 'dev'}, clear=True)
     def test_import_envs_and_create_db_config_with_defaults(self):
-        """Test configuration creation with default values"""
+        """Test configuration creation with default values in dev mode"""
         # Clear environment variables and test defaults
         for key in ['DB_HOST', 'DB_PORT', 'DB_NAME', 'DB_USER', 'DB_PASSWORD']:
             if key in os.environ:
@@ -60,6 +60,7 @@ class TestCreateEnvs:
         'DB_HOST': 'custom_host',
         'DB_PORT': '3306',  # Different port
         'DB_NAME': 'custom_db',
+        'SERVER_MODE': 'dev',
         # Missing DB_USER and DB_PASSWORD to test partial env vars
     })
     def test_import_envs_and_create_db_config_partial_env_vars(self):
@@ -125,7 +126,8 @@ class TestCreateEnvs:
             'DB_HOST': '',
             'DB_NAME': '',
             'DB_USER': '',
-            'DB_PASSWORD': ''
+            'DB_PASSWORD': '',
+            'SERVER_MODE': 'dev'
         }):
             config = create_envs.import_envs_and_create_db_config()
             
@@ -133,4 +135,98 @@ class TestCreateEnvs:
             assert config['host'] != '' or config['host'] == 'localhost'
             assert config['database'] != '' or config['database'] == 'mydatabase'
             assert config['user'] != '' or config['user'] == 'myuser'
-            assert config['password'] != '' or config['password'] == 'mypassword'
\ No newline at end of file
+            assert config['password'] != '' or config['password'] == 'mypassword'
+
+    @pytest.mark.parametrize('name', ['DB_NAME', 'DB_USER', 'DB_PASSWORD'])
+    def test_missing_credentials_fail_outside_dev_mode(self, monkeypatch, name):
+        """Test that production never falls back to credentials nobody set"""
+        monkeypatch.delenv(name)
+        monkeypatch.delenv('SERVER_MODE', raising=False)
+
+        with pytest.raises(create_envs.ConfigError, match=f'{name} must be set'):
+            create_envs.import_envs_and_create_db_config()
+
+
+class TestSettings:
+    """Test suite for the cached, validated settings object"""
+
+    def test_settings_are_typed(self, monkeypatch):
+        """Test that numbers and flags are converted once, at load time"""
+        monkeypatch.setenv('DB_POOL_MAX', '7')
+        monkeypatch.setenv('INGEST_BATCH_SIZE', '250')
+        monkeypatch.setenv('RECORDS_CACHE_LISTEN', '0')
+
+        settings = create_envs.get_settings()
+
+        assert settings.db.port == 5432
+        assert settings.pool.maxconn == 7
+        assert settings.ingest.batch_size == 250
+        assert settings.cache.listen is False
+
+    def test_settings_are_cached(self, monkeypatch):
+        """Test that the environment is read once until the cache is cleared"""
+        first = create_envs.get_settings()
+        monkeypatch.setenv('DB_HOST', 'elsewhere')
+
+        assert create_envs.get_settings() is first
+        create_envs.get_settings.cache_clear()
+        assert create_envs.get_settings().db.host == 'elsewhere'
+
+    @pytest.mark.parametrize('name, value, message', [
+        ('DB_PORT', 'abc', 'DB_PORT must be an integer'),
+        ('SERVER_PORT', '70000', 'SERVER_PORT must be a TCP port'),
+        ('INGEST_BATCH_SIZE', '0', 'INGEST_BATCH_SIZE must be at least 1'),
+        ('RECORDS_CACHE_TTL', 'soon', 'RECORDS_CACHE_TTL must be a number'),
+        ('SERVER_DEBUG', 'maybe', 'SERVER_DEBUG must be 1 or 0'),
+        ('DB_POOL_MIN', '20', 'must not exceed DB_POOL_MAX'),
+        ('COMPRESS_GZIP_LEVEL', '12', 'COMPRESS_GZIP_LEVEL must be at most 9'),
+    ])
+    def test_invalid_values_name_the_variable(self, monkeypatch, name, value, message):
+        """Test that a bad value fails the whole load with a readable error"""
+        monkeypatch.setenv(name, value)
+
+        with pytest.raises(create_envs.ConfigError, match=message):
+            create_envs.get_settings()
+
+    def test_import_has_no_side_effects(self):
+        """Test that importing the apps prints nothing (no password on stdout)"""
+        import subprocess
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run(
+            [sys.executable, '-c', 'import create_envs, backend_app, frontend_app'],
+            cwd=root, capture_output=True, text=True, timeout=60,
+        )
+
+        assert result.returncode == 0, result.stderr
+        assert result.stdout == ''
+
+    def test_metrics_port_zero_disables_listener(self, monkeypatch):
+        """Test that METRICS_PORT=0 is accepted, unlike a zero server port"""
+        monkeypatch.setenv('METRICS_PORT', '0')
+
+        assert create_envs.get_settings().metrics.port == 0
+
+    def test_coordination_defaults_to_one_shard(self):
+        """Test that a lone backend leases a single shard unless told otherwise"""
+        coordination = create_envs.get_settings().coordination
+
+        assert coordination.shards == 1
+        assert coordination.lease_ttl == 15.0
+        assert coordination.worker_id == ""
+
+    def test_spool_disabled_by_default(self):
+        """Test that spooling stays off until a directory is configured"""
+        spool = create_envs.get_settings().spool
+
+        assert spool.path == ""
+        assert spool.max_bytes == 256 * 1024 * 1024
+
+    def test_profiling_off_by_default(self):
+        """Test that no capture starts and the endpoint stays closed without config"""
+        profiling = create_envs.get_settings().profiling
+
+        assert profiling.on_start is False
+        assert profiling.seconds == 30.0
+        assert profiling.units == 0
+        assert profiling.token == ""
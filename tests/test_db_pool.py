@@ -0,0 +1,195 @@
+"""
+Tests for db_pool.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from typing import Any, Iterator
+import threading
+import sys
+import os
+
+import psycopg2
+import psycopg2.extensions
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_pool
+
+
+def make_connection() -> Any:
+    """Build a mock connection that looks open and idle"""
+    conn = MagicMock()
+    conn.closed = 0
+    conn.get_transaction_status.return_value = (
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    )
+    return conn
+
+
+@pytest.fixture
+def mock_connect() -> Iterator[MagicMock]:
+    """Patch psycopg2.connect to hand out a fresh mock connection per call"""
+    with patch('psycopg2.connect', side_effect=lambda **kw: make_connection()) as m:
+        yield m
+
+
+class TestConnectionPool:
+    """Test suite for the shared connection pool"""
+
+    def test_connection_is_reused(self, mock_connect: MagicMock) -> None:
+        """Test that a returned connection is handed out again"""
+        pool = db_pool.ConnectionPool({'host': 'localhost'}, maxconn=2)
+
+        conn = pool.getconn()
+        pool.putconn(conn)
+        again = pool.getconn()
+
+        assert again is conn
+        assert mock_connect.call_count == 1
+        mock_connect.assert_called_with(host='localhost')
+
+    def test_closed_connection_is_replaced(self, mock_connect: MagicMock) -> None:
+        """Test that a connection closed by the server is dropped on checkout"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        conn.closed = 2
+        fresh = pool.getconn()
+
+        assert fresh is not conn
+        assert mock_connect.call_count == 2
+        assert pool.stats()['discarded'] == 1
+        assert pool.stats()['size'] == 1
+
+    def test_idle_connection_is_pinged(self, mock_connect: MagicMock) -> None:
+        """Test that a long-idle connection is health checked before reuse"""
+        pool = db_pool.ConnectionPool({}, maxconn=1, check_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = psycopg2.OperationalError("server restarted")
+        fresh = pool.getconn()
+
+        cursor.execute.assert_called_with("SELECT 1")
+        assert fresh is not conn
+        assert conn.close.called
+
+    def test_dirty_transaction_is_rolled_back(self, mock_connect: MagicMock) -> None:
+        """Test that a connection returned mid-transaction is rolled back"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        conn = pool.getconn()
+        conn.get_transaction_status.return_value = (
+            psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        )
+
+        pool.putconn(conn)
+
+        assert conn.rollback.called
+        assert pool.stats()['idle'] == 1
+
+    def test_broken_connection_is_discarded_on_return(self, mock_connect: MagicMock) -> None:
+        """Test that a connection in an unknown state is closed on return"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        conn = pool.getconn()
+        conn.get_transaction_status.return_value = (
+            psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+        )
+
+        pool.putconn(conn)
+
+        assert conn.close.called
+        assert pool.stats()['size'] == 0
+
+    def test_exhausted_pool_times_out(self, mock_connect: MagicMock) -> None:
+        """Test that checkout gives up once the timeout elapses"""
+        pool = db_pool.ConnectionPool({}, maxconn=1, timeout=0.01)
+        pool.getconn()
+
+        with pytest.raises(db_pool.PoolTimeout):
+            pool.getconn()
+
+        stats = pool.stats()
+        assert stats['waits'] == 1
+        assert stats['timeouts'] == 1
+        assert stats['in_use'] == 1
+
+    def test_waiter_gets_released_connection(self, mock_connect: MagicMock) -> None:
+        """Test that a blocked checkout wakes up when a connection is returned"""
+        pool = db_pool.ConnectionPool({}, maxconn=1, timeout=5)
+        conn = pool.getconn()
+        result: dict[str, Any] = {}
+
+        waiter = threading.Thread(target=lambda: result.update(conn=pool.getconn()))
+        waiter.start()
+        while pool.stats()['waits'] == 0:
+            pass
+        pool.putconn(conn)
+        waiter.join(timeout=5)
+
+        assert result['conn'] is conn
+        assert pool.stats()['checkouts'] == 2
+
+    def test_connect_error_frees_slot(self) -> None:
+        """Test that a failed connect does not leak pool capacity"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        with patch('psycopg2.connect', side_effect=Exception("Connection failed")):
+            with pytest.raises(Exception, match="Connection failed"):
+                pool.getconn()
+
+        stats = pool.stats()
+        assert stats['size'] == 0
+        assert stats['connect_errors'] == 1
+
+    def test_unknown_connection_rejected(self, mock_connect: MagicMock) -> None:
+        """Test that returning a foreign connection raises"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        with pytest.raises(db_pool.PoolError):
+            pool.putconn(make_connection())
+
+    def test_invalid_sizes_rejected(self) -> None:
+        """Test that nonsensical min/max sizes are refused"""
+        with pytest.raises(ValueError):
+            db_pool.ConnectionPool({}, minconn=5, maxconn=2)
+
+    def test_warm_opens_minconn(self, mock_connect: MagicMock) -> None:
+        """Test that warming the pool opens minconn idle connections"""
+        pool = db_pool.ConnectionPool({}, minconn=3, maxconn=5)
+        pool.warm()
+
+        stats = pool.stats()
+        assert stats['idle'] == 3
+        assert stats['in_use'] == 0
+        assert mock_connect.call_count == 3
+
+    def test_idle_connections_pruned_to_minconn(self, mock_connect: MagicMock) -> None:
+        """Test that connections idle past max_idle are closed down to minconn"""
+        pool = db_pool.ConnectionPool({}, minconn=1, maxconn=3, max_idle=0)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+
+        stats = pool.stats()
+        assert stats['idle'] == 1
+        assert stats['size'] == 1
+
+    def test_connection_context_manager(self, mock_connect: MagicMock) -> None:
+        """Test that the context manager returns the connection"""
+        pool = db_pool.ConnectionPool({}, maxconn=1)
+        with pool.connection() as conn:
+            assert conn.closed == 0
+            assert pool.stats()['in_use'] == 1
+
+        assert pool.stats()['in_use'] == 0
+        assert pool.stats()['idle'] == 1
+
+    def test_get_pool_uses_env_config(self, mock_connect: MagicMock) -> None:
+        """Test that the shared pool is built from environment settings"""
+        with patch.dict(os.environ, {'DB_POOL_MIN': '2', 'DB_POOL_MAX': '7'}):
+            pool = db_pool.get_pool()
+
+        assert pool is db_pool.get_pool()
+        assert pool.minconn == 2
+        assert pool.maxconn == 7
@@ -0,0 +1,156 @@
+"""
+Tests for db_router.py
+"""
+import pytest
+import psycopg2
+from unittest.mock import MagicMock, patch
+from typing import Any
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_router
+from create_envs import import_envs_and_create_replica_config
+
+
+def replica(name: str, lag: Any = 0.0) -> Any:
+    """A replica whose lag check reports ``lag`` seconds"""
+    pool = MagicMock()
+    cur = pool.getconn.return_value.cursor.return_value.__enter__.return_value
+    cur.fetchone.return_value = (lag,)
+    return db_router.Replica(name, pool)
+
+
+def read_from(router: Any, **kwargs: Any) -> Any:
+    with router.read_connection(**kwargs) as conn:
+        return conn
+
+
+class TestReplicaRouter:
+    """Test suite for read-replica routing"""
+
+    def test_round_robin_across_replicas(self) -> None:
+        """Test that consecutive reads are spread over the replicas"""
+        primary = MagicMock()
+        replicas = [replica("r1"), replica("r2")]
+        router = db_router.ReplicaRouter(primary, replicas)
+
+        conns = [read_from(router) for _ in range(4)]
+
+        pools = [replicas[0].pool.getconn.return_value, replicas[1].pool.getconn.return_value]
+        assert conns == pools * 2
+        assert not primary.getconn.called
+        assert router.stats()["replicas"]["r1"]["reads"] == 2
+
+    def test_no_replicas_reads_from_primary(self) -> None:
+        """Test that a router without replicas behaves like the plain pool"""
+        primary = MagicMock()
+        router = db_router.ReplicaRouter(primary, [])
+
+        assert read_from(router) is primary.getconn.return_value
+        primary.putconn.assert_called_once_with(primary.getconn.return_value)
+
+    def test_unreachable_replica_is_marked_down(self) -> None:
+        """Test that a failed connect skips the replica until retry_after passes"""
+        primary = MagicMock()
+        down, up = replica("down"), replica("up")
+        down.pool.getconn.side_effect = psycopg2.OperationalError("refused")
+        router = db_router.ReplicaRouter(primary, [down, up], retry_after=60)
+
+        with patch('builtins.print'):
+            conns = [read_from(router) for _ in range(3)]
+
+        assert conns == [up.pool.getconn.return_value] * 3
+        assert down.pool.getconn.call_count == 1
+        assert router.stats()["replicas"]["down"]["healthy"] is False
+
+    def test_all_replicas_down_falls_back_to_primary(self) -> None:
+        """Test that reads still succeed on the primary when no replica answers"""
+        primary = MagicMock()
+        down = replica("down")
+        down.pool.getconn.side_effect = psycopg2.OperationalError("refused")
+        router = db_router.ReplicaRouter(primary, [down])
+
+        with patch('builtins.print'):
+            conn = read_from(router)
+
+        assert conn is primary.getconn.return_value
+        assert router.stats()["primary_reads"] == 1
+
+    def test_lagging_replica_is_skipped(self) -> None:
+        """Test that a replica behind by more than max_lag is passed over"""
+        primary = MagicMock()
+        behind = replica("behind", lag=120.0)
+        router = db_router.ReplicaRouter(primary, [behind], max_lag=30)
+
+        assert read_from(router) is primary.getconn.return_value
+        behind.pool.putconn.assert_called_once_with(behind.pool.getconn.return_value)
+        # The known lag is trusted until the next check, without a connection.
+        read_from(router)
+        assert behind.pool.getconn.call_count == 1
+
+    def test_unknown_lag_is_skipped(self) -> None:
+        """Test that a replica that cannot report its lag is treated as stale"""
+        primary = MagicMock()
+        disconnected = replica("disconnected", lag=None)
+        router = db_router.ReplicaRouter(primary, [disconnected], max_lag=30)
+
+        assert read_from(router) is primary.getconn.return_value
+        assert router.stats()['replicas']['disconnected']['lag'] is None
+        # Without a lag bound the replica is still usable.
+        router.max_lag = None
+        assert read_from(router) is disconnected.pool.getconn.return_value
+
+    def test_lag_query_requires_streaming(self) -> None:
+        """Test that equal LSNs only count as caught up while the receiver streams"""
+        assert "pg_stat_wal_receiver WHERE status = 'streaming'" in db_router.LAG_SQL
+        assert "COALESCE" not in db_router.LAG_SQL
+
+    def test_per_call_max_lag(self) -> None:
+        """Test that a stricter max_lag sends read-your-writes queries to the primary"""
+        primary = MagicMock()
+        slightly_behind = replica("r1", lag=2.0)
+        router = db_router.ReplicaRouter(primary, [slightly_behind], max_lag=30)
+
+        assert read_from(router) is slightly_behind.pool.getconn.return_value
+        assert read_from(router, max_lag=0) is primary.getconn.return_value
+
+    def test_query_error_marks_replica_down(self) -> None:
+        """Test that a connection lost mid-query takes the replica out of rotation"""
+        primary = MagicMock()
+        flaky = replica("flaky")
+        router = db_router.ReplicaRouter(primary, [flaky])
+
+        with patch('builtins.print'):
+            with pytest.raises(psycopg2.OperationalError):
+                with router.read_connection():
+                    raise psycopg2.OperationalError("server closed the connection")
+
+        flaky.pool.putconn.assert_called_once_with(flaky.pool.getconn.return_value)
+        assert read_from(router) is primary.getconn.return_value
+
+
+class TestReplicaConfig:
+    """Test suite for the replica settings"""
+
+    def test_replicas_parsed_from_env(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that host:port pairs inherit the primary's database and credentials"""
+        monkeypatch.setenv('DB_HOST', 'primary')
+        monkeypatch.setenv('DB_PORT', '5432')
+        monkeypatch.setenv('DB_NAME', 'app')
+        monkeypatch.setenv('DB_REPLICAS', 'replica1:5433, replica2')
+        monkeypatch.delenv('DB_REPLICA_LATEST_MAX_LAG', raising=False)
+
+        config = import_envs_and_create_replica_config()
+
+        hosts = [(r['host'], r['port'], r['database']) for r in config['replicas']]
+        assert hosts == [('replica1', 5433, 'app'), ('replica2', 5432, 'app')]
+        assert config['latest_max_lag'] is None
+
+    def test_no_replicas_by_default(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that an unset DB_REPLICAS routes everything to the primary"""
+        monkeypatch.delenv('DB_REPLICAS', raising=False)
+
+        assert import_envs_and_create_replica_config()['replicas'] == []
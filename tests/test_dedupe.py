@@ -0,0 +1,66 @@
+"""
+Tests for dedupe.py
+"""
+import pytest
+from typing import Any
+import hashlib
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dedupe
+
+
+class TestDedupe:
+    """Test suite for content-hash deduplication"""
+
+    def test_content_hash_matches_postgres_md5(self) -> None:
+        """Test that the in-memory key matches md5(name) in data_hashes"""
+        assert dedupe.content_hash("joke") == hashlib.md5(b"joke").hexdigest()
+
+    @pytest.mark.parametrize("text,valid", [
+        ("A real joke", True),
+        ("", False),
+        ("   ", False),
+        ("Error fetching joke: 503 Server Error", False),
+        ("x" * 1001, False),
+    ])
+    def test_is_valid_record(self, text: Any, valid: Any) -> None:
+        """Test record validation rules"""
+        assert dedupe.is_valid_record(text) is valid
+
+    def test_seen_tracks_recent_hashes(self) -> None:
+        """Test that a repeat is caught and counted"""
+        deduplicator = dedupe.Deduplicator()
+
+        assert not deduplicator.seen("a")
+        assert deduplicator.seen("a")
+
+        stats = deduplicator.stats()
+        assert stats['checked'] == 2
+        assert stats['memory_hits'] == 1
+        assert stats['hit_rate'] == 0.5
+
+    def test_lru_eviction(self) -> None:
+        """Test that the oldest hash is forgotten once the LRU is full"""
+        deduplicator = dedupe.Deduplicator(maxsize=2)
+        assert not deduplicator.seen('a')
+        assert not deduplicator.seen('b')
+        assert deduplicator.seen('a')
+        assert not deduplicator.seen('c')
+        assert not deduplicator.seen('b')
+
+    def test_hit_rate_includes_database_duplicates(self) -> None:
+        """Test that conflicts reported by the database count as hits"""
+        deduplicator = dedupe.Deduplicator()
+        for text in ("a", "b", "c", "d"):
+            deduplicator.seen(text)
+        deduplicator.record_db_duplicates(2)
+
+        assert deduplicator.stats()['hit_rate'] == 0.5
+
+    def test_empty_hit_rate(self) -> None:
+        """Test that the hit rate is zero before any checks"""
+        assert dedupe.Deduplicator().stats()['hit_rate'] == 0.0
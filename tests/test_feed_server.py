@@ -0,0 +1,118 @@
+"""
+Tests for feed_server.py
+"""
+from typing import Any, Optional
+import asyncio
+import json
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feed_server import FeedServer
+from records_feed import RecordFeed
+
+
+class FakeTable:
+    """Answers the feed's queries from a list of ids"""
+
+    def __init__(self, *ids: int) -> None:
+        self.ids = list(ids)
+
+    def load(self, after: Optional[int], limit: int) -> list[tuple[int, str, date]]:
+        if after is None:
+            ids = [max(self.ids)] if self.ids else []
+        else:
+            ids = sorted(i for i in self.ids if i > after)[:limit]
+        return [(i, f"joke {i}", date(2024, 1, 1)) for i in ids]
+
+
+async def started(feed: Any, **options: Any) -> Any:
+    """Run a FeedServer on a free port; returns (server, stop, serve task)"""
+    server = FeedServer(feed, **options)
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(server.serve("127.0.0.1", 0, stop))
+    while server.port is None:
+        await asyncio.sleep(0.01)
+    return server, stop, task
+
+
+async def request(port: Any, path: Any, headers: Any = "") -> Any:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n{headers}\r\n".encode())
+    await writer.drain()
+    return reader, writer
+
+
+async def read_until(reader: Any, marker: Any) -> Any:
+    return await asyncio.wait_for(reader.readuntil(marker), 2)
+
+
+class TestFeedServer:
+    """Test suite for serving the live feed without a thread per client"""
+
+    def test_streams_new_rows(self) -> None:
+        """Test that a client gets the stream headers, the retry hint and new rows"""
+        table = FakeTable(1)
+        feed = RecordFeed(table.load)
+
+        async def run() -> Any:
+            server, stop, task = await started(feed, heartbeat=5, allow_origin="*")
+            reader, writer = await request(server.port, "/api/feed")
+            head = await read_until(reader, b"retry: 3000\n\n")
+            feed.poll_once()  # picks the starting point
+            table.ids += [2]
+            feed.poll_once()
+            event = await read_until(reader, b"\n\n")
+            stats = feed.stats()
+            stop.set()
+            await task
+            writer.close()
+            return head, event, stats
+
+        head, event, stats = asyncio.run(run())
+
+        assert head.startswith(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n")
+        assert b"Access-Control-Allow-Origin: *\r\n" in head
+        assert event.startswith(b"id: 2\nevent: record\n")
+        assert stats["clients"] == 1
+        assert feed.stats()["clients"] == 0
+
+    def test_full_server_asks_client_to_retry(self) -> None:
+        """Test that a client beyond the limit gets a busy event and a closed stream"""
+        feed = RecordFeed(FakeTable().load, max_clients=1)
+        feed.subscribe()
+
+        async def run() -> Any:
+            server, stop, task = await started(feed)
+            reader, writer = await request(server.port, "/api/feed")
+            body = await asyncio.wait_for(reader.read(), 2)
+            stop.set()
+            await task
+            return body
+
+        body = asyncio.run(run())
+
+        assert b"HTTP/1.1 200 OK" in body
+        assert b"retry: 30000\n\nevent: busy\n" in body
+
+    def test_health_and_unknown_paths(self) -> None:
+        """Test the JSON health check and the 404 for anything else"""
+        feed = RecordFeed(FakeTable().load)
+
+        async def run() -> Any:
+            server, stop, task = await started(feed)
+            bodies = []
+            for path in ("/healthz", "/nope"):
+                reader, writer = await request(server.port, path)
+                bodies.append(await asyncio.wait_for(reader.read(), 2))
+            stop.set()
+            await task
+            return bodies
+
+        health, missing = asyncio.run(run())
+
+        assert json.loads(health.split(b"\r\n\r\n", 1)[1])["clients"] == 0
+        assert missing.startswith(b"HTTP/1.1 404 Not Found")
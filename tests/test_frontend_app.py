@@ -2,16 +2,43 @@
 Tests for frontend_app.py
 """
 import pytest
+from contextlib import contextmanager
 from unittest.mock import patch, MagicMock
+from datetime import date
+import json
 import sys
 import os
 
 # Add the project root to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import bottle
 import frontend_app
 
 
+@contextmanager
+def boddle(**environ):
+    """Bind bottle's request to an environ and reset the response"""
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    env.update(environ)
+    bottle.request.bind(env)
+    bottle.response.bind()
+    try:
+        yield bottle.request, bottle.response
+    finally:
+        bottle.request.bind({})
+
+
+@pytest.fixture(autouse=True)
+def reset_records_cache():
+    """Start every test with an empty records cache"""
+    frontend_app.RECORDS_CACHE.clear()
+    frontend_app.SEARCH_CACHE.clear()
+    yield
+    frontend_app.RECORDS_CACHE.clear()
+    frontend_app.SEARCH_CACHE.clear()
+
+
 class TestFrontendApp:
     """Test suite for frontend application"""
 
@@ -29,10 +56,12 @@ class TestFrontendApp:
         # Call the function
         result = frontend_app.get_last_20_records()
         
-        # Verify the query was executed correctly
-        mock_cursor.execute.assert_called_with(
-            'SELECT name, date FROM data ORDER BY id DESC LIMIT 20'
+        # Verify the query was prepared once and executed by name
+        mock_cursor.execute.assert_any_call(
+            'PREPARE last_20_records AS '
+            'SELECT name, date FROM data ORDER BY date DESC, id DESC LIMIT 20'
         )
+        mock_cursor.execute.assert_called_with('EXECUTE last_20_records')
         
         # Verify the results
         assert result == mock_records
@@ -84,13 +113,13 @@ class TestFrontendApp:
         mock_get_records.assert_called_once()
         
         # Verify HTML structure
-        assert isinstance(result, str)
-        assert "Test joke 1" in result
-        assert "Test joke 2" in result
-        assert "2024-01-01" in result
-        assert "2024-01-02" in result
-        assert "Last 20 Records" in result
-        assert "<!DOCTYPE html>" in result
+        assert isinstance(result, bytes)
+        assert b"Test joke 1" in result
+        assert b"Test joke 2" in result
+        assert b"2024-01-01" in result
+        assert b"2024-01-02" in result
+        assert b"Last 20 Records" in result
+        assert b"<!DOCTYPE html>" in result
 
     @patch('frontend_app.get_last_20_records')
     def test_index_route_empty_records(self, mock_get_records):
@@ -105,10 +134,423 @@ class TestFrontendApp:
         mock_get_records.assert_called_once()
         
         # Verify HTML structure with no data
-        assert isinstance(result, str)
-        assert "Last 20 Records" in result
-        assert "<!DOCTYPE html>" in result
-        assert "<tbody>" in result
+        assert isinstance(result, bytes)
+        assert b"Last 20 Records" in result
+        assert b"<!DOCTYPE html>" in result
+        assert b"<tbody>" in result
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_served_from_cache(self, mock_get_records):
+        """Test that repeated page hits do not query the database again"""
+        mock_get_records.return_value = [("Cached joke", "2024-01-01")]
+
+        first = frontend_app.index()
+        second = frontend_app.index()
+
+        mock_get_records.assert_called_once()
+        assert first == second
+        stats = frontend_app.RECORDS_CACHE.stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 1
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_reloads_after_invalidation(self, mock_get_records):
+        """Test that a data change notification forces a fresh query"""
+        mock_get_records.side_effect = [
+            [("Old joke", "2024-01-01")],
+            [("New joke", "2024-01-02")],
+        ]
+
+        frontend_app.index()
+        frontend_app.RECORDS_CACHE.invalidate()
+        result = frontend_app.index()
+
+        assert mock_get_records.call_count == 2
+        assert b"New joke" in result
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_sets_validators(self, mock_get_records):
+        """Test that the page carries ETag and Last-Modified headers"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+
+        with boddle() as (request, response):
+            frontend_app.index()
+
+        assert response.get_header('ETag').startswith('"')
+        assert response.get_header('Last-Modified').endswith('GMT')
+        assert response.get_header('Cache-Control') == 'no-cache'
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_not_modified_by_etag(self, mock_get_records):
+        """Test that a matching If-None-Match gets an empty 304"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+        with boddle():
+            frontend_app.index()
+            etag = bottle.response.get_header('ETag')
+
+        with boddle(HTTP_IF_NONE_MATCH=etag) as (request, response):
+            result = frontend_app.index()
+
+        assert response.status_code == 304
+        assert result == b''
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_not_modified_since(self, mock_get_records):
+        """Test that If-Modified-Since at or after the data change gets a 304"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+        with boddle():
+            frontend_app.index()
+            last_modified = bottle.response.get_header('Last-Modified')
+
+        with boddle(HTTP_IF_MODIFIED_SINCE=last_modified) as (request, response):
+            frontend_app.index()
+
+        assert response.status_code == 304
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_route_changed_etag_renders(self, mock_get_records):
+        """Test that a stale ETag gets the full page"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+
+        with boddle(HTTP_IF_NONE_MATCH='"stale"') as (request, response):
+            result = frontend_app.index()
+
+        assert response.status_code == 200
+        assert b"Test joke" in result
+
+    @patch('frontend_app.get_last_20_records')
+    def test_rendered_page_reused_for_same_version(self, mock_get_records):
+        """Test that unchanged data after invalidation reuses the rendered bytes"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+
+        first = frontend_app.index()
+        frontend_app.RECORDS_CACHE.invalidate()
+        with patch.object(frontend_app, 'get_index_template') as mock_template:
+            second = frontend_app.index()
+
+        assert second is first
+        assert not mock_template.called
+
+    def test_older_render_does_not_evict_newer_page(self):
+        """Test that a thread finishing an older version leaves the newer page cached"""
+        frontend_app.RENDERED_PAGES.clear()
+        newer = frontend_app.render_index(frontend_app.CacheEntry([], 11, 0.0))
+        frontend_app.render_index(frontend_app.CacheEntry([], 10, 0.0))
+
+        assert frontend_app.RENDERED_PAGES == {11: newer}
+        frontend_app.RENDERED_PAGES.clear()
+
+    def test_internal_stats_route(self):
+        """Test that pool and cache counters are exposed"""
+        stats = frontend_app.internal_stats()
+
+        assert stats['db_pool']['in_use'] == 0
+        assert set(stats['records_cache']) == {'hits', 'misses', 'invalidations', 'loads'}
+        assert stats['search_cache']['size'] == 0
+
+    def test_api_records_route(self, mock_db_connection):
+        """Test that the API returns a JSON page with a cursor"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchall.return_value = [
+            (3, "Joke 3", date(2024, 1, 3)),
+            (2, "Joke 2", date(2024, 1, 2)),
+        ]
+
+        with boddle(QUERY_STRING='limit=1&from=2024-01-01'):
+            result = frontend_app.api_records()
+
+        assert result['records'] == [{'id': 3, 'name': 'Joke 3', 'date': '2024-01-03'}]
+        assert result['next_cursor'] is not None
+        params = mock_cursor.execute.call_args[0][1]
+        assert params == [date(2024, 1, 1), 2]
+
+    @pytest.mark.parametrize("query", [
+        'limit=0', 'limit=1000', 'limit=abc', 'from=yesterday', 'cursor=bogus',
+    ])
+    def test_api_records_bad_request(self, query):
+        """Test that invalid paging parameters are a 400, not a query"""
+        with boddle(QUERY_STRING=query):
+            result = frontend_app.api_records()
+            assert bottle.response.status_code == 400
+
+        assert 'error' in result
+
+    def test_api_records_database_error(self):
+        """Test that a database failure is reported as 503"""
+        with patch('psycopg2.connect', side_effect=Exception("Connection failed")):
+            with patch('builtins.print'):
+                with boddle():
+                    result = frontend_app.api_records()
+                    assert bottle.response.status_code == 503
+
+        assert result == {'error': 'database unavailable'}
+
+    def test_api_export_route(self, mock_db_connection):
+        """Test that the export streams CSV and returns its connection"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.__iter__.return_value = iter([(1, "Joke 1", date(2024, 1, 1))])
+
+        with boddle(QUERY_STRING='format=csv&from=2024-01-01'):
+            body = b''.join(frontend_app.api_export())
+            assert bottle.response.content_type == 'text/csv; charset=utf-8'
+            assert 'data.csv' in bottle.response.get_header('Content-Disposition')
+
+        assert body == b'id,name,date\n1,Joke 1,2024-01-01\n'
+        assert mock_conn.cursor.call_args[1] == {'name': 'records_export'}
+        assert mock_cursor.execute.call_args[0][1] == [date(2024, 1, 1)]
+        assert frontend_app.get_pool().stats()['in_use'] == 0
+
+    @pytest.mark.parametrize("query", [
+        'format=xml', 'from=yesterday', 'from=2024-02-01&to=2024-01-01',
+    ])
+    def test_api_export_bad_request(self, query):
+        """Test that invalid export parameters are a 400"""
+        with boddle(QUERY_STRING=query):
+            result = frontend_app.api_export()
+            assert bottle.response.status_code == 400
+
+        assert 'error' in result
+
+    def test_api_export_limits_concurrent_exports(self, mock_db_connection):
+        """Test that exports beyond the limit are turned away"""
+        slots = frontend_app.get_settings().export.max_concurrent
+        for _ in range(slots):
+            frontend_app.get_export_slots().acquire()
+        try:
+            with boddle():
+                result = frontend_app.api_export()
+                assert bottle.response.status_code == 429
+        finally:
+            for _ in range(slots):
+                frontend_app.get_export_slots().release()
+
+        assert 'error' in result
+
+    def test_api_feed_streams_events(self):
+        """Test that the feed answers with an event stream resuming after Last-Event-ID"""
+        frontend_app.get_record_feed.cache_clear()
+        with boddle(HTTP_LAST_EVENT_ID='41'):
+            with patch.object(frontend_app.RecordFeed, 'subscribe', autospec=True) as subscribe:
+                subscribe.return_value = MagicMock(evicted=False)
+                body = frontend_app.api_feed()
+                assert bottle.response.content_type == 'text/event-stream'
+                assert bottle.response.get_header('Cache-Control') == 'no-cache'
+
+        subscribe.assert_called_once_with(frontend_app.get_record_feed(), 41)
+        assert next(body).startswith(b"retry:")
+        frontend_app.get_record_feed.cache_clear()
+
+    def test_api_feed_limits_clients(self, monkeypatch):
+        """Test that streams beyond FEED_MAX_CLIENTS are told to retry later, not failed"""
+        monkeypatch.setenv('FEED_MAX_CLIENTS', '1')
+        frontend_app.get_record_feed.cache_clear()
+        frontend_app.get_record_feed().subscribe()
+        try:
+            with boddle():
+                result = frontend_app.api_feed()
+                assert bottle.response.status_code == 200
+                assert bottle.response.content_type == 'text/event-stream'
+        finally:
+            frontend_app.get_record_feed.cache_clear()
+
+        assert result.startswith(b"retry: 30000\n\n")
+        assert b"event: busy\n" in result
+
+    @patch('frontend_app.get_last_20_records')
+    def test_index_subscribes_only_with_feed_url(self, mock_get_records, monkeypatch):
+        """Test that the page opens an EventSource only when FEED_URL is set"""
+        mock_get_records.return_value = [("Test joke", "2024-01-01")]
+        frontend_app.RENDERED_PAGES.clear()
+
+        assert b"EventSource" not in frontend_app.index()
+
+        monkeypatch.setenv('FEED_URL', 'https://feed.example.com/api/feed')
+        frontend_app.get_settings.cache_clear()
+        frontend_app.RENDERED_PAGES.clear()
+        body = frontend_app.index()
+        frontend_app.RENDERED_PAGES.clear()
+
+        assert b'new EventSource("https://feed.example.com/api/feed")' in body
+
+    def test_static_file_route(self, tmp_path):
+        """Test that a built asset is served precompressed with an immutable lifetime"""
+        (tmp_path / 'manifest.json').write_text('{"app.css": {"path": "app.abc.css"}}')
+        (tmp_path / 'app.abc.css').write_bytes(b'body{}')
+        (tmp_path / 'app.abc.css.gz').write_bytes(b'gzipped')
+        assets = frontend_app.StaticAssets(str(tmp_path))
+
+        with patch('frontend_app.get_static_assets', return_value=assets):
+            with boddle(HTTP_ACCEPT_ENCODING='gzip, br'):
+                assert frontend_app.static_file('app.abc.css') == b'gzipped'
+                assert bottle.response.get_header('Content-Encoding') == 'gzip'
+                assert 'immutable' in bottle.response.get_header('Cache-Control')
+            with boddle():
+                assert frontend_app.static_file('missing.css') == b''
+                assert bottle.response.status_code == 404
+
+    def test_profile_route_disabled_without_token(self):
+        """Test that the profiling endpoint does not exist unless configured"""
+        with boddle(HTTP_AUTHORIZATION='Bearer anything'):
+            frontend_app.internal_profile()
+            assert bottle.response.status_code == 404
+
+    def test_profile_route_rejects_wrong_token(self, monkeypatch):
+        """Test that a wrong bearer token is refused before any sampling"""
+        monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+
+        with patch('frontend_app.get_profiler') as mock_profiler:
+            with boddle(HTTP_AUTHORIZATION='Bearer guess'):
+                frontend_app.internal_profile()
+                assert bottle.response.status_code == 403
+        mock_profiler.assert_not_called()
+
+    @pytest.mark.parametrize("query", ['seconds=0', 'seconds=301', 'seconds=abc', 'requests=-1'])
+    def test_profile_route_bad_request(self, monkeypatch, query):
+        """Test that out-of-range capture limits are rejected"""
+        monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+
+        with boddle(QUERY_STRING=query, HTTP_AUTHORIZATION='Bearer secret'):
+            frontend_app.internal_profile()
+            assert bottle.response.status_code == 400
+
+    def test_profile_route_returns_folded_stacks(self, monkeypatch):
+        """Test that a capture's folded stacks are returned as plain text"""
+        monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+
+        with patch('frontend_app.get_profiler') as mock_profiler:
+            mock_profiler.return_value.capture.return_value = 'MainThread;main (app.py:1) 3\n'
+            with boddle(QUERY_STRING='seconds=2&requests=50', HTTP_AUTHORIZATION='Bearer secret'):
+                result = frontend_app.internal_profile()
+                assert bottle.response.content_type.startswith('text/plain')
+
+        assert result == 'MainThread;main (app.py:1) 3\n'
+        mock_profiler.return_value.capture.assert_called_once_with(2.0, 50)
+
+    def test_profile_route_busy(self, monkeypatch):
+        """Test that a second capture in the same worker is refused"""
+        monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+
+        with patch('frontend_app.get_profiler') as mock_profiler:
+            mock_profiler.return_value.capture.return_value = None
+            with boddle(HTTP_AUTHORIZATION='Bearer secret'):
+                frontend_app.internal_profile()
+                assert bottle.response.status_code == 409
+
+    def test_api_stats_route(self, mock_db_connection):
+        """Test that the stats come from the daily summary table"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchall.return_value = [(date(2024, 1, 2), 5), (date(2024, 1, 3), 9)]
+        mock_cursor.fetchone.return_value = (120,)
+
+        with boddle(QUERY_STRING='days=2&to=2024-01-03'):
+            result = frontend_app.api_stats()
+
+        assert result['from'] == '2024-01-02'
+        assert [day['count'] for day in result['days']] == [5, 9]
+        assert (result['window_total'], result['total']) == (14, 120)
+        assert 'data_daily_counts' in repr(mock_cursor.execute.call_args_list[0][0][0])
+
+    @pytest.mark.parametrize("query", ['days=0', 'days=10000', 'days=abc', 'to=tomorrow'])
+    def test_api_stats_bad_request(self, query):
+        """Test that invalid stats parameters are a 400"""
+        with boddle(QUERY_STRING=query):
+            result = frontend_app.api_stats()
+            assert bottle.response.status_code == 400
+
+        assert 'error' in result
+
+    def test_stats_page_renders(self, mock_db_connection):
+        """Test that the stats page shows one row per day"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchall.return_value = [(date(2024, 1, 3), 9)]
+        mock_cursor.fetchone.return_value = (9,)
+
+        with boddle(QUERY_STRING='days=3&to=2024-01-03'):
+            body = frontend_app.stats_page()
+
+        assert 'Records per Day' in body
+        assert body.count('class="progress-bar"') == 3
+
+    def test_stats_page_database_error(self):
+        """Test that the stats page degrades to a notice when the database is down"""
+        with patch('psycopg2.connect', side_effect=Exception("Connection failed")):
+            with patch('builtins.print'):
+                with boddle():
+                    body = frontend_app.stats_page()
+                    assert bottle.response.status_code == 503
+
+        assert 'unavailable' in body
+
+    def test_api_search_route(self, mock_db_connection):
+        """Test that search returns ranked results and the next page"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchone.return_value = (2,)
+        mock_cursor.fetchall.return_value = [
+            (7, "Chuck Norris joke", date(2024, 1, 7), 0.5),
+            (3, "Another Chuck joke", date(2024, 1, 3), 0.25),
+        ]
+
+        with boddle(QUERY_STRING='q=Chuck++Norris&limit=1'):
+            result = frontend_app.api_search()
+
+        assert result['query'] == 'chuck norris'
+        assert result['results'] == [
+            {'id': 7, 'name': 'Chuck Norris joke', 'date': '2024-01-07', 'rank': 0.5}
+        ]
+        assert result['next_page'] == 2
+        params = mock_cursor.execute.call_args[0][1]
+        assert params['text'] == 'chuck norris'
+        assert (params['limit'], params['offset']) == (2, 0)
+
+    def test_api_search_cached(self, mock_db_connection):
+        """Test that a repeated query is served without touching the database"""
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchone.return_value = (0,)
+        mock_cursor.fetchall.return_value = []
+
+        for query in ('q=cats', 'q=CATS'):
+            with boddle(QUERY_STRING=query):
+                frontend_app.api_search()
+
+        assert mock_cursor.execute.call_count == 2
+        assert frontend_app.SEARCH_CACHE.stats()['hits'] == 1
+
+        frontend_app.invalidate_caches()
+        with boddle(QUERY_STRING='q=cats'):
+            frontend_app.api_search()
+        assert mock_cursor.execute.call_count == 4
+
+    @pytest.mark.parametrize("query", ['', 'q=++', 'q=a&page=0', 'q=a&page=999', 'q=' + 'x' * 300])
+    def test_api_search_bad_request(self, query):
+        """Test that empty, oversized or out-of-range searches are a 400"""
+        with boddle(QUERY_STRING=query):
+            result = frontend_app.api_search()
+            assert bottle.response.status_code == 400
+
+        assert 'error' in result
+
+    def test_metrics_route(self, mock_db_connection, monkeypatch, tmp_path):
+        """Test that query latency shows up on /metrics, with other workers' counts added"""
+        monkeypatch.setenv('METRICS_DIR', str(tmp_path))
+        frontend_app.get_shared_metrics.cache_clear()
+        mock_conn, mock_cursor = mock_db_connection
+        mock_cursor.fetchall.return_value = []
+        frontend_app.get_last_20_records()
+        other = {"pid": os.getppid(), "exited": True, "metrics": {
+            "rows_inserted_total": [[["other-worker"], 5]],
+        }}
+        (tmp_path / f'{os.getppid()}.json').write_text(json.dumps(other))
+
+        try:
+            with boddle():
+                body = frontend_app.metrics()
+                assert bottle.response.content_type.startswith('text/plain; version=0.0.4')
+        finally:
+            frontend_app.get_shared_metrics.cache_clear()
+
+        assert 'db_query_duration_seconds_count{query="last_20_records"}' in body
+        assert '# TYPE http_request_duration_seconds histogram' in body
+        assert 'rows_inserted_total{method="other-worker"} 5' in body
 
     def test_app_routes_registration(self):
         """Test that routes are properly registered"""
@@ -116,18 +558,18 @@ class TestFrontendApp:
         routes = [rule.rule for rule in frontend_app.app.router.rules]
         assert '/' in routes
 
-    @patch('frontend_app.run')
-    def test_main_execution(self, mock_run):
+    @patch('frontend_app.serve')
+    def test_main_execution(self, mock_serve):
         """Test the main execution block"""
         # Mock the __name__ == '__main__' condition
         with patch('frontend_app.__name__', '__main__'):
             # Import and execute the main block logic
             # Since we can't easily test the if __name__ == '__main__' block directly,
-            # we'll test that run would be called with correct parameters
+            # we'll test that serve would be called with correct parameters
             expected_args = {
                 'host': '0.0.0.0',
                 'port': 8080,
-                'debug': True
+                'debug': False
             }
             
             # Verify the app object exists and has the expected configuration
@@ -158,5 +600,5 @@ class TestFrontendApp:
         # Verify template was used (in actual implementation)
         # Note: Since SimpleTemplate is used directly in the code,
         # this test verifies the structure rather than mocked behavior
-        assert isinstance(result, str)
+        assert isinstance(result, bytes)
         assert len(result) > 0
\ No newline at end of file
@@ -0,0 +1,258 @@
+"""
+Tests for http_client.py, run against a local fault-injecting stub server
+"""
+import pytest
+from typing import Any, Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import CircuitBreaker, CircuitOpenError, FetchError, ResilientClient
+
+
+class FaultInjectingHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next scripted fault, then with jokes.
+
+    Script entries: ``("ok", headers)``, ``("status", code, headers)``,
+    ``("reset",)`` (drop the connection without answering), ``("delay", seconds)``
+    and ``("garbage",)`` (a 200 that is not JSON). A request carrying a
+    matching ``If-None-Match`` gets a 304 when the entry's headers set an ETag.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    script: list[tuple] = []
+    requests: list[dict[str, str]] = []
+    connections: set[tuple[str, int]] = set()
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        with self.lock:
+            action = self.script.pop(0) if self.script else ("ok", {})
+            self.requests.append(dict(self.headers))
+            self.connections.add(self.client_address)
+            number = len(self.requests)
+        kind = action[0]
+        if kind == "reset":
+            self.close_connection = True
+            return
+        if kind == "delay":
+            time.sleep(action[1])
+        headers = action[-1] if isinstance(action[-1], dict) else {}
+        if kind == "status":
+            self._send(action[1], b'{"error": "injected"}', headers)
+        elif kind == "garbage":
+            self._send(200, b'<html>maintenance</html>', headers)
+        elif headers.get("ETag") and self.headers.get("If-None-Match") == headers["ETag"]:
+            self._send(304, b'', headers)
+        else:
+            self._send(200, json.dumps({"joke": f"joke {number}"}).encode(), headers)
+
+    def _send(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def stub() -> Iterator[tuple[str, type[FaultInjectingHandler]]]:
+    """Start the stub on a free local port; returns (url, handler class)"""
+    FaultInjectingHandler.script = []
+    FaultInjectingHandler.requests = []
+    FaultInjectingHandler.connections = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FaultInjectingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/', FaultInjectingHandler
+    server.shutdown()
+    server.server_close()
+
+
+class RecordingClient(ResilientClient):
+    """Client that records backoff delays instead of sleeping"""
+
+    def __init__(self, **kwargs: Any) -> None:
+        self.delays: list[float] = []
+        options: dict[str, Any] = {"timeout": 2, "backoff": 0.5, "sleep": self.delays.append}
+        options.update(kwargs)
+        super().__init__("stub", **options)
+
+
+def make_client(**kwargs: Any) -> RecordingClient:
+    return RecordingClient(**kwargs)
+
+
+class TestResilientClient:
+    """Test suite for retries, the circuit breaker and caching"""
+
+    def test_transient_faults_are_retried(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that a 503 and a dropped connection are retried until success"""
+        url, handler = stub
+        handler.script = [("status", 503, {}), ("reset",)]
+        client = make_client(retries=3)
+
+        assert client.get_json(url) == {"joke": "joke 3"}
+        assert len(handler.requests) == 3
+        assert len(client.delays) == 2
+        assert 0 <= client.delays[0] <= 0.5 and 0 <= client.delays[1] <= 1.0
+
+    def test_gives_up_after_retries(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that persistent failure surfaces as a retryable FetchError"""
+        url, handler = stub
+        handler.script = [("status", 502, {})] * 3
+        client = make_client(retries=2)
+
+        with pytest.raises(FetchError) as error:
+            client.get_json(url)
+
+        assert error.value.retryable
+        assert "HTTP 502" in str(error.value)
+        assert len(handler.requests) == 3
+
+    def test_client_errors_are_not_retried(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that a 404 fails at once: repeating it cannot help"""
+        url, handler = stub
+        handler.script = [("status", 404, {})]
+        client = make_client(retries=3)
+
+        with pytest.raises(FetchError) as error:
+            client.get_json(url)
+
+        assert not error.value.retryable
+        assert len(handler.requests) == 1
+
+    def test_retry_after_is_honoured_and_capped(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that 429 waits as long as the upstream asks, up to backoff_max"""
+        url, handler = stub
+        handler.script = [("status", 429, {"Retry-After": "2"}), ("status", 503, {"Retry-After": "600"})]
+        client = make_client(retries=2, backoff_max=10)
+
+        client.get_json(url)
+
+        assert client.delays == [2.0, 10.0]
+
+    def test_timeout_is_retried(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that a slow response times out and the retry succeeds"""
+        url, handler = stub
+        handler.script = [("delay", 0.5)]
+        client = make_client(retries=1, timeout=0.1)
+
+        assert client.get_json(url)["joke"].startswith("joke ")
+        assert len(client.delays) == 1
+
+    def test_invalid_json_is_a_fetch_error(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that a maintenance page is reported, never returned as data"""
+        url, handler = stub
+        handler.script = [("garbage",)]
+        client = make_client(retries=3)
+
+        with pytest.raises(FetchError, match="invalid response"):
+            client.get_json(url)
+        assert len(handler.requests) == 1
+
+    def test_circuit_opens_and_recovers(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that a dead upstream is not called until the reset timeout passes"""
+        url, handler = stub
+        handler.script = [("status", 503, {})] * 2
+        client = make_client(retries=0, failure_threshold=2, reset_timeout=0.2)
+
+        for _ in range(2):
+            with pytest.raises(FetchError):
+                client.get_json(url)
+        with pytest.raises(CircuitOpenError):
+            client.get_json(url)
+        assert len(handler.requests) == 2
+        assert client.breaker().state == "open"
+
+        time.sleep(0.25)
+        assert client.get_json(url) == {"joke": "joke 3"}
+        assert client.breaker().state == "closed"
+
+    def test_circuit_stops_retries(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that retries end as soon as the breaker opens"""
+        url, handler = stub
+        handler.script = [("status", 503, {})] * 10
+        client = make_client(retries=5, failure_threshold=2)
+
+        with pytest.raises(CircuitOpenError):
+            client.get_json(url)
+        assert len(handler.requests) == 2
+
+    def test_breakers_are_per_source(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that one failing source does not block another"""
+        url, handler = stub
+        handler.script = [("status", 503, {})]
+        client = make_client(retries=0, failure_threshold=1)
+
+        with pytest.raises(FetchError):
+            client.get_json(url + 'broken', source="broken")
+
+        assert client.get_json(url, source="ok")["joke"].startswith("joke ")
+
+    def test_cached_only_when_upstream_allows(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that max-age responses are reused and uncacheable ones are not"""
+        url, handler = stub
+        handler.script = [("ok", {"Cache-Control": "max-age=60"})]
+        client = make_client()
+
+        assert client.get_json(url) == client.get_json(url) == {"joke": "joke 1"}
+        assert len(handler.requests) == 1
+        assert client.get_json(url + '?fresh') != client.get_json(url + '?fresh')
+
+    def test_etag_revalidation(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that an ETag is revalidated and a 304 reuses the stored body"""
+        url, handler = stub
+        headers = {"Cache-Control": "no-cache", "ETag": '"v1"'}
+        handler.script = [("ok", headers), ("ok", headers)]
+        client = make_client()
+
+        assert client.get_json(url) == client.get_json(url) == {"joke": "joke 1"}
+        assert handler.requests[1].get("If-None-Match") == '"v1"'
+
+    def test_connections_are_reused(self, stub: tuple[str, type[FaultInjectingHandler]]) -> None:
+        """Test that the session keeps one connection alive across calls"""
+        url, handler = stub
+        client = make_client()
+
+        for _ in range(5):
+            client.get_json(url)
+
+        assert len(handler.connections) == 1
+
+    def test_tls_verified_by_default(self) -> None:
+        """Test that certificates are checked unless explicitly disabled"""
+        assert ResilientClient().session.verify is True
+
+
+class TestCircuitBreaker:
+    """Test suite for the breaker state machine"""
+
+    def test_failed_trial_reopens(self) -> None:
+        """Test that a failing half-open trial opens the circuit again"""
+        now = [0.0]
+        breaker = CircuitBreaker("src", failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        assert not breaker.allow()
+        now[0] = 11
+        assert breaker.state == "half-open"
+        assert breaker.allow()
+        assert not breaker.allow()  # only one trial at a time
+        breaker.record_failure()
+        assert breaker.state == "open"
+        now[0] = 22
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.failures == 0
@@ -0,0 +1,249 @@
+"""
+Tests for ingest_writer.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from typing import Any
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import ingest_writer
+from spool import DiskSpool
+
+
+@pytest.fixture
+def mock_pool() -> tuple[MagicMock, MagicMock, MagicMock]:
+    """Pool double whose connection records cursor calls"""
+    pool = MagicMock()
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.rowcount = 1
+    conn.__enter__.return_value = conn
+    conn.cursor.return_value.__enter__.return_value = cursor
+    pool.getconn.return_value = conn
+    return pool, conn, cursor
+
+
+class TestBufferedWriter:
+    """Test suite for the batched database writer"""
+
+    def test_rows_buffered_until_batch_size(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that nothing is written before the batch fills up"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool, batch_size=3)
+
+        with patch('ingest_writer.execute_values') as mock_execute_values:
+            writer.add("one", date(2024, 1, 1))
+            writer.add("two", date(2024, 1, 1))
+            assert not mock_execute_values.called
+
+            writer.add("three", date(2024, 1, 1))
+
+        query = repr(mock_execute_values.call_args[0][1])
+        assert "INSERT INTO " in query and "Identifier('data')" in query
+        rows = mock_execute_values.call_args[0][2]
+        assert rows == [
+            ("one", date(2024, 1, 1)),
+            ("two", date(2024, 1, 1)),
+            ("three", date(2024, 1, 1)),
+        ]
+        assert writer.pending() == 0
+        pool.putconn.assert_called_once_with(conn)
+
+    def test_copy_method_streams_rows(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that the COPY method sends tab separated rows"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool, batch_size=10, method="copy")
+        writer.add("tab\there", date(2024, 1, 2))
+
+        assert writer.flush() == 1
+
+        buf = cursor.copy_expert.call_args[0][1]
+        assert buf.read() == "tab\\there\t2024-01-02\n"
+        copy = repr(cursor.copy_expert.call_args[0][0])
+        assert "COPY " in copy and "Identifier('data')" in copy
+
+    def test_flush_interval_makes_batch_due(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that a partial batch becomes due after the flush interval"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool, batch_size=100, flush_interval=0)
+
+        assert not writer.is_due()
+        writer.add("joke", date(2024, 1, 1))
+
+        assert writer.is_due()
+
+    def test_failed_flush_keeps_rows(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that rows survive a database error and are retried"""
+        pool, conn, cursor = mock_pool
+        pool.getconn.side_effect = [Exception("Connection failed"), conn]
+        writer = ingest_writer.BufferedWriter(pool, batch_size=10)
+        writer.add("joke", date(2024, 1, 1))
+
+        with patch('builtins.print') as mock_print:
+            assert writer.flush() == 0
+        mock_print.assert_called_with("Error flushing 1 rows: Connection failed")
+        assert writer.pending() == 1
+
+        with patch('ingest_writer.execute_values'):
+            assert writer.flush() == 1
+        assert writer.stats()['errors'] == 1
+        assert writer.stats()['rows_written'] == 1
+
+    def test_pending_limit_drops_oldest(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that the retry buffer is bounded"""
+        pool, conn, cursor = mock_pool
+        pool.getconn.side_effect = Exception("Connection failed")
+        writer = ingest_writer.BufferedWriter(pool, batch_size=10, max_pending=2)
+        for i in range(3):
+            writer.add(f"joke {i}", date(2024, 1, 1))
+
+        with patch('builtins.print'):
+            writer.flush()
+
+        assert writer.pending() == 2
+        assert writer.stats()['dropped'] == 1
+
+    def test_close_flushes_remaining_rows(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that shutdown writes whatever is still buffered"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool, batch_size=100, flush_interval=60)
+        writer.start()
+        writer.add("last joke", date(2024, 1, 1))
+
+        with patch('ingest_writer.execute_values') as mock_execute_values:
+            writer.close()
+
+        assert mock_execute_values.called
+        assert writer.pending() == 0
+
+    def test_invalid_rows_rejected(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that empty rows and fetch errors are never buffered"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool)
+
+        writer.add("   ", date(2024, 1, 1))
+        writer.add("Error fetching joke: timed out", date(2024, 1, 1))
+
+        assert writer.pending() == 0
+        assert writer.stats()['rejected'] == 2
+
+    def test_repeated_rows_filtered_in_memory(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that a repeated joke is dropped before reaching the database"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(pool)
+
+        writer.add("Same joke", date(2024, 1, 1))
+        writer.add("Same joke ", date(2024, 1, 2))
+
+        assert writer.pending() == 1
+        assert writer.stats()['dedupe_memory_hits'] == 1
+
+    def test_database_duplicates_counted(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock]) -> None:
+        """Test that rows skipped by the dedupe trigger count towards the hit rate"""
+        pool, conn, cursor = mock_pool
+        cursor.rowcount = 1
+        writer = ingest_writer.BufferedWriter(pool, batch_size=10)
+        writer.add("new joke", date(2024, 1, 1))
+        writer.add("joke stored by another worker", date(2024, 1, 1))
+
+        with patch('ingest_writer.execute_values'):
+            assert writer.flush() == 1
+
+        stats = writer.stats()
+        assert stats['rows_written'] == 1
+        assert stats['dedupe_db_duplicates'] == 1
+        assert stats['dedupe_hit_rate'] == 0.5
+
+    def test_failed_write_goes_to_spool(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock], tmp_path: Path) -> None:
+        """Test that a batch the database cannot take is spooled, and later ones skip the database"""
+        pool, conn, cursor = mock_pool
+        pool.getconn.side_effect = psycopg2.OperationalError("Connection failed")
+        spool = DiskSpool(str(tmp_path))
+        writer = ingest_writer.BufferedWriter(pool, batch_size=10, spool=spool, retry_after=60)
+
+        with patch('builtins.print'):
+            assert writer.write([("one", date(2024, 1, 1))]) == 0
+        assert writer.write([("two", date(2024, 1, 1))]) == 0
+
+        assert pool.getconn.call_count == 1
+        assert spool.read(10)[0] == [("one", date(2024, 1, 1)), ("two", date(2024, 1, 1))]
+        assert writer.stats()['spooled'] == 2
+
+    def test_replay_copies_and_clears_outage(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock], tmp_path: Path) -> None:
+        """Test that a successful replay sends the next write to the database again"""
+        pool, conn, cursor = mock_pool
+        writer = ingest_writer.BufferedWriter(
+            pool, spool=DiskSpool(str(tmp_path)), retry_after=60
+        )
+        writer._unhealthy_until = float("inf")
+
+        assert writer.replay([("one", date(2024, 1, 1))]) == 1
+        assert cursor.copy_expert.called
+        with patch('ingest_writer.execute_values'):
+            assert writer.write([("two", date(2024, 1, 1))]) == 1
+
+    def test_full_spool_keeps_rows_in_memory(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock], tmp_path: Path) -> None:
+        """Test that rows stay buffered when neither database nor spool takes them"""
+        pool, conn, cursor = mock_pool
+        pool.getconn.side_effect = psycopg2.OperationalError("Connection failed")
+        writer = ingest_writer.BufferedWriter(
+            pool, batch_size=10, spool=DiskSpool(str(tmp_path), max_bytes=1)
+        )
+        writer.add("joke", date(2024, 1, 1))
+
+        with patch('builtins.print'):
+            assert writer.flush() == 0
+
+        assert writer.pending() == 1
+
+    def test_other_errors_are_not_spooled(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock], tmp_path: Path) -> None:
+        """Test that a bug in the statement surfaces instead of filling the spool"""
+        pool, conn, cursor = mock_pool
+        spool = DiskSpool(str(tmp_path))
+        writer = ingest_writer.BufferedWriter(pool, spool=spool)
+
+        with patch('ingest_writer.execute_values', side_effect=psycopg2.ProgrammingError("bad sql")):
+            with pytest.raises(psycopg2.ProgrammingError):
+                writer.write([("one", date(2024, 1, 1))])
+
+        assert spool.backlog() == 0
+
+    def test_refused_rows_are_isolated_and_dead_lettered(self, mock_pool: tuple[MagicMock, MagicMock, MagicMock], tmp_path: Path) -> None:
+        """Test that only the rows the database refuses are set aside, not their batch"""
+        pool, conn, cursor = mock_pool
+        spool = DiskSpool(str(tmp_path))
+        writer = ingest_writer.BufferedWriter(pool, spool=spool)
+        batch = [(name, date(2024, 1, 1)) for name in ("a", "b", "bad", "c", "d")]
+        inserted = []
+
+        def execute(cur: Any, query: Any, rows: Any, page_size: Any) -> None:
+            if ("bad", date(2024, 1, 1)) in rows:
+                raise psycopg2.IntegrityError("no partition of relation \"data\" found for row")
+            inserted.extend(rows)
+
+        with patch('ingest_writer.execute_values', side_effect=execute):
+            with patch('builtins.print'):
+                writer.write(batch)
+
+        assert sorted(name for name, _ in inserted) == ["a", "b", "c", "d"]
+        assert spool.dead_letters() == [("bad", date(2024, 1, 1))]
+        assert spool.backlog() == 0
+        assert writer.stats()['refused'] == 1
+        assert writer._unhealthy_until == 0.0
+
+    def test_unknown_method_rejected(self) -> None:
+        """Test that an unsupported write method is refused"""
+        with pytest.raises(ValueError):
+            ingest_writer.BufferedWriter(MagicMock(), method="magic")
+
+    def test_copy_escaping(self) -> None:
+        """Test escaping of COPY text format special characters"""
+        buf = ingest_writer.rows_to_copy_buffer([("a\\b\nc", 1)])
+        assert buf.read() == "a\\\\b\\nc\t1\n"
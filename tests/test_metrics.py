@@ -0,0 +1,239 @@
+"""
+Tests for metrics.py
+"""
+import pytest
+from unittest.mock import patch
+from pathlib import Path
+from typing import Any
+import io
+import json
+import urllib.request
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bottle
+import metrics
+
+
+@pytest.fixture
+def registry() -> metrics.Registry:
+    """A private registry so tests never see the app's own metrics"""
+    return metrics.Registry()
+
+
+def call_wsgi(app: Any, path: Any) -> Any:
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'SERVER_NAME': 'test',
+        'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    status = []
+    b''.join(app(environ, lambda s, h, exc_info=None: status.append(s)))
+    return status[0]
+
+
+class TestMetrics:
+    """Test suite for the metrics registry and instruments"""
+
+    def test_counter_render(self, registry: metrics.Registry) -> None:
+        """Test that counters render in the Prometheus text format"""
+        counter = metrics.Counter('jobs_total', 'Jobs run.', ('kind',), registry=registry)
+        counter.inc(kind='a')
+        counter.inc(2, kind='a')
+
+        assert counter.value(kind='a') == 3
+        assert registry.render() == (
+            '# HELP jobs_total Jobs run.\n'
+            '# TYPE jobs_total counter\n'
+            'jobs_total{kind="a"} 3\n'
+        )
+
+    def test_histogram_buckets_are_cumulative(self, registry: metrics.Registry) -> None:
+        """Test that each bucket counts every observation at or below it"""
+        histogram = metrics.Histogram(
+            'latency_seconds', 'Latency.', buckets=(0.1, 1.0), registry=registry
+        )
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+        assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+        assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum 3.65' in lines
+        assert 'latency_seconds_count 4' in lines
+
+    def test_labels_must_match(self, registry: metrics.Registry) -> None:
+        """Test that missing or unexpected labels are rejected"""
+        counter = metrics.Counter('c_total', 'C.', ('a',), registry=registry)
+
+        with pytest.raises(ValueError):
+            counter.inc(b='x')
+
+    def test_duplicate_name_rejected(self, registry: metrics.Registry) -> None:
+        """Test that two metrics cannot share a name"""
+        metrics.Counter('dup_total', 'Dup.', registry=registry)
+
+        with pytest.raises(ValueError, match="already registered"):
+            metrics.Counter('dup_total', 'Dup.', registry=registry)
+
+    def test_label_values_escaped(self, registry: metrics.Registry) -> None:
+        """Test that quotes and newlines in label values stay valid"""
+        gauge = metrics.Gauge('g', 'G.', ('path',), registry=registry)
+        gauge.set(1, path='a"b\nc')
+
+        assert 'g{path="a\\"b\\nc"} 1' in registry.render()
+
+    def test_gauge_callback(self, registry: metrics.Registry) -> None:
+        """Test that callback gauges are read at scrape time"""
+        values = iter([1, 2])
+        metrics.Gauge('in_use', 'In use.', callback=lambda: next(values), registry=registry)
+
+        assert 'in_use 1' in registry.render()
+        assert 'in_use 2' in registry.render()
+
+    def test_timed_counts_errors(self, registry: metrics.Registry) -> None:
+        """Test that a failing block is both timed and counted"""
+        histogram = metrics.Histogram('q_seconds', 'Q.', ('query',), registry=registry)
+        errors = metrics.Counter('q_errors_total', 'Q.', ('query',), registry=registry)
+
+        with pytest.raises(RuntimeError):
+            with metrics.timed(histogram, errors, query='insert'):
+                raise RuntimeError('boom')
+        with metrics.timed(histogram, errors, query='insert'):
+            pass
+
+        assert histogram.count(query='insert') == 2
+        assert errors.value(query='insert') == 1
+
+    def test_request_timing_plugin(self, registry: metrics.Registry) -> None:
+        """Test that requests are labelled by route rule and status"""
+        histogram = metrics.Histogram(
+            'req_seconds', 'Req.', ('method', 'route', 'status'), registry=registry
+        )
+        app = bottle.Bottle()
+        app.install(metrics.RequestTimingPlugin(histogram))
+
+        @app.route('/items/<item_id>')
+        def item(item_id: Any) -> Any:
+            if item_id == 'missing':
+                bottle.abort(404)
+            return 'ok'
+
+        assert call_wsgi(app, '/items/1').startswith('200')
+        assert call_wsgi(app, '/items/2').startswith('200')
+        assert call_wsgi(app, '/items/missing').startswith('404')
+
+        assert histogram.count(method='GET', route='/items/<item_id>', status=200) == 2
+        assert histogram.count(method='GET', route='/items/<item_id>', status=404) == 1
+
+    def test_http_listener(self, registry: metrics.Registry) -> None:
+        """Test that the standalone listener serves /metrics"""
+        metrics.Counter('served_total', 'Served.', registry=registry).inc()
+        server = metrics.start_http_server(0, '127.0.0.1', registry)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}'
+            with urllib.request.urlopen(url + '/metrics') as resp:
+                assert resp.headers['Content-Type'] == metrics.CONTENT_TYPE
+                assert b'served_total 1' in resp.read()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + '/other')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def worker_file(path: Any, pid: Any, exited: Any, registry: metrics.Registry) -> None:
+    """Write what another worker process would have left in the shared directory"""
+    data = {"pid": pid, "exited": exited, "metrics": registry.snapshot()}
+    (path / f"{pid}.json").write_text(json.dumps(data))
+
+
+def exited_pid() -> int:
+    """A pid that is neither this process nor any running one"""
+    pid = 2 ** 22  # above the largest pid_max Linux allows
+    while pid == os.getpid() or metrics._is_running(pid):
+        pid += 1
+    return pid
+
+
+def instruments(registry: metrics.Registry) -> Any:
+    return (
+        metrics.Counter('jobs_total', 'Jobs run.', ('kind',), registry=registry),
+        metrics.Gauge('busy', 'Busy.', registry=registry),
+        metrics.Histogram('job_seconds', 'Job time.', buckets=(0.1,), registry=registry),
+    )
+
+
+class TestSharedMetrics:
+    """Test suite for answering /metrics for every worker of a pre-forking server"""
+
+    def test_merges_other_workers(self, registry: metrics.Registry, tmp_path: Path) -> None:
+        """Test that counters and histograms add up, and exited workers' gauges are dropped"""
+        counter, gauge, histogram = instruments(registry)
+        counter.inc(2, kind='a')
+        gauge.set(1)
+        histogram.observe(0.05)
+        live, exited = metrics.Registry(), metrics.Registry()
+        for other, value in ((live, 3), (exited, 5)):
+            other_counter, other_gauge, other_histogram = instruments(other)
+            other_counter.inc(value, kind='a')
+            other_gauge.set(value)
+            other_histogram.observe(1.0)
+        worker_file(tmp_path, os.getppid(), False, live)
+        worker_file(tmp_path, exited_pid(), True, exited)
+
+        lines = metrics.SharedMetrics(str(tmp_path), registry).render().splitlines()
+
+        assert 'jobs_total{kind="a"} 10' in lines
+        assert 'busy 4' in lines
+        assert 'job_seconds_bucket{le="0.1"} 1' in lines
+        assert 'job_seconds_count 3' in lines
+
+    def test_start_keeps_counters_of_a_reused_pid(self, registry: metrics.Registry, tmp_path: Path) -> None:
+        """Test that a new worker given an exited worker's pid does not overwrite its counts"""
+        counter, gauge, histogram = instruments(registry)
+        previous = metrics.Registry()
+        instruments(previous)[0].inc(7, kind='a')
+        worker_file(tmp_path, os.getpid(), False, previous)
+        shared = metrics.SharedMetrics(str(tmp_path), registry, interval=60)
+
+        shared.start()
+        counter.inc(kind='a')
+        shared.stop()
+
+        assert sorted(p.name for p in tmp_path.glob('*.json')) == sorted([f'{os.getpid()}.json', 'exited.json'])
+        assert 'jobs_total{kind="a"} 8' in shared.render()
+        assert json.loads((tmp_path / f'{os.getpid()}.json').read_text())['exited'] is True
+
+    def test_exited_workers_are_folded_into_one_file(self, registry: metrics.Registry, tmp_path: Path) -> None:
+        """Test that a scrape sums exited workers into exited.json and removes their files"""
+        instruments(registry)
+        shared = metrics.SharedMetrics(str(tmp_path), registry)
+        for value in (3, 4):
+            other = metrics.Registry()
+            other_counter, other_gauge, other_histogram = instruments(other)
+            other_counter.inc(value, kind='a')
+            other_gauge.set(value)
+            other_histogram.observe(1.0)
+            worker_file(tmp_path, exited_pid(), True, other)
+
+            first = shared.render()
+
+        assert [p.name for p in tmp_path.glob('*.json')] == ['exited.json']
+        assert shared.render() == first
+        assert 'jobs_total{kind="a"} 7' in first.splitlines()
+        assert 'job_seconds_count 2' in first.splitlines()
+        assert not any(line.startswith('busy ') for line in first.splitlines())
+
+    def test_reset_forgets_previous_run(self, registry: metrics.Registry, tmp_path: Path) -> None:
+        """Test that files left by an earlier server run are removed"""
+        instruments(registry)
+        worker_file(tmp_path, os.getppid(), True, registry)
+
+        metrics.SharedMetrics(str(tmp_path), registry).reset()
+
+        assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,187 @@
+"""
+Tests for migrations.py
+"""
+import functools
+import pytest
+from unittest.mock import MagicMock, call, patch
+from typing import Any
+from datetime import datetime
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from migrations import Migration, MigrationError
+
+
+def make_conn(fetchone: Any = None, fetchall: Any = None) -> Any:
+    """Connection whose single cursor answers fetches in the given order"""
+    conn = MagicMock()
+    conn.closed = 0
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchone.side_effect = fetchone
+    cur.fetchall.side_effect = fetchall
+    return conn, cur
+
+
+def executed(cur: MagicMock) -> list[str]:
+    return [c[0][0] for c in cur.execute.call_args_list]
+
+
+def recording(name: Any, log: Any) -> Any:
+    """Migration that logs whether it ran in autocommit mode"""
+    return lambda conn: log.append((name, conn.autocommit))
+
+
+class TestMigrationRunner:
+    """Test suite for applying versioned migrations under the advisory lock"""
+
+    def test_applies_only_pending_versions_in_order(self) -> None:
+        """Test that recorded versions are skipped and the rest are recorded"""
+        log: list[tuple[str, bool]] = []
+        steps = [
+            Migration(1, "one", recording("one", log)),
+            Migration(2, "two", recording("two", log)),
+            Migration(3, "three", recording("three", log), transactional=False),
+        ]
+        conn, cur = make_conn(fetchone=[(True,), (True,)], fetchall=[[(1, datetime(2024, 1, 1))]])
+
+        with patch('builtins.print'):
+            applied = migrations.migrate(conn, steps)
+
+        assert [m.version for m in applied] == [2, 3]
+        assert log == [("two", False), ("three", True)]
+        assert cur.execute.call_args_list[-3:-1] == [
+            call(migrations.RECORD_SQL, (2, "two")),
+            call(migrations.RECORD_SQL, (3, "three")),
+        ]
+        assert cur.execute.call_args_list[-1] == call(
+            migrations.UNLOCK_SQL, (migrations.MIGRATION_LOCK_ID,)
+        )
+
+    def test_target_stops_early(self) -> None:
+        """Test that --target leaves later versions pending"""
+        steps = [Migration(v, str(v), MagicMock()) for v in (1, 2, 3)]
+
+        assert [m.version for m in migrations.pending_migrations({}, steps, target=2)] == [1, 2]
+
+    def test_versions_must_ascend(self) -> None:
+        """Test that a misnumbered migration list is refused before touching the schema"""
+        steps = [Migration(2, "b", MagicMock()), Migration(1, "a", MagicMock())]
+
+        with pytest.raises(MigrationError, match="unique and ascending"):
+            migrations.pending_migrations({}, steps)
+
+    def test_failed_migration_is_not_recorded_and_lock_released(self) -> None:
+        """Test that a failing migration rolls back and frees the lock for a retry"""
+        def broken(conn: Any) -> None:
+            raise RuntimeError("syntax error")
+
+        conn, cur = make_conn(fetchone=[(True,)], fetchall=[[]])
+
+        with patch('builtins.print'):
+            with pytest.raises(RuntimeError):
+                migrations.migrate(conn, [Migration(1, "broken", broken)])
+
+        statements = executed(cur)
+        assert migrations.RECORD_SQL not in statements
+        assert statements[-1] == migrations.UNLOCK_SQL
+        assert conn.autocommit is False
+
+    def test_waits_for_another_runner(self) -> None:
+        """Test that a busy lock is polled until free, without blocking in the server"""
+        conn, cur = make_conn(fetchone=[(False,), (False,), (True,)], fetchall=[[]])
+        sleep = MagicMock()
+
+        with patch('builtins.print') as mock_print:
+            with migrations.migration_lock(conn, timeout=60, sleep=sleep):
+                pass
+
+        assert sleep.call_count == 2
+        mock_print.assert_called_once_with("Waiting for another migration run to finish")
+
+    def test_lock_timeout(self) -> None:
+        """Test that a runner gives up instead of waiting forever"""
+        conn, cur = make_conn(fetchone=[(False,)] * 5)
+
+        with patch('builtins.print'):
+            with pytest.raises(MigrationError, match="held the lock"):
+                with migrations.migration_lock(conn, timeout=0, sleep=MagicMock()):
+                    pass
+        assert conn.autocommit is False
+
+
+class TestConcurrentIndex:
+    """Test suite for index builds that do not block writes"""
+
+    def test_plain_table(self) -> None:
+        """Test that a plain table gets one concurrent build"""
+        conn, cur = make_conn(fetchone=[("r",), None])
+
+        migrations.build_index_concurrently(conn, "t_x_idx", "t", "(x)")
+
+        assert executed(cur)[-1] == "CREATE INDEX CONCURRENTLY IF NOT EXISTS t_x_idx ON t (x)"
+
+    def test_invalid_leftover_is_rebuilt(self) -> None:
+        """Test that the invalid index left by a failed build is dropped first"""
+        conn, cur = make_conn(fetchone=[("r",), (1,)])
+
+        migrations.build_index_concurrently(conn, "t_x_idx", "t", "(x)")
+
+        assert "DROP INDEX CONCURRENTLY t_x_idx" in executed(cur)
+
+    def test_partitioned_table_indexes_each_partition(self) -> None:
+        """Test that partitions are indexed one by one and attached to the parent"""
+        conn, cur = make_conn(
+            fetchone=[("p",), None],
+            fetchall=[[("data_p202401",)], [("data_p202401",), ("data_p202402",)]],
+        )
+
+        migrations.build_index_concurrently(conn, "data_date_id_idx", "data", "(date, id)")
+
+        statements = executed(cur)
+        assert "CREATE INDEX IF NOT EXISTS data_date_id_idx ON ONLY data (date, id)" in statements
+        builds = [sql for sql in statements if "CONCURRENTLY IF NOT EXISTS" in sql]
+        assert builds == [
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS data_p202402_date_id_idx "
+            "ON data_p202402 (date, id)"
+        ]
+        assert statements[-1] == "ALTER INDEX data_date_id_idx ATTACH PARTITION data_p202402_date_id_idx"
+
+
+class TestBackfill:
+    """Test suite for batched backfills"""
+
+    def test_walks_keys_in_batches(self) -> None:
+        """Test that each batch resumes after the last key and commits on its own"""
+        conn, cur = make_conn(fetchall=[[(1,), (2,)], [(5,), (3,)], []])
+        sleep = MagicMock()
+
+        total = migrations.backfill_in_batches(
+            conn, "data", "flag = true", "flag IS NULL", batch_size=2, pause=0.1, sleep=sleep
+        )
+
+        assert total == 4
+        params = [c[0][1] for c in cur.execute.call_args_list]
+        assert params == [(2,), (2, 2), (5, 2)]
+        assert conn.__exit__.call_count == 3
+        assert sleep.call_count == 2
+
+    def test_search_column_is_added_without_a_rewrite(self) -> None:
+        """Test that the search column is filled by a trigger and a backfill before indexing"""
+        by_name = {m.name: m for m in migrations.MIGRATIONS}
+        column = by_name["search column"]
+        assert isinstance(column.apply, functools.partial)
+        statements = column.apply.keywords["statements"]
+        assert column.transactional
+        assert not any("GENERATED" in sql for sql in statements)
+        assert "ALTER TABLE data ADD COLUMN IF NOT EXISTS name_tsv tsvector" in statements
+
+        backfill = by_name["search column backfill"]
+        index = by_name["search index"]
+        assert not backfill.transactional
+        assert isinstance(backfill.apply, functools.partial)
+        assert backfill.apply.func is migrations.backfill_in_batches
+        assert column.version < backfill.version < index.version
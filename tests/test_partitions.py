@@ -0,0 +1,156 @@
+"""
+Tests for partitions.py
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from typing import Any
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import partitions
+
+
+def bounds(*entries: Any) -> Any:
+    """Catalog rows as returned by the partition listing query"""
+    return [(name, f"FOR VALUES FROM ({lower}) TO ('{upper}')") for name, lower, upper in entries]
+
+
+def executed(cur: MagicMock) -> list[str]:
+    return [call[0][0] for call in cur.execute.call_args_list]
+
+
+class TestPartitions:
+    """Test suite for date partitioning and retention"""
+
+    def test_add_months_crosses_years(self) -> None:
+        """Test that month arithmetic wraps around the year"""
+        assert partitions.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert partitions.add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+        assert partitions.partition_name(date(2024, 2, 1)) == "data_p202402"
+
+    def test_list_partitions_sorted_by_upper_bound(self) -> None:
+        """Test that bounds are parsed from the catalog expression"""
+        cur = MagicMock()
+        cur.fetchall.return_value = bounds(
+            ("data_p202403", "'2024-03-01'", "2024-04-01"),
+            ("data_legacy", "MINVALUE", "2024-03-01"),
+        ) + [("data_other", "DEFAULT")]
+
+        listed = partitions.list_partitions(cur)
+
+        assert listed == [
+            partitions.Partition("data_legacy", date(2024, 3, 1)),
+            partitions.Partition("data_p202403", date(2024, 4, 1)),
+        ]
+
+    def test_create_partitions_ahead(self) -> None:
+        """Test that the current month and the months ahead are created"""
+        cur = MagicMock()
+        cur.fetchall.return_value = []
+
+        created = partitions.create_partitions(cur, date(2024, 12, 15), 2)
+
+        assert created == ["data_p202412", "data_p202501", "data_p202502"]
+        assert cur.execute.call_args[0][1] == (date(2025, 2, 1), date(2025, 3, 1))
+
+    def test_create_partitions_start_after_newest(self) -> None:
+        """Test that new ranges never overlap the legacy partition"""
+        cur = MagicMock()
+        cur.fetchall.return_value = bounds(("data_legacy", "MINVALUE", "2024-04-01"))
+
+        created = partitions.create_partitions(cur, date(2024, 3, 10), 1)
+
+        assert created == ["data_p202404"]
+
+    def test_create_partitions_nothing_missing(self) -> None:
+        """Test that a table with enough partitions is left alone"""
+        cur = MagicMock()
+        cur.fetchall.return_value = bounds(("data_p202404", "'2024-04-01'", "2024-05-01"))
+
+        assert partitions.create_partitions(cur, date(2024, 3, 10), 1) == []
+
+    @pytest.mark.parametrize("action, dropped", [("detach", False), ("drop", True)])
+    def test_retention_removes_expired_partitions(self, action: Any, dropped: Any) -> None:
+        """Test that only partitions entirely past the window are removed"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = bounds(
+            ("data_p202401", "'2024-01-01'", "2024-02-01"),
+            ("data_p202402", "'2024-02-01'", "2024-03-01"),
+            ("data_p202403", "'2024-03-01'", "2024-04-01"),
+        )
+
+        with patch('builtins.print'):
+            removed = partitions.apply_retention(conn, date(2024, 4, 10), 40, action)
+
+        assert removed == ["data_p202401", "data_p202402"]
+        statements = executed(cur)
+        assert "ALTER TABLE data DETACH PARTITION data_p202402 CONCURRENTLY" in statements
+        assert ("DROP TABLE data_p202402" in statements) is dropped
+        assert cur.execute.call_args[0] == (partitions.PRUNE_HASHES_SQL, (date(2024, 3, 1),))
+        assert (partitions.PRUNE_DAILY_COUNTS_SQL, (date(2024, 3, 1),)) in [
+            c[0] for c in cur.execute.call_args_list
+        ]
+        assert conn.autocommit is False
+
+    def test_retention_disabled(self) -> None:
+        """Test that a zero window keeps every partition"""
+        conn = MagicMock()
+
+        assert partitions.apply_retention(conn, date(2024, 4, 10), 0) == []
+        assert not conn.cursor.called
+
+    def test_retention_rejects_unknown_action(self) -> None:
+        """Test that a typo in the action fails loudly"""
+        with pytest.raises(ValueError):
+            partitions.apply_retention(MagicMock(), date(2024, 4, 10), 30, "archive")
+
+    def test_plain_table_is_migrated(self) -> None:
+        """Test that an unpartitioned table goes through the online migration"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.return_value = ("r",)
+        cur.fetchall.return_value = []
+
+        with patch('partitions.migrate_to_partitioned', return_value=date(2024, 4, 1)) as migrate:
+            with patch('builtins.print'):
+                partitions.ensure_partitioned_table(conn, date(2024, 3, 10), 1)
+
+        migrate.assert_called_once_with(conn, date(2024, 3, 10))
+
+    def test_migration_swaps_under_short_lock(self) -> None:
+        """Test that the old table is attached, not copied"""
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchone.side_effect = [(date(2024, 3, 31),), None]
+        cur.fetchall.return_value = [("data_pkey",), ("data_date_id_idx",)]
+
+        bound = partitions.migrate_to_partitioned(conn, date(2024, 3, 10))
+
+        assert bound == date(2024, 4, 1)
+        statements = executed(cur)
+        assert "ALTER INDEX data_pkey RENAME TO data_legacy_pkey" in statements
+        assert not any("INSERT" in sql for sql in statements)
+        assert statements.index("SET LOCAL lock_timeout = %s") < statements.index(
+            "LOCK TABLE data IN ACCESS EXCLUSIVE MODE"
+        )
+        assert "FOR VALUES FROM (MINVALUE) TO (%s)" in statements[-1]
+        assert conn.autocommit is False
+
+    def test_maintainer_creates_and_expires(self) -> None:
+        """Test that one maintenance pass creates partitions and applies retention"""
+        pool = MagicMock()
+        conn = pool.getconn.return_value
+        maintainer = partitions.PartitionMaintainer(pool, months_ahead=1, retention_days=30)
+
+        with patch('partitions.create_partitions', return_value=[]) as create:
+            with patch('partitions.apply_retention') as retention:
+                maintainer.run_once(date(2024, 3, 10))
+
+        assert create.call_args[0][1:] == (date(2024, 3, 10), 1)
+        retention.assert_called_once_with(conn, date(2024, 3, 10), 30, "detach")
+        pool.putconn.assert_called_once_with(conn)
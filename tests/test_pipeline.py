@@ -0,0 +1,213 @@
+"""
+Tests for pipeline.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from pathlib import Path
+from typing import Any
+from datetime import date
+import asyncio
+import io
+import threading
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline
+
+
+class CountingSource:
+    """Emits an endless stream of numbered records until stopped"""
+
+    name = 'counting'
+
+    def __init__(self) -> None:
+        self.emitted = 0
+
+    async def run(self, emit: Any, stop: Any) -> None:
+        while not stop.is_set():
+            self.emitted += 1
+            await emit(f'record {self.emitted}')
+
+
+def run_pipeline(p: Any, stop: Any = None, stop_after: Any = None) -> None:
+    """Run a pipeline, optionally setting the stop flag after a delay"""
+    async def main() -> None:
+        event = stop or asyncio.Event()
+        if stop_after is not None:
+            asyncio.get_running_loop().call_later(stop_after, event.set)
+        await p.run(stop=event)
+    asyncio.run(main())
+
+
+class TestPipeline:
+    """Test suite for the streaming ingestion pipeline"""
+
+    def test_file_source_end_to_end(self, tmp_path: Path) -> None:
+        """Test that file lines are validated, deduplicated and batched"""
+        path = tmp_path / 'jokes.txt'
+        path.write_text('first\n\nsecond\nfirst\nthird\n')
+        batches: list[list[tuple[str, date]]] = []
+        p = pipeline.Pipeline(
+            [pipeline.build_source(f'file:{path}')], batches.append, batch_size=2
+        )
+
+        run_pipeline(p)
+
+        names = [name for batch in batches for name, _ in batch]
+        assert names == ['first', 'second', 'third']
+        assert [len(batch) for batch in batches] == [2, 1]
+        metrics = p.metrics()
+        assert metrics['validate']['dropped'] == 2
+        assert metrics['sink']['items_out'] == 3
+        assert metrics['source']['queue_depth'] == 0
+        assert metrics['validate']['dedupe_hit_rate'] == pytest.approx(1 / 4)
+
+    def test_fetch_errors_rejected_by_default(self, tmp_path: Path) -> None:
+        """Test that error messages from a source never reach the sink"""
+        path = tmp_path / 'jokes.txt'
+        path.write_text('keep\nError fetching joke: boom\n')
+        batches: list[tuple[str, date]] = []
+        p = pipeline.Pipeline([pipeline.build_source(f'file:{path}')], batches.extend)
+
+        run_pipeline(p)
+
+        assert [name for name, _ in batches] == ['keep']
+
+    def test_stdin_source(self) -> None:
+        """Test that records can be piped in on standard input"""
+        batches: list[tuple[str, date]] = []
+        p = pipeline.Pipeline([pipeline.build_source('stdin')], batches.extend)
+
+        with patch('sys.stdin', io.StringIO('a\nb\n')):
+            run_pipeline(p)
+
+        assert [name for name, _ in batches] == ['a', 'b']
+
+    def test_slow_sink_applies_backpressure(self) -> None:
+        """Test that a blocked sink stops the source instead of growing memory"""
+        release = threading.Event()
+        written = []
+
+        def slow_sink(batch: Any) -> None:
+            release.wait(5)
+            written.extend(batch)
+
+        source = CountingSource()
+        p = pipeline.Pipeline(
+            [source], slow_sink, batch_size=10, queue_size=20, flush_interval=0.01
+        )
+
+        async def main() -> Any:
+            stop = asyncio.Event()
+            task = asyncio.create_task(p.run(stop=stop))
+            await asyncio.sleep(0.3)
+            emitted_while_blocked = source.emitted
+            depth = p.metrics()['source']['queue_depth']
+            stop.set()
+            release.set()
+            await task
+            return emitted_while_blocked, depth
+
+        emitted_while_blocked, depth = asyncio.run(main())
+
+        # Two bounded queues, the batch being built, two waiting batches, the
+        # batch in the sink, and one item blocked in each of source/validate.
+        assert emitted_while_blocked <= 20 + 20 + 10 * 4 + 2
+        assert depth <= 20
+        assert len(written) > 0
+
+    def test_sink_errors_are_retried(self, tmp_path: Path) -> None:
+        """Test that a failing sink retries the same batch"""
+        path = tmp_path / 'jokes.txt'
+        path.write_text('only\n')
+        sink = MagicMock(side_effect=[Exception("database down"), None])
+        p = pipeline.Pipeline(
+            [pipeline.build_source(f'file:{path}')], sink, retry_delay=0.01
+        )
+
+        with patch('builtins.print'):
+            run_pipeline(p)
+
+        assert sink.call_count == 2
+        assert sink.call_args_list[0] == sink.call_args_list[1]
+        assert p.metrics()['sink']['errors'] == 1
+
+    def test_failing_source_does_not_stop_others(self, tmp_path: Path) -> None:
+        """Test that one broken source is reported and the rest keep going"""
+        path = tmp_path / 'jokes.txt'
+        path.write_text('works\n')
+        batches: list[tuple[str, date]] = []
+        p = pipeline.Pipeline(
+            [
+                pipeline.build_source(f'file:{tmp_path / "missing.txt"}'),
+                pipeline.build_source(f'file:{path}'),
+            ],
+            batches.extend,
+        )
+
+        with patch('builtins.print') as mock_print:
+            run_pipeline(p)
+
+        assert [name for name, _ in batches] == ['works']
+        assert p.metrics()['source']['errors'] == 1
+        assert 'missing.txt' in mock_print.call_args[0][0]
+
+    def test_custom_validator(self, tmp_path: Path) -> None:
+        """Test that extra validators can reject records"""
+        path = tmp_path / 'jokes.txt'
+        path.write_text('keep\nDrop me\n')
+        batches: list[tuple[str, date]] = []
+        p = pipeline.Pipeline(
+            [pipeline.build_source(f'file:{path}')],
+            batches.extend,
+            validators=[lambda text: not text.startswith('Drop')],
+        )
+
+        run_pipeline(p)
+
+        assert [name for name, _ in batches] == ['keep']
+
+    def test_stop_flushes_partial_batch(self) -> None:
+        """Test that stopping the pipeline still writes the last partial batch"""
+        batches: list[tuple[str, date]] = []
+        source = CountingSource()
+        p = pipeline.Pipeline([source], batches.extend, batch_size=10**6, flush_interval=60)
+
+        run_pipeline(p, stop_after=0.05)
+
+        assert len(batches) > 0
+        assert p.metrics()['sink']['items_out'] == len(batches)
+
+
+class TestSourceRegistry:
+    """Test suite for source registration"""
+
+    def test_unknown_source_type(self) -> None:
+        """Test that an unknown source kind is rejected"""
+        with pytest.raises(ValueError, match="Unknown source type"):
+            pipeline.build_source('ftp:example.com')
+
+    def test_register_custom_source(self) -> None:
+        """Test that new source kinds can be plugged in"""
+        @pipeline.register_source('test-counting')
+        def make_counting(argument: Any, **options: Any) -> Any:
+            return CountingSource()
+
+        try:
+            assert isinstance(pipeline.build_source('test-counting:'), CountingSource)
+        finally:
+            del pipeline.SOURCE_TYPES['test-counting']
+
+    def test_http_source_options(self) -> None:
+        """Test that HTTP sources receive the shared fetch options"""
+        source = pipeline.build_source(
+            'http:https://example.com/api', timeout=3, concurrency=2, rate=5
+        )
+
+        assert isinstance(source, pipeline.HttpPollSource)
+        assert source.source.url == 'https://example.com/api'
+        assert source.source.timeout == 3
+        assert source.concurrency == 2
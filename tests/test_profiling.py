@@ -0,0 +1,147 @@
+"""
+Tests for profiling.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Any
+import signal
+import sys
+import os
+import threading
+import time
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+from profiling import SamplingProfiler, fold_stack, format_folded, thread_label
+
+
+def outer_frame() -> FrameType:
+    return inner_frame()
+
+
+def inner_frame() -> FrameType:
+    return sys._getframe()
+
+
+def capturing(profiler: SamplingProfiler) -> bool:
+    # Read through a call: the signal handler changes it behind the test's back.
+    return profiler.capturing
+
+
+class TestProfiling:
+    """Test suite for the on-demand sampling profiler"""
+
+    @pytest.mark.parametrize("name, label", [
+        ('MainThread', 'MainThread'),
+        ('ThreadPoolExecutor-0_3', 'ThreadPoolExecutor'),
+        ('Thread-12', 'Thread'),
+        ('1', 'thread'),
+    ])
+    def test_thread_label_merges_pool_threads(self, name: Any, label: Any) -> None:
+        """Test that numbered threads of one pool share a root frame"""
+        assert thread_label(name) == label
+
+    def test_fold_stack_is_root_first(self) -> None:
+        """Test that frames are listed outermost first with file and line"""
+        stack = fold_stack(outer_frame(), {})
+
+        assert stack[-1].startswith('inner_frame (test_profiling.py:')
+        assert stack[-2].startswith('outer_frame (test_profiling.py:')
+
+    def test_format_folded(self) -> None:
+        """Test the one-stack-per-line format flamegraph tools read"""
+        counts = Counter({'a;b': 2, 'a': 1})
+
+        assert format_folded(counts) == 'a 1\na;b 2\n'
+
+    def test_tick_without_capture_is_noop(self) -> None:
+        """Test that ticking an idle profiler starts nothing"""
+        profiler = SamplingProfiler(directory='')
+
+        profiler.tick()
+
+        assert profiler.capturing is False
+
+    def test_capture_ends_after_units(self, tmp_path: Path) -> None:
+        """Test that a capture stops once enough requests have been counted"""
+        profiler = SamplingProfiler(interval=0.001, seconds=30, directory=str(tmp_path))
+        stop = threading.Event()
+
+        def busy() -> None:
+            while not stop.is_set():
+                profiler.tick()
+                time.sleep(0.002)
+
+        worker = threading.Thread(target=busy, name='worker-1')
+        worker.start()
+        try:
+            started = time.monotonic()
+            folded = profiler.capture(units=20)
+        finally:
+            stop.set()
+            worker.join()
+
+        assert time.monotonic() - started < 5
+        assert folded is not None and profiler.last_path is not None
+        assert any(line.startswith('worker;') for line in folded.splitlines())
+        assert profiler.capturing is False
+        with open(profiler.last_path) as f:
+            assert f.read() == folded
+        assert os.path.basename(profiler.last_path).startswith('profile-')
+
+    def test_capture_ends_after_seconds(self) -> None:
+        """Test that a capture without a unit limit stops at its deadline"""
+        profiler = SamplingProfiler(interval=0.001, directory='')
+
+        started = time.monotonic()
+        folded = profiler.capture(seconds=0.05)
+
+        assert time.monotonic() - started < 2
+        assert folded is not None
+        assert 'MainThread;' in folded
+        assert profiler.last_path is None
+
+    def test_second_capture_refused(self) -> None:
+        """Test that only one capture runs at a time"""
+        profiler = SamplingProfiler(interval=0.001, directory='')
+
+        assert profiler.start(seconds=5) is True
+        try:
+            assert profiler.start() is False
+            assert profiler.capture() is None
+        finally:
+            profiler.stop()
+
+    @patch('profiling.signal.signal')
+    def test_install_profiler_toggles_on_signal(self, mock_signal: MagicMock) -> None:
+        """Test that the signal handler starts and then stops a capture"""
+        profiler = profiling.install_profiler()
+        profiler.directory = ''
+        handler = mock_signal.call_args[0][1]
+
+        assert mock_signal.call_args[0][0] == signal.SIGUSR2
+        assert profiler.capturing is False
+        handler(signal.SIGUSR2, None)
+        deadline = time.monotonic() + 2
+        while not capturing(profiler) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert capturing(profiler) is True
+        handler(signal.SIGUSR2, None)
+        while capturing(profiler) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert capturing(profiler) is False
+
+    @patch('profiling.signal.signal')
+    def test_install_profiler_starts_capture(self, mock_signal: MagicMock, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that PROFILE_ON_START profiles the worker from boot"""
+        monkeypatch.setenv('PROFILE_ON_START', '1')
+        monkeypatch.setenv('PROFILE_DIR', '')
+
+        profiler = profiling.install_profiler()
+
+        assert profiler.capturing is True
@@ -0,0 +1,194 @@
+"""
+Tests for records_cache.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from typing import Any
+import threading
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records_cache
+
+
+class TestRecordsCache:
+    """Test suite for the records read-through cache"""
+
+    def test_hit_after_first_load(self) -> None:
+        """Test that the second read is served from memory"""
+        cache = records_cache.RecordsCache(ttl=60)
+        loader = MagicMock(return_value=[("Joke", "2024-01-01")])
+
+        assert cache.get_or_load(loader) == [("Joke", "2024-01-01")]
+        assert cache.get_or_load(loader) == [("Joke", "2024-01-01")]
+
+        loader.assert_called_once()
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'invalidations': 0, 'loads': 1}
+
+    def test_expired_value_is_reloaded(self) -> None:
+        """Test that a value older than the TTL is fetched again"""
+        cache = records_cache.RecordsCache(ttl=0)
+        loader = MagicMock(return_value=[])
+
+        cache.get_or_load(loader)
+        cache.get_or_load(loader)
+
+        assert loader.call_count == 2
+
+    def test_invalidate_forces_reload(self) -> None:
+        """Test that invalidation drops the cached value"""
+        cache = records_cache.RecordsCache(ttl=60)
+        loader = MagicMock(side_effect=[["old"], ["new"]])
+
+        cache.get_or_load(loader)
+        cache.invalidate()
+
+        assert cache.get_or_load(loader) == ["new"]
+        assert cache.stats()['invalidations'] == 1
+
+    def test_version_only_changes_with_data(self) -> None:
+        """Test that reloading identical rows keeps the entry version"""
+        cache = records_cache.RecordsCache(ttl=60)
+        loader = MagicMock(side_effect=[["a"], ["a"], ["b"]])
+
+        first = cache.get_entry(loader)
+        cache.invalidate()
+        same = cache.get_entry(loader)
+        cache.invalidate()
+        changed = cache.get_entry(loader)
+
+        assert same.version == first.version
+        assert same.last_modified == first.last_modified
+        assert changed.version == first.version + 1
+
+    def test_invalidation_during_load_discards_result(self) -> None:
+        """Test that a load racing with an invalidation is not cached"""
+        cache = records_cache.RecordsCache(ttl=60)
+
+        def racing_loader() -> Any:
+            cache.invalidate()
+            return ["stale"]
+
+        assert cache.get_or_load(racing_loader) == ["stale"]
+        assert cache.get_or_load(lambda: ["fresh"]) == ["fresh"]
+
+    def test_concurrent_misses_load_once(self) -> None:
+        """Test that simultaneous misses share a single database load"""
+        cache = records_cache.RecordsCache(ttl=60)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_loader() -> Any:
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ["rows"]
+
+        threads = [
+            threading.Thread(target=cache.get_or_load, args=(slow_loader,))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+
+
+class TestQueryCache:
+    """Test suite for the keyed query cache"""
+
+    def test_keys_cached_independently(self) -> None:
+        """Test that each key is loaded once and then served from memory"""
+        cache = records_cache.QueryCache(maxsize=10, ttl=60)
+        loader: MagicMock = MagicMock(side_effect=lambda: loader.call_count)
+
+        assert cache.get_or_load('a', loader) == 1
+        assert cache.get_or_load('b', loader) == 2
+        assert cache.get_or_load('a', loader) == 1
+
+        assert cache.stats() == {
+            'hits': 1, 'misses': 2, 'invalidations': 0, 'evictions': 0, 'size': 2
+        }
+
+    def test_least_recently_used_evicted(self) -> None:
+        """Test that the cache stays within maxsize"""
+        cache = records_cache.QueryCache(maxsize=2, ttl=60)
+        cache.get_or_load('a', lambda: 1)
+        cache.get_or_load('b', lambda: 2)
+        cache.get_or_load('a', lambda: 1)
+        cache.get_or_load('c', lambda: 3)
+
+        assert cache.get_or_load('a', lambda: 'reloaded') == 1
+        assert cache.get_or_load('b', lambda: 'reloaded') == 'reloaded'
+        assert cache.stats()['evictions'] == 2
+
+    def test_expired_entry_reloaded(self) -> None:
+        """Test that entries older than the TTL are loaded again"""
+        cache = records_cache.QueryCache(ttl=0)
+        cache.get_or_load('a', lambda: 1)
+
+        assert cache.get_or_load('a', lambda: 2) == 2
+
+    def test_load_racing_invalidation_not_stored(self) -> None:
+        """Test that a result loaded before an invalidation is not cached"""
+        cache = records_cache.QueryCache(ttl=60)
+
+        def loader() -> Any:
+            cache.invalidate()
+            return 'stale'
+
+        assert cache.get_or_load('a', loader) == 'stale'
+        assert cache.get_or_load('a', lambda: 'fresh') == 'fresh'
+
+
+class TestNotifyListener:
+    """Test suite for the LISTEN/NOTIFY background listener"""
+
+    def test_listen_reports_notifications(self) -> None:
+        """Test that queued notifications are passed to the callback"""
+        received: list[list[str]] = []
+        listener = records_cache.NotifyListener(
+            'data_changed', received.append, {'host': 'localhost'}, poll_interval=0
+        )
+        mock_conn = MagicMock()
+        notify = MagicMock(payload='42')
+        mock_conn.notifies = [notify]
+
+        def poll() -> None:
+            listener.stop()
+
+        mock_conn.poll.side_effect = poll
+        cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        with patch('psycopg2.connect', return_value=mock_conn):
+            with patch('records_cache.select.select', return_value=([mock_conn], [], [])):
+                listener._listen()
+
+        cursor.execute.assert_called_with('LISTEN data_changed')
+        assert received == [[], ['42']]
+        assert mock_conn.notifies == []
+        assert mock_conn.close.called
+
+    def test_run_survives_connection_errors(self) -> None:
+        """Test that the listener logs and retries after an error"""
+        listener = records_cache.NotifyListener(
+            'data_changed', MagicMock(), {}, reconnect_delay=0
+        )
+
+        def fail(**kwargs: Any) -> None:
+            listener.stop()
+            raise Exception("Connection failed")
+
+        with patch('psycopg2.connect', side_effect=fail):
+            with patch('builtins.print') as mock_print:
+                listener.run()
+
+        mock_print.assert_called_with("Error listening on data_changed: Connection failed")
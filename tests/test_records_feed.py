@@ -0,0 +1,215 @@
+"""
+Tests for records_feed.py
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from typing import Any, Optional
+import asyncio
+from datetime import date
+import re
+import threading
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records_feed
+from records_feed import FeedFull, RecordFeed, stream_feed
+
+
+def rows(*ids: int) -> list[tuple[int, str, date]]:
+    return [(i, f"joke {i}", date(2024, 1, 1)) for i in ids]
+
+
+class FakeTable:
+    """Stands in for ``data``: answers the feed's queries from a list of ids"""
+
+    def __init__(self, *ids: int) -> None:
+        self.ids = list(ids)
+        self.queries = 0
+
+    def load(self, after: Optional[int], limit: int) -> list[tuple[int, str, date]]:
+        self.queries += 1
+        if after is None:
+            return rows(max(self.ids)) if self.ids else []
+        return rows(*sorted(i for i in self.ids if i > after)[:limit])
+
+
+def sent_ids(subscription: Any) -> list[int]:
+    return [int(i) for i in re.findall(rb"^id: (\d+)$", subscription.get(0), re.M)]
+
+
+class TestRecordFeed:
+    """Test suite for fanning new rows out to connected clients"""
+
+    def test_one_query_serves_every_client(self) -> None:
+        """Test that a new row costs one query however many clients listen"""
+        table = FakeTable(1, 2, 3)
+        feed = RecordFeed(table.load, max_clients=100)
+        clients = [feed.subscribe() for _ in range(50)]
+        feed.poll_once()  # picks the starting point
+
+        table.ids += [4, 5]
+        feed.poll_once()
+
+        assert table.queries == 2
+        assert all(sent_ids(c) == [4, 5] for c in clients)
+        assert clients[0].get(0) == b""
+
+    def test_no_queries_without_clients(self) -> None:
+        """Test that an idle feed leaves the database alone"""
+        table = FakeTable(1)
+        feed = RecordFeed(table.load)
+
+        feed.poll_once()
+
+        assert table.queries == 0
+
+    def test_late_commit_within_lookback_is_sent_once(self) -> None:
+        """Test that a lower id committed after a higher one still goes out, once"""
+        table = FakeTable(10)
+        feed = RecordFeed(table.load)
+        client = feed.subscribe()
+        feed.poll_once()
+
+        table.ids += [12]
+        feed.poll_once()
+        table.ids += [11]
+        feed.poll_once()
+        feed.poll_once()
+
+        assert sent_ids(client) == [12, 11]
+
+    def test_burst_is_read_in_batches(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a burst larger than one batch is streamed completely"""
+        monkeypatch.setattr(records_feed, 'FEED_BATCH_SIZE', 2)
+        table = FakeTable(0)
+        feed = RecordFeed(table.load, buffer_size=3)
+        client = feed.subscribe()
+        feed.poll_once()
+
+        table.ids += [1, 2, 3, 4, 5]
+        feed.poll_once()
+
+        assert sent_ids(client) == [1, 2, 3, 4, 5]
+
+    def test_slow_client_is_evicted(self) -> None:
+        """Test that a client whose buffer is full is dropped, and others are not"""
+        table = FakeTable(0)
+        feed = RecordFeed(table.load, buffer_size=1)
+        slow, fast = feed.subscribe(), feed.subscribe()
+        feed.poll_once()
+
+        table.ids += [1, 2]
+        feed.poll_once()
+        sent_ids(fast)
+        table.ids += [3, 4]
+        feed.poll_once()
+
+        assert slow.evicted and slow.get(0) == b""
+        assert not fast.evicted and sent_ids(fast) == [3, 4]
+        assert feed.stats()["clients"] == 1
+        assert feed.stats()["evictions"] == 1
+
+    def test_client_limit(self) -> None:
+        """Test that clients beyond max_clients are refused"""
+        feed = RecordFeed(FakeTable().load, max_clients=1)
+        feed.subscribe()
+
+        with pytest.raises(FeedFull):
+            feed.subscribe()
+
+    def test_reconnect_replays_missed_events(self) -> None:
+        """Test that Last-Event-ID resends what the client missed"""
+        table = FakeTable(0)
+        feed = RecordFeed(table.load)
+        feed.subscribe()
+        feed.poll_once()
+        table.ids += [1, 2, 3]
+        feed.poll_once()
+
+        again = feed.subscribe(last_event_id=1)
+
+        assert sent_ids(again) == [2, 3]
+
+    def test_wake_runs_a_poll(self) -> None:
+        """Test that a change notification triggers a query without waiting for the poll"""
+        polled = threading.Event()
+        feed = RecordFeed(MagicMock(return_value=[]), poll_interval=60)
+        with patch.object(feed, "poll_once", polled.set):
+            feed.start()
+
+            feed.wake([""])
+
+            assert polled.wait(2)
+            feed.stop()
+            feed.join(2)
+
+
+class TestStreamFeed:
+    """Test suite for the text/event-stream body"""
+
+    def test_events_heartbeats_and_cleanup(self) -> None:
+        """Test the message framing, keep-alives and unsubscribe on close"""
+        table = FakeTable(0)
+        feed = RecordFeed(table.load)
+        subscription = feed.subscribe()
+        feed.poll_once()
+        stream = stream_feed(feed, subscription, heartbeat=0.01)
+
+        assert next(stream) == b"retry: 3000\n\n"
+        assert next(stream) == b": keepalive\n\n"
+        table.ids += [7]
+        feed.poll_once()
+        assert next(stream) == (
+            b'id: 7\nevent: record\ndata: {"id":7,"name":"joke 7","date":"2024-01-01"}\n\n'
+        )
+        stream.close()
+
+        assert feed.stats()["clients"] == 0
+
+    def test_evicted_client_is_told_and_closed(self) -> None:
+        """Test that an evicted stream ends with an ``evicted`` event"""
+        feed = RecordFeed(FakeTable().load, buffer_size=1)
+        subscription = feed.subscribe()
+        stream = stream_feed(feed, subscription, heartbeat=0.01)
+        next(stream)
+
+        feed.publish([records_feed.record_event(row) for row in rows(1)])
+        feed.publish([records_feed.record_event(row) for row in rows(2)])
+
+        assert next(stream).startswith(b"event: evicted\n")
+        with pytest.raises(StopIteration):
+            next(stream)
+
+
+class TestAsyncFeedSubscription:
+    """Test suite for streams served from an asyncio event loop"""
+
+    def test_push_from_feed_thread_wakes_the_loop(self) -> None:
+        """Test that rows polled on another thread reach a waiting coroutine"""
+        table = FakeTable(0)
+        feed = RecordFeed(table.load)
+
+        async def run() -> Any:
+            loop = asyncio.get_running_loop()
+            subscription = records_feed.AsyncFeedSubscription(feed.buffer_size, loop)
+            feed.subscribe(subscription=subscription)
+            feed.poll_once()
+            assert await subscription.next(0.01) == b""
+
+            table.ids += [5]
+            waiting = asyncio.ensure_future(subscription.next(5))
+            await asyncio.sleep(0)
+            await loop.run_in_executor(None, feed.poll_once)
+            return await asyncio.wait_for(waiting, 1)
+
+        assert re.findall(rb"^id: (\d+)$", asyncio.run(run()), re.M) == [b"5"]
+
+    def test_busy_message_asks_for_a_late_retry(self) -> None:
+        """Test that a refused client is told to reconnect later rather than failed"""
+        body = records_feed.busy_message("full")
+
+        assert body.startswith(b"retry: 30000\n\n")
+        assert b'event: busy\ndata: {"reason":"full"}\n\n' in body
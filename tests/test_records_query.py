@@ -0,0 +1,79 @@
+"""
+Tests for records_query.py
+"""
+import pytest
+from unittest.mock import MagicMock
+from typing import Any
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records_query
+
+
+def rows(*ids: int) -> list[tuple[int, str, date]]:
+    """Rows as returned by the page query, newest first"""
+    return [(i, f'Joke {i}', date(2024, 1, i)) for i in ids]
+
+
+class TestRecordsQuery:
+    """Test suite for keyset pagination"""
+
+    def test_cursor_round_trip(self) -> None:
+        """Test that a cursor decodes to the position it was built from"""
+        position = records_query.Cursor(date(2024, 3, 1), 42)
+        token = records_query.encode_cursor(position)
+
+        assert '=' not in token
+        assert records_query.decode_cursor(token) == position
+
+    @pytest.mark.parametrize("token", ['not base64!', 'Zm9v', ''])
+    def test_invalid_cursor(self, token: Any) -> None:
+        """Test that malformed cursors are rejected with ValueError"""
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            records_query.decode_cursor(token)
+
+    def test_first_page_has_next_cursor(self) -> None:
+        """Test that an extra row yields a cursor for the last returned row"""
+        cur = MagicMock()
+        cur.fetchall.return_value = rows(5, 4, 3)
+
+        page = records_query.fetch_records_page(cur, limit=2)
+
+        assert [r['id'] for r in page.records] == [5, 4]
+        assert page.records[0] == {'id': 5, 'name': 'Joke 5', 'date': '2024-01-05'}
+        assert page.next_cursor is not None
+        assert records_query.decode_cursor(page.next_cursor) == (date(2024, 1, 4), 4)
+        query, params = cur.execute.call_args[0]
+        assert params == [3]
+        assert "ORDER BY date DESC, id DESC LIMIT %s" in repr(query)
+
+    def test_last_page_has_no_cursor(self) -> None:
+        """Test that a short page ends the iteration"""
+        cur = MagicMock()
+        cur.fetchall.return_value = rows(2, 1)
+
+        page = records_query.fetch_records_page(cur, limit=5)
+
+        assert len(page.records) == 2
+        assert page.next_cursor is None
+
+    def test_cursor_and_date_filters_become_conditions(self) -> None:
+        """Test that the keyset position and date range are bound parameters"""
+        cur = MagicMock()
+        cur.fetchall.return_value = []
+        after = records_query.Cursor(date(2024, 1, 9), 90)
+
+        records_query.fetch_records_page(
+            cur, limit=10, after=after,
+            date_from=date(2024, 1, 1), date_to=date(2024, 1, 31),
+        )
+
+        query, params = cur.execute.call_args[0]
+        assert params == [date(2024, 1, 9), 90, date(2024, 1, 1), date(2024, 1, 31), 11]
+        assert "(date, id) < (%s, %s)" in repr(query)
+        assert "date >= %s" in repr(query)
+        assert "date <= %s" in repr(query)
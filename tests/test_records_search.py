@@ -0,0 +1,69 @@
+"""
+Tests for records_search.py
+"""
+import pytest
+from unittest.mock import MagicMock
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records_search
+
+
+class TestRecordsSearch:
+    """Test suite for full-text search"""
+
+    def test_normalize_query(self) -> None:
+        """Test that case and whitespace do not split the cache"""
+        assert records_search.normalize_query('  Chuck\tNORRIS ') == 'chuck norris'
+
+    def test_results_ranked_and_paged(self) -> None:
+        """Test that a page is cut at the limit and reports the next page"""
+        cur = MagicMock()
+        cur.fetchone.return_value = (3,)
+        cur.fetchall.return_value = [
+            (9, 'Best match', date(2024, 2, 1), 0.9),
+            (4, 'Good match', date(2024, 1, 1), 0.61234567),
+            (2, 'Weak match', date(2023, 1, 1), 0.1),
+        ]
+
+        page = records_search.search_records(cur, 'match', limit=2, page=3, max_candidates=50)
+
+        assert [r['id'] for r in page.results] == [9, 4]
+        assert page.results[1]['rank'] == 0.612346
+        assert page.page == 3
+        assert page.next_page == 4
+        query, params = cur.execute.call_args[0]
+        assert params == {
+            'text': 'match', 'probe': 51, 'candidates': 50, 'limit': 3, 'offset': 4
+        }
+        assert 'websearch_to_tsquery' in repr(query)
+        assert 'ORDER BY rank DESC, id DESC' in repr(query)
+        assert 'DESC LIMIT %(candidates)s' not in repr(query)
+
+    def test_common_term_ranks_newest_matches(self) -> None:
+        """Test that a term with many matches only ranks the newest candidates"""
+        cur = MagicMock()
+        cur.fetchone.return_value = (51,)
+        cur.fetchall.return_value = []
+
+        records_search.search_records(cur, 'the', limit=10, max_candidates=50)
+
+        probe = repr(cur.execute.call_args_list[0][0][0])
+        assert 'LIMIT %(probe)s' in probe
+        query = repr(cur.execute.call_args[0][0])
+        assert 'ORDER BY date DESC, id DESC LIMIT %(candidates)s' in query
+
+    def test_last_page(self) -> None:
+        """Test that a short page has no next page"""
+        cur = MagicMock()
+        cur.fetchone.return_value = (0,)
+        cur.fetchall.return_value = []
+
+        page = records_search.search_records(cur, 'nothing', limit=10)
+
+        assert page.results == []
+        assert page.next_page is None
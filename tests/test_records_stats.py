@@ -0,0 +1,62 @@
+"""
+Tests for records_stats.py
+"""
+from unittest.mock import MagicMock
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import records_stats
+
+
+class TestRecordsStats:
+    """Test suite for the precomputed daily counts"""
+
+    def test_missing_days_count_as_zero(self) -> None:
+        """Test that days without inserts still appear in the series"""
+        cur = MagicMock()
+        cur.fetchall.return_value = [(date(2024, 1, 1), 4), (date(2024, 1, 3), 2)]
+        cur.fetchone.return_value = (6,)
+
+        stats = records_stats.fetch_daily_stats(cur, date(2024, 1, 1), date(2024, 1, 3))
+
+        assert [(day['date'], day['count']) for day in stats.days] == [
+            ('2024-01-01', 4), ('2024-01-02', 0), ('2024-01-03', 2),
+        ]
+        assert stats.window_total == 6
+        assert stats.total == 6
+
+    def test_trailing_average_reads_days_before_window(self) -> None:
+        """Test that the 7-day average includes counts from before the window"""
+        cur = MagicMock()
+        cur.fetchall.return_value = [(date(2024, 1, d), 7) for d in range(1, 11)]
+        cur.fetchone.return_value = (70,)
+
+        stats = records_stats.fetch_daily_stats(cur, date(2024, 1, 10), date(2024, 1, 10))
+
+        assert cur.execute.call_args_list[0][0][1] == (date(2024, 1, 4), date(2024, 1, 10))
+        assert stats.days == [{'date': '2024-01-10', 'count': 7, 'average': 7.0}]
+        assert stats.window_total == 7
+
+    def test_trigger_counts_statement_rows(self) -> None:
+        """Test that the counts trigger aggregates each statement's new rows"""
+        function, catch_up, trigger = records_stats.daily_counts_trigger_statements()
+
+        assert "FROM new_rows GROUP BY date" in function
+        assert "REFERENCING NEW TABLE AS new_rows" in trigger
+        assert "FOR EACH STATEMENT" in trigger
+        # Recounting only runs until the trigger is installed.
+        assert "IF NOT EXISTS" in catch_up and "SET count = EXCLUDED.count" in catch_up
+
+    def test_counters_spread_over_slots(self) -> None:
+        """Test that writers add to a random slot and reads sum the slots"""
+        *rekey, function = records_stats.daily_counts_slot_statements()
+
+        assert rekey[-1].endswith("ADD PRIMARY KEY (date, slot)")
+        assert f"random() * {records_stats.COUNTER_SLOTS}" in function
+        assert "ON CONFLICT (date, slot)" in function
+        assert "sum(count)::bigint" in repr(records_stats.DAILY_COUNTS_SQL)
+        assert "GROUP BY date" in repr(records_stats.DAILY_COUNTS_SQL)
@@ -0,0 +1,146 @@
+"""
+Tests for repository.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from typing import Any
+from datetime import date
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import repository
+from repository import (
+    INSERT_ROW,
+    LAST_20_RECORDS,
+    RECORDS_AFTER,
+    Record,
+    Repository,
+    to_prepared_sql,
+)
+
+
+def make_conn(rows: Any = (), rowcount: int = 1) -> tuple[MagicMock, MagicMock]:
+    """Connection double whose cursors share one execute log"""
+    conn = MagicMock()
+    cursor = MagicMock()
+    cursor.fetchall.return_value = list(rows)
+    cursor.rowcount = rowcount
+    cursor.__enter__.return_value = cursor
+    conn.cursor.return_value = cursor
+    return conn, cursor
+
+
+class StatementGone(Exception):
+    """What psycopg2 raises for EXECUTE of a statement the server forgot"""
+    pgcode = "26000"
+
+
+def executed(cursor: MagicMock) -> list[str]:
+    return [call.args[0] for call in cursor.execute.call_args_list]
+
+
+class TestRepository:
+    """Test suite for prepared, timed statements"""
+
+    def test_placeholders_numbered(self) -> None:
+        """Test the conversion from psycopg2 placeholders to $n parameters"""
+        assert to_prepared_sql("SELECT %s, '100%%', %s") == ("SELECT $1, '100%', $2", 2)
+
+    def test_prepared_once_per_connection(self) -> None:
+        """Test that a statement is prepared on first use and executed by name after"""
+        repo = Repository()
+        conn, cursor = make_conn(rows=[("joke", date(2024, 1, 1))])
+        other, other_cursor = make_conn()
+
+        repo.execute(conn, LAST_20_RECORDS)
+        repo.execute(conn, LAST_20_RECORDS)
+        repo.execute(other, LAST_20_RECORDS)
+
+        assert executed(cursor) == [
+            "PREPARE last_20_records AS " + LAST_20_RECORDS.sql,
+            "EXECUTE last_20_records",
+            "EXECUTE last_20_records",
+        ]
+        assert executed(other_cursor)[0].startswith("PREPARE last_20_records")
+        assert repo.stats()["prepares"] == 2
+
+    def test_rows_are_typed(self) -> None:
+        """Test that rows come back as NamedTuples and writes as a row count"""
+        repo = Repository()
+        conn, cursor = make_conn(rows=[("joke", date(2024, 1, 1))], rowcount=0)
+
+        rows = repo.fetch(conn, LAST_20_RECORDS)
+
+        assert rows == [Record("joke", date(2024, 1, 1))]
+        assert rows[0].name == "joke"
+        assert repo.execute(conn, INSERT_ROW, ("joke", date(2024, 1, 1))) == 0
+        cursor.execute.assert_called_with("EXECUTE insert_row (%s, %s)", ("joke", date(2024, 1, 1)))
+        with pytest.raises(TypeError):
+            repo.fetch(conn, INSERT_ROW, ("joke", date(2024, 1, 1)))
+
+    def test_unprepared_mode_runs_plain_sql(self) -> None:
+        """Test that DB_PREPARE=0 sends the statement text with its parameters"""
+        conn, cursor = make_conn()
+
+        Repository(prepare=False).execute(conn, RECORDS_AFTER, (5, 10))
+
+        assert executed(cursor) == [RECORDS_AFTER.sql]
+        assert cursor.execute.call_args.args[1] == (5, 10)
+
+    def test_timed_per_statement(self) -> None:
+        """Test that each execution is observed under the statement name"""
+        before = repository.DB_QUERY_SECONDS.count(query="records_after")
+
+        Repository().execute(make_conn()[0], RECORDS_AFTER, (1, 10))
+
+        assert repository.DB_QUERY_SECONDS.count(query="records_after") == before + 1
+
+    def test_missing_statement_is_prepared_again(self) -> None:
+        """Test that a statement dropped server-side is re-prepared on the next call"""
+        repo = Repository()
+        conn, cursor = make_conn()
+        repo.execute(conn, LAST_20_RECORDS)
+        gone = StatementGone("prepared statement does not exist")
+        cursor.execute.side_effect = [gone, None, None]
+
+        with pytest.raises(Exception):
+            repo.execute(conn, LAST_20_RECORDS)
+        repo.execute(conn, LAST_20_RECORDS)
+
+        assert executed(cursor)[-2].startswith("PREPARE last_20_records")
+
+    def test_slow_query_explained_once_a_minute(self) -> None:
+        """Test that a slow statement is counted every time and explained at most once a minute"""
+        repo = Repository(slow_query_ms=0.000001)
+        conn, cursor = make_conn()
+        plan = [("Limit  (cost=0.29..1.51 rows=20 width=40)",)]
+        cursor.fetchall.side_effect = lambda: plan if executed(cursor)[-1].startswith("EXPLAIN") else []
+        slow = repository.DB_SLOW_QUERIES.value(query="records_after")
+
+        with patch('builtins.print') as mock_print:
+            repo.execute(conn, RECORDS_AFTER, (1, 10))
+            repo.execute(conn, RECORDS_AFTER, (1, 10))
+
+        assert "EXPLAIN EXECUTE records_after (%s, %s)" in executed(cursor)
+        assert executed(cursor).count("EXPLAIN EXECUTE records_after (%s, %s)") == 1
+        assert "Limit  (cost=0.29" in mock_print.call_args_list[0].args[0]
+        assert repository.DB_SLOW_QUERIES.value(query="records_after") == slow + 2
+
+    def test_failed_explain_keeps_transaction(self) -> None:
+        """Test that an EXPLAIN error is rolled back to a savepoint, not raised"""
+        repo = Repository(slow_query_ms=0.000001)
+        conn, cursor = make_conn()
+
+        def execute(query: Any, params: Any=None) -> None:
+            if query.startswith("EXPLAIN"):
+                raise Exception("canceling statement due to statement timeout")
+        cursor.execute.side_effect = execute
+
+        with patch('builtins.print') as mock_print:
+            assert repo.execute(conn, INSERT_ROW, ("joke", date(2024, 1, 1))) == 1
+
+        assert "ROLLBACK TO SAVEPOINT explain_slow_query" in executed(cursor)
+        assert "EXPLAIN failed" in mock_print.call_args.args[0]
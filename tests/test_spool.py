@@ -0,0 +1,139 @@
+"""
+Tests for spool.py
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from pathlib import Path
+from typing import Any, Union
+from datetime import date
+import os
+import sys
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from spool import DiskSpool, SpoolFull, SpoolReplayer
+
+
+def rows(*names: str) -> list[tuple[str, date]]:
+    return [(name, date(2024, 1, 1)) for name in names]
+
+
+def segments(path: Union[str, Path]) -> list[str]:
+    return sorted(name for name in os.listdir(path) if name.endswith(".spool"))
+
+
+class TestDiskSpool:
+    """Test suite for the on-disk segment log"""
+
+    def test_read_commit_round_trip(self, tmp_path: Path) -> None:
+        """Test that rows come back in order and a commit moves past them"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "tab\there", "ünïcode"))
+        spool.append(rows("d"))
+
+        first, position = spool.read(2)
+        assert first == rows("a", "tab\there")
+        spool.commit(position, len(first))
+
+        rest, position = spool.read(10)
+        assert rest == rows("ünïcode", "d")
+        spool.commit(position, len(rest))
+        assert spool.read(10)[0] == []
+        assert spool.backlog() == 0
+        assert spool.stats()["replayed"] == 4
+
+    def test_reopen_resumes_from_checkpoint(self, tmp_path: Path) -> None:
+        """Test that a restarted process replays only what was not committed"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "b", "c"))
+        batch, position = spool.read(1)
+        spool.commit(position, len(batch))
+        spool.close()
+
+        reopened = DiskSpool(str(tmp_path))
+
+        assert reopened.read(10)[0] == rows("b", "c")
+
+    def test_torn_tail_is_truncated(self, tmp_path: Path) -> None:
+        """Test that a half-written record left by a crash is cut off on reopen"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "b"))
+        spool.close()
+        path = os.path.join(str(tmp_path), segments(str(tmp_path))[-1])
+        with open(path, "ab") as f:
+            f.write(b"\x10\x00\x00\x00\x00")
+
+        reopened = DiskSpool(str(tmp_path))
+        reopened.append(rows("c"))
+
+        assert reopened.read(10)[0] == rows("a", "b", "c")
+
+    def test_quota(self, tmp_path: Path) -> None:
+        """Test that appends beyond max_bytes are refused"""
+        spool = DiskSpool(str(tmp_path), max_bytes=40)
+        spool.append(rows("a"))
+
+        with pytest.raises(SpoolFull):
+            spool.append(rows("b" * 40))
+        assert spool.stats()["rejected"] == 1
+
+    def test_drained_segments_are_deleted(self, tmp_path: Path) -> None:
+        """Test rotation across segments and cleanup once they are replayed"""
+        spool = DiskSpool(str(tmp_path), segment_bytes=1)
+        for name in "abc":
+            spool.append(rows(name))
+        assert len(segments(str(tmp_path))) == 3
+
+        replayed = SpoolReplayer(spool, MagicMock()).replay_once()
+
+        assert replayed == 3
+        assert len(segments(str(tmp_path))) == 1
+        assert spool.backlog() == 0
+
+
+class TestSpoolReplayer:
+    """Test suite for draining the spool into the database"""
+
+    def test_failed_batch_is_retried(self, tmp_path: Path) -> None:
+        """Test that the checkpoint does not move past a batch the sink refused"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "b", "c"))
+        sink = MagicMock(side_effect=[Exception("Connection failed"), 2, 1])
+        replayer = SpoolReplayer(spool, sink, batch_size=2)
+
+        with pytest.raises(Exception):
+            replayer.replay_once()
+        assert replayer.replay_once() == 3
+
+        assert [call.args[0] for call in sink.call_args_list] == [
+            rows("a", "b"), rows("a", "b"), rows("c")
+        ]
+
+    def test_refused_batch_is_dead_lettered(self, tmp_path: Path) -> None:
+        """Test that a batch the database refuses for its content does not block later rows"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "b"))
+        spool.append(rows("c"))
+        sink = MagicMock(side_effect=[psycopg2.IntegrityError("no partition"), 1])
+        replayer = SpoolReplayer(spool, sink, batch_size=2)
+
+        with patch('builtins.print'):
+            assert replayer.replay_once() == 1
+
+        assert spool.dead_letters() == rows("a", "b")
+        assert spool.backlog() == 0
+        assert spool.stats()["dead_lettered"] == 2
+
+    def test_crash_before_checkpoint_replays_batch(self, tmp_path: Path) -> None:
+        """Test at-least-once delivery when the process dies after the COPY"""
+        spool = DiskSpool(str(tmp_path))
+        spool.append(rows("a", "b"))
+        batch, _ = spool.read(10)  # sent to the database, then the process died
+        spool.close()
+
+        sink = MagicMock()
+        SpoolReplayer(DiskSpool(str(tmp_path)), sink).replay_once()
+
+        sink.assert_called_once_with(batch)
@@ -0,0 +1,91 @@
+"""
+Tests for static_assets.py and build_assets.py
+"""
+import pytest
+from pathlib import Path
+import gzip
+import json
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_assets
+import static_assets
+from static_assets import StaticAssets, VendorAsset, integrity_of
+
+
+@pytest.fixture
+def vendored(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> tuple[str, str]:
+    """Local copies of the vendor files, pinned to their own hashes"""
+    source = tmp_path / "src"
+    source.mkdir()
+    assets = {}
+    for name in static_assets.VENDOR_ASSETS:
+        body = (f"/* {name} */\n" + ".btn{color:red}\n" * 200).encode()
+        (source / name).write_bytes(body)
+        assets[name] = VendorAsset(f"https://cdn.example/{name}", integrity_of(body))
+    monkeypatch.setattr(static_assets, 'VENDOR_ASSETS', assets)
+    monkeypatch.setattr(build_assets, 'VENDOR_ASSETS', assets)
+    return str(source), str(tmp_path / "static")
+
+
+class TestBuildAssets:
+    """Test suite for building fingerprinted, precompressed files"""
+
+    def test_build_writes_fingerprinted_files(self, vendored: tuple[str, str]) -> None:
+        """Test that every asset gets a hashed name, a gzip copy and a manifest entry"""
+        source, out = vendored
+        os.makedirs(out)
+        open(os.path.join(out, "bootstrap.min.000000000000.css"), "w").close()
+
+        manifest = build_assets.build(out, source)
+
+        path = manifest["bootstrap.min.css"]["path"]
+        assert path.startswith("bootstrap.min.") and path.endswith(".css") and len(path) == 30
+        with open(os.path.join(out, path + ".gz"), "rb") as f:
+            with open(os.path.join(source, "bootstrap.min.css"), "rb") as original:
+                assert gzip.decompress(f.read()) == original.read()
+        with open(os.path.join(out, "manifest.json")) as f:
+            assert json.load(f) == manifest
+        assert "bootstrap.min.000000000000.css" not in os.listdir(out)
+
+    def test_integrity_mismatch_fails(self, vendored: tuple[str, str]) -> None:
+        """Test that a file that does not match its pinned hash is refused"""
+        source, out = vendored
+        with open(os.path.join(source, "bootstrap.min.css"), "ab") as f:
+            f.write(b"/* tampered */")
+
+        assert build_assets.main(["--out", out, "--source-dir", source]) == 1
+        assert not os.path.exists(os.path.join(out, "manifest.json"))
+
+
+class TestStaticAssets:
+    """Test suite for serving the built files"""
+
+    def test_links_and_negotiation(self, vendored: tuple[str, str]) -> None:
+        """Test that built files are linked locally and served precompressed"""
+        source, out = vendored
+        manifest = build_assets.build(out, source)
+        assets = StaticAssets(out)
+        path = manifest["bootstrap.min.css"]["path"]
+
+        assert assets.stylesheet("bootstrap.min.css") == (
+            f'<link href="/static/{path}" rel="stylesheet">'
+        )
+        asset = assets.get(path)
+        assert asset is not None
+        assert asset.content_type == "text/css; charset=UTF-8"
+        assert asset.negotiate("gzip, deflate")[0] == "gzip"
+        assert asset.negotiate("")[0] == "identity"
+        assert assets.get("../manifest.json") is None
+
+    def test_cdn_fallback_without_manifest(self, vendored: tuple[str, str], tmp_path: Path) -> None:
+        """Test that a checkout without a build links the CDN with integrity"""
+        assets = StaticAssets(str(tmp_path / "missing"))
+
+        tag = assets.script("bootstrap.bundle.min.js")
+
+        assert 'src="https://cdn.example/bootstrap.bundle.min.js"' in tag
+        assert 'integrity="sha384-' in tag and 'crossorigin="anonymous"' in tag
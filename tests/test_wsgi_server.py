@@ -0,0 +1,153 @@
+"""
+Tests for wsgi_server.py
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from typing import Any
+import http.client
+import signal
+import socket
+import subprocess
+import threading
+import sys
+import os
+
+# Add the project root to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bottle
+import wsgi_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A one-route app served through wsgi_server.serve in a child process.
+SLOW_APP = """
+import sys, time, bottle, wsgi_server
+app = bottle.Bottle()
+
+@app.route('/slow')
+def slow():
+    print('request started', flush=True)
+    time.sleep(1)
+    return 'done'
+
+config = dict(
+    mode='production', host='127.0.0.1', port=int(sys.argv[1]), workers=2,
+    threads=2, keepalive=2, backlog=64, timeout=30, graceful_timeout=10,
+    access_log=False, debug=False,
+)
+wsgi_server.serve(app, config, lambda: print('worker ready', flush=True))
+"""
+
+
+def make_config(**overrides: Any) -> dict[str, Any]:
+    """Server config as returned by create_envs"""
+    config = {
+        'mode': 'production', 'host': '0.0.0.0', 'port': 8080, 'workers': 3,
+        'threads': 8, 'keepalive': 5, 'backlog': 512, 'timeout': 30,
+        'graceful_timeout': 25, 'access_log': False, 'debug': False,
+    }
+    config.update(overrides)
+    return config
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+class TestWsgiServer:
+    """Test suite for the production server wrapper"""
+
+    def test_gunicorn_options(self) -> None:
+        """Test that env config maps onto gunicorn settings"""
+        options = wsgi_server.gunicorn_options(make_config(access_log=True))
+
+        assert options['bind'] == '0.0.0.0:8080'
+        assert options['worker_class'] == 'gthread'
+        assert (options['workers'], options['threads']) == (3, 8)
+        assert options['backlog'] == 512
+        assert options['accesslog'] == '-'
+
+    def test_gunicorn_hooks(self) -> None:
+        """Test that worker hooks are adapted to gunicorn's server hook arguments"""
+        on_start, on_ready = MagicMock(), MagicMock()
+
+        hooks = wsgi_server.gunicorn_hooks(on_start, None, on_ready)
+        hooks['post_fork'](MagicMock(), MagicMock())
+        hooks['post_worker_init'](MagicMock())
+
+        assert sorted(hooks) == ['post_fork', 'post_worker_init']
+        on_start.assert_called_once_with()
+        on_ready.assert_called_once_with()
+
+    def test_unknown_mode_rejected(self) -> None:
+        """Test that a typo in SERVER_MODE fails loudly"""
+        with pytest.raises(ValueError, match="Unknown server mode"):
+            wsgi_server.serve(bottle.Bottle(), make_config(mode='prod'))
+
+    @patch('wsgi_server.signal.signal')
+    @patch('wsgi_server.bottle.run')
+    def test_dev_mode_uses_reference_server(self, mock_run: MagicMock, mock_signal: MagicMock) -> None:
+        """Test that dev mode runs Bottle's server with the configured debug flag"""
+        app = bottle.Bottle()
+        on_start = MagicMock()
+
+        wsgi_server.serve(app, make_config(mode='dev'), on_start)
+
+        on_start.assert_called_once()
+        mock_run.assert_called_once_with(app, host='0.0.0.0', port=8080, debug=False)
+        assert mock_signal.call_args[0][0] == signal.SIGTERM
+
+    @patch('wsgi_server.signal.signal')
+    @patch('wsgi_server.bottle.run')
+    def test_worker_ready_hook_runs_after_start(self, mock_run: MagicMock, mock_signal: MagicMock) -> None:
+        """Test that the ready hook runs after the start hook, before serving"""
+        calls = []
+
+        wsgi_server.serve(
+            bottle.Bottle(),
+            make_config(mode='dev'),
+            lambda: calls.append('start'),
+            None,
+            lambda: calls.append('ready'),
+        )
+
+        assert calls == ['start', 'ready']
+        mock_run.assert_called_once()
+
+    def test_sigterm_drains_in_flight_requests(self) -> None:
+        """Test that SIGTERM lets a running request finish before exiting"""
+        pytest.importorskip('gunicorn')
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, '-c', SLOW_APP, str(port)],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        assert proc.stdout is not None
+        stdout = proc.stdout
+        try:
+            for _ in range(2):
+                assert stdout.readline().strip() == 'worker ready'
+            result: dict[str, Any] = {}
+
+            def request() -> None:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                conn.request('GET', '/slow')
+                response = conn.getresponse()
+                result['status'], result['body'] = response.status, response.read()
+
+            client = threading.Thread(target=request)
+            client.start()
+            assert stdout.readline().strip() == 'request started'
+            proc.send_signal(signal.SIGTERM)
+            client.join(10)
+
+            assert result == {'status': 200, 'body': b'done'}
+            assert proc.wait(10) == 0
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            stdout.close()
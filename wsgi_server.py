@@ -0,0 +1,85 @@
+import signal
+import sys
+from typing import Any, Callable, Optional
+
+import bottle
+
+SERVER_MODES = ("production", "dev")
+
+
+def gunicorn_options(config: dict[str, Any]) -> dict[str, Any]:
+    # gthread workers: each process serves ``threads`` requests concurrently
+    # and holds idle keep-alive connections without tying up a thread.
+    return {
+        "bind": f"{config['host']}:{config['port']}",
+        "workers": config["workers"],
+        "worker_class": "gthread",
+        "threads": config["threads"],
+        "keepalive": config["keepalive"],
+        "backlog": config["backlog"],
+        "timeout": config["timeout"],
+        "graceful_timeout": config["graceful_timeout"],
+        "accesslog": "-" if config["access_log"] else None,
+    }
+
+
+def gunicorn_hooks(
+    on_worker_start: Optional[Callable[[], object]] = None,
+    on_worker_exit: Optional[Callable[[], object]] = None,
+    on_worker_ready: Optional[Callable[[], object]] = None,
+) -> dict[str, Callable[..., object]]:
+    # gunicorn server hooks take (server, worker) or (worker); ours take nothing.
+    hooks: dict[str, Callable[..., object]] = {}
+    if on_worker_start is not None:
+        hooks["post_fork"] = lambda server, worker: on_worker_start()
+    if on_worker_ready is not None:
+        hooks["post_worker_init"] = lambda worker: on_worker_ready()
+    if on_worker_exit is not None:
+        hooks["worker_exit"] = lambda server, worker: on_worker_exit()
+    return hooks
+
+
+def serve(
+    app: bottle.Bottle,
+    config: dict[str, Any],
+    on_worker_start: Optional[Callable[[], object]] = None,
+    on_worker_exit: Optional[Callable[[], object]] = None,
+    on_worker_ready: Optional[Callable[[], object]] = None,
+) -> None:
+    """Serve ``app`` with gunicorn, or Bottle's reference server in dev mode.
+
+    The hooks run inside every worker process after the fork, which is where
+    per-process resources (the connection pool, the NOTIFY listener) must be
+    created. ``on_worker_ready`` runs once the worker has installed its own
+    signal handlers, so it can add handlers of its own. On SIGTERM gunicorn
+    stops accepting connections and gives in-flight requests
+    ``graceful_timeout`` seconds to finish.
+    """
+    if config["mode"] not in SERVER_MODES:
+        raise ValueError(
+            f"Unknown server mode {config['mode']!r}, expected one of {SERVER_MODES}"
+        )
+    if config["mode"] == "dev":
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if on_worker_start is not None:
+            on_worker_start()
+        if on_worker_ready is not None:
+            on_worker_ready()
+        bottle.run(app, host=config["host"], port=config["port"], debug=config["debug"])
+        return
+
+    bottle.debug(False)
+    from gunicorn.app.base import BaseApplication
+
+    options = gunicorn_options(config)
+    options.update(gunicorn_hooks(on_worker_start, on_worker_exit, on_worker_ready))
+
+    class Application(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self) -> bottle.Bottle:
+            return app
+
+    Application().run()